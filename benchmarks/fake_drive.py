@@ -0,0 +1,583 @@
+#!/usr/bin/env python3
+"""A local stand-in for the Drive v3 API, for benchmarks and offline testing.
+
+Implements the endpoints used by the API class: files list, get, create, update,
+copy, generateIds and emptyTrash, simple and resumable media uploads, get_media
+and export downloads with ranges, permissions list, the batch endpoint and the
+changes feed. Responses only have the fields asked for. Files live in memory.
+Latency, bandwidth and errors can be injected to see how the client behaves on a
+slow or unreliable connection.
+
+    python benchmarks/fake_drive.py --port 8080 --latency 20 --bandwidth 50 --error-rate 0.01
+
+fakeService(url) builds a Drive service resource which talks to the server
+instead of Google, without any credentials.
+"""
+
+from argparse import ArgumentParser
+from email.parser import BytesParser
+from email.utils import formatdate
+from hashlib import md5
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+GOOGLE_APPS_PREFIX = 'application/vnd.google-apps.'
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK = 64 * 1024  # Bytes written at a time when the bandwidth is limited
+
+STATUS_TEXT = {200: 'OK', 204: 'No Content', 206: 'Partial Content', 308: 'Resume Incomplete',
+               400: 'Bad Request', 404: 'Not Found', 409: 'Conflict', 416: 'Requested Range Not Satisfiable',
+               429: 'Too Many Requests', 503: 'Service Unavailable'}
+
+
+class DriveError(Exception):
+    def __init__(self, status, reason, message):
+        self.status = status
+        self.reason = reason
+        self.message = message
+
+    def body(self) -> bytes:
+        return json.dumps({'error': {'code': self.status, 'message': self.message,
+                                     'errors': [{'reason': self.reason, 'message': self.message}]}}).encode()
+
+
+def now() -> str:
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime()) + '.000Z'
+
+
+def splitClauses(query, separator=' and '):
+    """Split a query on AND, or another separator, ignoring any inside quoted values or parentheses."""
+    clauses, current, quote, depth, i = [], '', None, 0, 0
+    while i < len(query):
+        char = query[i]
+        if quote:
+            current += char
+            if char == '\\':
+                current += query[i + 1]
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in '\'"':
+            quote = char
+            current += char
+        elif char in '()':
+            depth += 1 if char == '(' else -1
+            current += char
+        elif depth == 0 and query[i:i + len(separator)].lower() == separator:
+            clauses.append(current.strip())
+            current = ''
+            i += len(separator) - 1
+        else:
+            current += char
+        i += 1
+    clauses.append(current.strip())
+    return [clause for clause in clauses if clause]
+
+
+def unquoteValue(value) -> str:
+    return re.sub(r'\\(.)', r'\1', value[1:-1])
+
+
+QUOTED = r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")"""
+
+
+def parseQuery(query):
+    """Turn a Drive query into a predicate over file metadata, supporting the clauses the CLI uses."""
+    tests = []
+    for clause in splitClauses(query or ''):
+        if clause.startswith('(') and clause.endswith(')'):
+            alternatives = [parseQuery(alternative) for alternative in splitClauses(clause[1:-1], ' or ')]
+            tests.append(lambda file, alternatives=alternatives: any(test(file) for test in alternatives))
+        elif match := re.fullmatch(r'trashed\s*(=|!=)\s*(true|false)', clause, re.I):
+            value = match[2].lower() == 'true'
+            tests.append(lambda file, value=value, op=match[1]: (file['trashed'] == value) == (op == '='))
+        elif match := re.fullmatch(rf'mimeType\s*(=|!=)\s*{QUOTED}', clause):
+            value = unquoteValue(match[2])
+            tests.append(lambda file, value=value, op=match[1]: (file['mimeType'] == value) == (op == '='))
+        elif match := re.fullmatch(rf'{QUOTED}\s+in\s+parents', clause):
+            value = unquoteValue(match[1])
+            tests.append(lambda file, value=value: value in file['parents'])
+        elif match := re.fullmatch(rf'name\s*(=|contains)\s*{QUOTED}', clause):
+            value = unquoteValue(match[2])
+            if match[1] == '=':
+                tests.append(lambda file, value=value: file['name'] == value)
+            else:
+                tests.append(lambda file, value=value: value.lower() in file['name'].lower())
+        else:
+            raise DriveError(400, 'invalid', f"Invalid Value: {clause}")
+    return lambda file: all(test(file) for test in tests)
+
+
+class FakeDrive:
+    """The files, contents, upload sessions and change log of the fake drive, kept in memory."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.files = {'root': {'id': 'root', 'name': 'My Drive', 'mimeType': FOLDER_MIME_TYPE, 'parents': [],
+                               'trashed': False, 'modifiedTime': now()}}
+        self.contents = {}
+        self.permissions = {}
+        self.uploads = {}
+        self.changes = []  # (file ID, removed), the page token is the index
+        self.ids = itertools.count(1)
+
+    def newId(self) -> str:
+        return f"fake{next(self.ids):012d}"
+
+    def add(self, name, parents=('root',), mime_type='application/octet-stream', content=None, file_id=None):
+        """Add a file directly, eg. to seed the drive for a benchmark.
+
+        Returns:
+            The metadata of the new file.
+        """
+        with self.lock:
+            file = {'id': file_id or self.newId(), 'name': name, 'mimeType': mime_type, 'parents': [*parents],
+                    'trashed': False, 'modifiedTime': now()}
+            self.files[file['id']] = file
+            if content is not None:
+                self.setContent(file, content)
+            self.changed(file['id'])
+            return file
+
+    def setContent(self, file, content):
+        self.contents[file['id']] = bytes(content)
+        file['size'] = str(len(content))
+        file['md5Checksum'] = md5(content).hexdigest()
+
+    def changed(self, file_id, removed=False):
+        self.changes.append((file_id, removed))
+        self.files.get(file_id, {})['modifiedTime'] = now()
+
+    def get(self, file_id):
+        file = self.files.get(file_id)
+        if file is None:
+            raise DriveError(404, 'notFound', f"File not found: {file_id}.")
+        return file
+
+    def applyMetadata(self, file, metadata, add_parents=None, remove_parents=None):
+        for key, value in metadata.items():
+            if key == 'trashed':
+                file['trashed'] = value in (True, 'true')
+            elif key == 'parents':
+                for parent in value:
+                    self.get(parent)
+                file['parents'] = [*value]
+            elif key not in ('id', 'size', 'md5Checksum', 'modifiedTime'):
+                file[key] = value
+        if remove_parents:
+            file['parents'] = [p for p in file['parents'] if p not in remove_parents.split(',')]
+        if add_parents:
+            for parent in add_parents.split(','):
+                self.get(parent)
+                if parent not in file['parents']:
+                    file['parents'].append(parent)
+
+    def create(self, metadata, content=None):
+        with self.lock:
+            file_id = metadata.get('id') or self.newId()
+            if file_id in self.files:
+                raise DriveError(409, 'duplicate', f"A file already exists with the provided ID: {file_id}.")
+            file = {'id': file_id, 'name': metadata.get('name', 'Untitled'),
+                    'mimeType': metadata.get('mimeType', 'application/octet-stream'),
+                    'parents': ['root'], 'trashed': False}
+            self.applyMetadata(file, metadata)
+            self.files[file_id] = file
+            if content is not None:
+                self.setContent(file, content)
+            self.changed(file_id)
+            return file
+
+    def update(self, file_id, metadata, content=None, add_parents=None, remove_parents=None):
+        with self.lock:
+            file = self.get(file_id)
+            self.applyMetadata(file, metadata, add_parents, remove_parents)
+            if content is not None:
+                self.setContent(file, content)
+            self.changed(file_id)
+            return file
+
+    def copy(self, file_id, metadata):
+        with self.lock:
+            source = self.get(file_id)
+            if source['mimeType'] == FOLDER_MIME_TYPE:
+                raise DriveError(403, 'fileNotCopyable', "Folders cannot be copied.")
+            copy = self.create({'name': source['name'], 'mimeType': source['mimeType'],
+                                'parents': source['parents'], **metadata}, self.contents.get(file_id))
+            return copy
+
+    def list(self, query, page_size, page_token):
+        matches = parseQuery(query)
+        start = int(page_token or 0)
+        with self.lock:
+            found = [file for file in self.files.values() if file['id'] != 'root' and matches(file)]
+        page = found[start:start + page_size]
+        result = {'files': page}
+        if start + page_size < len(found):
+            result['nextPageToken'] = str(start + page_size)
+        return result
+
+    def emptyTrash(self):
+        with self.lock:
+            for file_id in [file_id for file_id, file in self.files.items() if file['trashed']]:
+                del self.files[file_id]
+                self.contents.pop(file_id, None)
+                self.changes.append((file_id, True))
+
+    def listChanges(self, page_token, page_size):
+        start = int(page_token)
+        with self.lock:
+            page = self.changes[start:start + page_size]
+            changes = []
+            for file_id, removed in page:
+                file = self.files.get(file_id)
+                change = {'fileId': file_id, 'removed': removed or file is None, 'time': now()}
+                if file is not None and not removed:
+                    change['file'] = dict(file)
+                changes.append(change)
+            result = {'changes': changes}
+            if start + page_size < len(self.changes):
+                result['nextPageToken'] = str(start + page_size)
+            else:
+                result['newStartPageToken'] = str(len(self.changes))
+            return result
+
+
+class FakeDriveServer(ThreadingHTTPServer):
+    """Serves a FakeDrive over HTTP on a background thread.
+
+    Args:
+        port: The port to listen on, or 0 for any free port.
+        latency: Milliseconds added before every response.
+        bandwidth: Megabytes per second that media is sent and received at, or None for no limit.
+        error_rate: The fraction of requests failed with a 503 or 429 before they are handled.
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, port=0, latency=0, bandwidth=None, error_rate=0, drive=None):
+        super().__init__(('127.0.0.1', port), Handler)
+        self.drive = drive or FakeDrive()
+        self.latency = latency / 1000
+        self.bandwidth = bandwidth * 1024 * 1024 if bandwidth else None
+        self.error_rate = error_rate
+        self.requests = 0
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # The headers and body are written separately, so Nagle's algorithm would hold back the end of small responses
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.respond()
+
+    do_POST = do_PUT = do_PATCH = do_DELETE = do_GET
+
+    def respond(self):
+        server = self.server
+        body = self.receive(int(self.headers.get('Content-Length') or 0))
+        server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+        if server.error_rate and random.random() < server.error_rate:
+            error = random.choice([DriveError(503, 'backendError', "Backend Error"),
+                                   DriveError(429, 'rateLimitExceeded', "Rate Limit Exceeded")])
+            status, headers, content = error.status, {'Content-Type': 'application/json', 'Retry-After': '0'}, error.body()
+        else:
+            status, headers, content = route(server, self.command, self.path, self.headers, body)
+        self.send_response(status, STATUS_TEXT.get(status))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('Date', formatdate(usegmt=True))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.send(content)
+
+    def receive(self, length) -> bytes:
+        bandwidth = self.server.bandwidth
+        if not bandwidth or length <= STREAM_CHUNK:
+            return self.rfile.read(length) if length else b''
+        started = time.monotonic()
+        chunks = []
+        for offset in range(0, length, STREAM_CHUNK):
+            chunks.append(self.rfile.read(min(STREAM_CHUNK, length - offset)))
+            ahead = (offset + STREAM_CHUNK) / bandwidth - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+        return b''.join(chunks)
+
+    def send(self, content):
+        bandwidth = self.server.bandwidth
+        if not bandwidth or len(content) <= STREAM_CHUNK:
+            self.wfile.write(content)
+            return
+        started = time.monotonic()
+        for offset in range(0, len(content), STREAM_CHUNK):
+            self.wfile.write(content[offset:offset + STREAM_CHUNK])
+            ahead = (offset + STREAM_CHUNK) / bandwidth - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+def parseFields(fields) -> dict:
+    """Parse a field mask, eg. "files(id, owners(emailAddress))", into a dict of each field to the mask of its fields, or None for all."""
+    mask = {}
+    stack = [mask]
+    name = ''
+    for char in fields + ',':
+        if char == '(':
+            stack[-1][name.strip()] = nested = {}
+            stack.append(nested)
+            name = ''
+        elif char in ',)':
+            if name.strip():
+                stack[-1].setdefault(name.strip(), None)
+            name = ''
+            if char == ')':
+                stack.pop()
+        else:
+            name += char
+    return mask
+
+
+def selectFields(data, mask):
+    """Keep only the fields of a response in a parsed field mask, like Drive does."""
+    if mask is None or '*' in mask:
+        return data
+    if isinstance(data, list):
+        return [selectFields(item, mask) for item in data]
+    if not isinstance(data, dict):
+        return data
+    return {key: selectFields(data[key], nested) for key, nested in mask.items() if key in data}
+
+
+def jsonResponse(data, status=200, fields=None):
+    """Encode a JSON response, leaving out anything not in the field mask if one was given."""
+    if fields:
+        data = selectFields(data, parseFields(fields))
+    return status, {'Content-Type': 'application/json; charset=UTF-8'}, json.dumps(data).encode()
+
+
+def route(server, method, target, headers, body):
+    """Handle one request, returning (status, headers, body). Also used for each part of a batch."""
+    try:
+        url = urlsplit(target)
+        path = unquote(url.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if path.startswith('/resumable/upload/'):
+            path = path[len('/resumable'):]
+        if path.startswith('/upload/drive/v3/files'):
+            return upload(server, method, path[len('/upload/drive/v3/files'):].strip('/'), query, headers, body)
+        if path == '/batch/drive/v3':
+            return batch(server, headers, body)
+        if path.startswith('/drive/v3/'):
+            return drive(server.drive, method, path[len('/drive/v3/'):].strip('/').split('/'), query, headers, body)
+        raise DriveError(404, 'notFound', f"Not found: {path}")
+    except DriveError as error:
+        return error.status, {'Content-Type': 'application/json'}, error.body()
+
+
+def drive(store, method, parts, query, headers, body):
+    metadata = json.loads(body) if body else {}
+    if parts == ['files'] and method == 'GET':
+        page_size = min(int(query.get('pageSize', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        return jsonResponse(store.list(query.get('q'), page_size, query.get('pageToken')), fields=query.get('fields'))
+    if parts == ['files'] and method == 'POST':
+        return jsonResponse(store.create(metadata), fields=query.get('fields'))
+    if parts == ['files', 'trash'] and method == 'DELETE':
+        store.emptyTrash()
+        return 204, {}, b''
+    if parts == ['files', 'generateIds']:
+        with store.lock:
+            return jsonResponse({'kind': 'drive#generatedIds', 'space': 'drive',
+                                 'ids': [store.newId() for _ in range(int(query.get('count', 10)))]}, fields=query.get('fields'))
+    if parts[0] == 'files' and len(parts) == 2 and method == 'GET':
+        file = store.get(parts[1])
+        if query.get('alt') == 'media':
+            if file['mimeType'].startswith(GOOGLE_APPS_PREFIX):
+                raise DriveError(403, 'fileNotDownloadable', "Only files with binary content can be downloaded.")
+            return media(store.contents.get(file['id'], b''), headers, file['mimeType'])
+        return jsonResponse(file, fields=query.get('fields'))
+    if parts[0] == 'files' and len(parts) == 2 and method == 'PATCH':
+        return jsonResponse(store.update(parts[1], metadata, add_parents=query.get('addParents'),
+                                         remove_parents=query.get('removeParents')), fields=query.get('fields'))
+    if parts[0] == 'files' and len(parts) == 3 and parts[2] == 'copy':
+        return jsonResponse(store.copy(parts[1], metadata), fields=query.get('fields'))
+    if parts[0] == 'files' and len(parts) == 3 and parts[2] == 'export':
+        file = store.get(parts[1])
+        if not file['mimeType'].startswith(GOOGLE_APPS_PREFIX):
+            raise DriveError(403, 'fileNotExportable', "Export only supports Docs Editors files.")
+        content = store.contents.get(file['id']) or f"{file['name']} exported as {query.get('mimeType')}\n".encode()
+        # Exports don't support ranges
+        return 200, {'Content-Type': query.get('mimeType', 'application/pdf')}, content
+    if parts[0] == 'files' and len(parts) == 3 and parts[2] == 'permissions':
+        store.get(parts[1])
+        return jsonResponse({'kind': 'drive#permissionList', 'permissions': store.permissions.get(
+            parts[1], [{'kind': 'drive#permission', 'id': 'owner', 'type': 'user', 'role': 'owner',
+                        'emailAddress': 'owner@example.com'}])}, fields=query.get('fields'))
+    if parts == ['changes', 'startPageToken']:
+        return jsonResponse({'startPageToken': str(len(store.changes))}, fields=query.get('fields'))
+    if parts == ['changes']:
+        page_size = min(int(query.get('pageSize', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        return jsonResponse(store.listChanges(query['pageToken'], page_size), fields=query.get('fields'))
+    raise DriveError(404, 'notFound', f"Unsupported request: {method} /drive/v3/{'/'.join(parts)}")
+
+
+def media(content, headers, mime_type):
+    """Send file content, honouring a Range header like Drive does."""
+    match = re.fullmatch(r'bytes=(\d+)-(\d*)', headers.get('Range') or headers.get('range') or '')
+    if not match:
+        return 200, {'Content-Type': mime_type}, content
+    start = int(match[1])
+    end = min(int(match[2]) if match[2] else len(content) - 1, len(content) - 1)
+    if start >= len(content):
+        raise DriveError(416, 'requestedRangeNotSatisfiable', "Request range not satisfiable")
+    return 206, {'Content-Type': mime_type, 'Content-Range': f"bytes {start}-{end}/{len(content)}"}, content[start:end + 1]
+
+
+def upload(server, method, file_id, query, headers, body):
+    store = server.drive
+    upload_type = query.get('uploadType')
+    if upload_type == 'media':
+        file = store.update(file_id, {}, body) if file_id else store.create({}, body)
+        return jsonResponse(file, fields=query.get('fields'))
+    if upload_type == 'multipart':
+        metadata, content = splitMultipart(headers, body)
+        file = store.update(file_id, metadata, content) if file_id else store.create(metadata, content)
+        return jsonResponse(file, fields=query.get('fields'))
+    if upload_type != 'resumable':
+        raise DriveError(400, 'invalid', f"Invalid uploadType: {upload_type}")
+    if 'upload_id' not in query:
+        # Start a session
+        if file_id:
+            store.get(file_id)
+        upload_id = uuid.uuid4().hex
+        with store.lock:
+            store.uploads[upload_id] = {'file_id': file_id, 'metadata': json.loads(body) if body else {},
+                                        'data': bytearray()}
+        location = f"{server.url}upload/drive/v3/files{'/' + file_id if file_id else ''}?uploadType=resumable&upload_id={upload_id}"
+        return 200, {'Location': location}, b''
+    session = store.uploads.get(query['upload_id'])
+    if session is None:
+        raise DriveError(404, 'notFound', "Upload session not found or expired.")
+    data = session['data']
+    content_range = headers.get('Content-Range') or ''
+    match = re.fullmatch(r'bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)', content_range)
+    if content_range and not match:
+        raise DriveError(400, 'badContent', f"Invalid Content-Range: {content_range}")
+    total = int(match[3]) if match and match[3] != '*' else None
+    if match and match[1] is not None:
+        start = int(match[1])
+        if start > len(data):
+            raise DriveError(400, 'badContent', "Chunk starts after the bytes received so far.")
+        # Chunks may be resent after an interruption, so overwrite from where they start
+        del data[start:]
+        data.extend(body)
+    if total is not None and len(data) >= total or not content_range:
+        with store.lock:
+            del store.uploads[query['upload_id']]
+        if session['file_id']:
+            file = store.update(session['file_id'], session['metadata'], bytes(data))
+        else:
+            file = store.create(session['metadata'], bytes(data))
+        return jsonResponse(file, fields=query.get('fields'))
+    return 308, {'Range': f"bytes=0-{len(data) - 1}"} if data else {}, b''
+
+
+def splitMultipart(headers, body):
+    """Split a multipart/related upload into its metadata and content."""
+    message = BytesParser().parsebytes(b'Content-Type: ' + headers['Content-Type'].encode() + b'\r\n\r\n' + body)
+    metadata, content = message.get_payload()
+    return json.loads(metadata.get_payload(decode=True) or b'{}'), content.get_payload(decode=True)
+
+
+def batch(server, headers, body):
+    """Handle each request of a multipart/mixed batch, returning the responses in one multipart body."""
+    message = BytesParser().parsebytes(b'Content-Type: ' + headers['Content-Type'].encode() + b'\r\n\r\n' + body)
+    boundary = uuid.uuid4().hex
+    out = []
+    for part in message.get_payload():
+        request = part.get_payload(decode=True) if part.get('Content-Transfer-Encoding') != 'binary' else part.get_payload().encode()
+        head, _, request_body = request.replace(b'\r\n', b'\n').partition(b'\n\n')
+        request_line, *header_lines = head.decode().split('\n')
+        method, target, _ = request_line.split(' ', 2)
+        request_headers = dict(line.split(': ', 1) for line in header_lines if ': ' in line)
+        status, response_headers, content = route(server, method, target, request_headers, request_body)
+        lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}"]
+        lines += [f"{key}: {value}" for key, value in response_headers.items()]
+        lines.append(f"Content-Length: {len(content)}")
+        content_id = part['Content-ID'].strip('<>')
+        out.append(f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n".encode()
+                   + '\r\n'.join(lines).encode() + b'\r\n\r\n' + content + b'\r\n')
+    out.append(f"--{boundary}--\r\n".encode())
+    return 200, {'Content-Type': f"multipart/mixed; boundary={boundary}"}, b''.join(out)
+
+
+def fakeService(url):
+    """Build a Drive service resource which sends its requests to a fake drive instead of Google.
+
+    The discovery document bundled with googleapiclient is used, so no network access or credentials are needed.
+    """
+    import os
+    import googleapiclient
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.http import build_http
+    path = os.path.join(os.path.dirname(googleapiclient.__file__), 'discovery_cache', 'documents', 'drive.v3.json')
+    with open(path) as f:
+        document = json.load(f)
+    document['rootUrl'] = url
+    document['baseUrl'] = url + document['servicePath']
+    # build_http stops httplib2 treating the 308 of a resumable upload as a redirect
+    return build_from_document(document, http=build_http())
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", help="Port to listen on", type=int, default=8080)
+    parser.add_argument("--latency", help="Milliseconds added to every response", type=float, default=0)
+    parser.add_argument("--bandwidth", help="Megabytes per second to send media at", type=float)
+    parser.add_argument("--error-rate", help="Fraction of requests failed with a 503 or 429", type=float, default=0)
+    args = parser.parse_args()
+    server = FakeDriveServer(args.port, args.latency, args.bandwidth, args.error_rate)
+    print(f"Fake Drive listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
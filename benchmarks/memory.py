@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Memory benchmark of a large listing held as a list of dicts and as a FileTable.
+
+Pages of synthetic files, with IDs, names, MIME types, parents and sizes like those
+Drive returns, are decoded from JSON one at a time as the client would receive them,
+and kept either as the list of dicts listAllFiles returns or in a FileTable. The
+memory allocated for each, measured with tracemalloc, is printed with the time taken
+to fill it and to find the children of every folder.
+
+    python benchmarks/memory.py --files 1000000
+"""
+
+from argparse import ArgumentParser
+from os.path import abspath, dirname, join
+import gc
+import json
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, join(ROOT, 'src'))
+
+from api import PAGE_SIZE
+from records import FileTable
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+MIME_TYPES = ['application/pdf', 'image/png', 'image/jpeg', 'text/plain', 'application/vnd.google-apps.document',
+              'application/vnd.google-apps.spreadsheet', 'application/zip']
+FILES_PER_FOLDER = 50
+
+
+def randomId(rng) -> str:
+    return '1' + ''.join(rng.choices(string.ascii_letters + string.digits + '-_', k=32))
+
+
+def makePages(files, seed=0):
+    """Yield the JSON text of each page of a listing of a drive with files spread over folders."""
+    rng = random.Random(seed)
+    folders = ['root']
+    for start in range(0, files, PAGE_SIZE):
+        page = []
+        for i in range(start, min(start + PAGE_SIZE, files)):
+            file_id = randomId(rng)
+            if i % FILES_PER_FOLDER == 0:
+                page.append({'id': file_id, 'name': f"Folder {i // FILES_PER_FOLDER}", 'mimeType': FOLDER_MIME_TYPE,
+                             'parents': [rng.choice(folders)]})
+                folders.append(file_id)
+            else:
+                page.append({'id': file_id, 'name': f"document_{i}_{rng.randrange(10 ** 6)}.pdf",
+                             'mimeType': rng.choice(MIME_TYPES), 'parents': [rng.choice(folders[-20:])],
+                             'size': str(rng.randrange(10 ** 8))})
+        yield json.dumps({'files': page})
+
+
+def fillDicts(pages):
+    files = []
+    for page in pages:
+        files.extend(json.loads(page)['files'])
+    return files
+
+
+def fillTable(pages):
+    table = FileTable()
+    for page in pages:
+        table.extend(json.loads(page)['files'])
+    return table
+
+
+def childrenOfDicts(files):
+    """Group the files of each folder, as code working with the list of dicts has to."""
+    children = {}
+    for file in files:
+        for parent in file.get('parents', []):
+            children.setdefault(parent, []).append(file)
+    folders = [file['id'] for file in files if file['mimeType'] == FOLDER_MIME_TYPE]
+    return sum(len(children.get(folder_id, [])) for folder_id in folders)
+
+
+def childrenOfTable(table):
+    folders = [table.ids[row] for row in range(len(table)) if table.isFolder(row)]
+    return sum(len(table.childRows(folder_id)) for folder_id in folders)
+
+
+def measure(fill, children, pages) -> dict:
+    """Fill a store from the pages, recording the memory it holds and the peak while filling it."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    store = fill(pages)
+    filled = time.perf_counter() - start
+    size, peak = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    found = children(store)
+    indexed = time.perf_counter() - start
+    tracemalloc.stop()
+    return {'size': size, 'peak': peak, 'filled': filled, 'indexed': indexed, 'found': found}
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", help="Number of files in the listing", type=int, default=200000)
+    args = parser.parse_args()
+
+    pages = [*makePages(args.files)]
+    results = {'list of dicts': measure(fillDicts, childrenOfDicts, pages),
+               'FileTable': measure(fillTable, childrenOfTable, pages)}
+    for name, result in results.items():
+        print(f"{name:<14} {result['size'] / 2 ** 20:8.1f} MB held, {result['size'] / args.files:6.0f} bytes/file, "
+              f"peak {result['peak'] / 2 ** 20:8.1f} MB, filled in {result['filled']:.2f}s, "
+              f"children of every folder in {result['indexed']:.2f}s")
+    assert results['list of dicts']['found'] == results['FileTable']['found']
+    print(f"FileTable holds {results['FileTable']['size'] / results['list of dicts']['size']:.0%} of the memory of the list of dicts")
+
+
+if __name__ == "__main__":
+    main()
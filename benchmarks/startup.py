@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""Cold-start benchmark for cli.py.
+
+Runs the CLI in a fresh interpreter several times and reports how long it takes
+to start, parse arguments and exit. No credentials or network access are needed
+since `--help` never builds the Drive service.
+
+    python benchmarks/startup.py --runs 20 --max-ms 150
+"""
+
+from argparse import ArgumentParser
+import statistics
+import subprocess
+import sys
+import time
+from os.path import abspath, dirname, join
+
+CLI = join(dirname(dirname(abspath(__file__))), 'src', 'cli.py')
+
+
+def measure(argv, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, CLI, *argv], stdout=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", help="Number of runs", type=int, default=10)
+    parser.add_argument("--max-ms", help="Fail if the median start time exceeds this", type=float)
+    parser.add_argument("argv", help="Arguments passed to cli.py (default --help)", nargs="*")
+    args = parser.parse_args()
+
+    timings = measure(args.argv or ["--help"], args.runs)
+    median = statistics.median(timings)
+    print(f"cold start over {args.runs} runs: min {min(timings):.1f} ms, "
+          f"median {median:.1f} ms, max {max(timings):.1f} ms")
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"Regression: median {median:.1f} ms exceeds {args.max_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
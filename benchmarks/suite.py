@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""Offline benchmark suite for the API class, run against the fake Drive server.
+
+Each scenario seeds a fresh fake drive, then times one operation end to end
+through the real client library: listing a large folder page by page, uploading
+many small files concurrently, creating a deep folder tree, downloading a large
+file and trashing many files with batched requests. Absolute times depend on
+the machine, so the median of several runs is divided by the time of a fixed
+calibration workload, raw listing requests to the fake server, measured on the
+same machine. These ratios are compared with the stored baselines, and the suite
+fails if any scenario is slower than its baseline by more than the threshold.
+
+    python benchmarks/suite.py --runs 5 --threshold 0.25
+    python benchmarks/suite.py --save   # Store the ratios as the new baselines
+"""
+
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from os.path import abspath, dirname, join
+from urllib.parse import urlencode
+import http.client
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = dirname(dirname(abspath(__file__)))
+BASELINES = join(dirname(abspath(__file__)), 'baselines.json')
+
+# Keep the upload sessions and hashes written by the client out of the user's cache
+os.environ['XDG_CACHE_HOME'] = tempfile.mkdtemp(prefix='gdrive-bench-')
+sys.path.insert(0, join(ROOT, 'src'))
+
+from api import API
+from executor import RequestExecutor
+from fake_drive import FakeDriveServer, fakeService
+from workers import TransferStats, WorkerPool
+
+LIST_FILES = 20000
+UPLOAD_FILES = 500
+UPLOAD_SIZE = 4 * 1024
+DOWNLOAD_SIZE = 128 * 1024 * 1024
+BATCH_FILES = 1000
+TREE_BRANCHES = 6  # Folders in each folder of the local tree
+TREE_DEPTH = 3
+JOBS = 8
+CALIBRATION_FILES = 1000
+CALIBRATION_REQUESTS = 100
+
+
+def listPagination(server, directory, newApi):
+    folder = server.drive.add('folder', mime_type='application/vnd.google-apps.folder')
+    for i in range(LIST_FILES):
+        server.drive.add(f"file{i}", parents=[folder['id']])
+    api = newApi()
+
+    def run():
+        found = sum(1 for _ in api.iterFiles(folder_id=folder['id'], fields="id, name"))
+        assert found == LIST_FILES, found
+    return run
+
+
+def bulkUpload(server, directory, newApi):
+    from bulk import createFolderTree, uploadAll
+    source = join(directory, 'upload')
+    os.makedirs(source)
+    for i in range(UPLOAD_FILES):
+        with open(join(source, f"file{i}.bin"), 'wb') as f:
+            f.write(os.urandom(UPLOAD_SIZE))
+
+    def run():
+        stats = TransferStats()
+        with WorkerPool(newApi, JOBS) as pool:
+            uploadAll(pool, createFolderTree(pool, source, 'root'), stats)
+        assert stats.files == UPLOAD_FILES and stats.failed == 0, stats.summary()
+    return run
+
+
+def folderTree(server, directory, newApi):
+    from bulk import createFolderTree
+    source = join(directory, 'tree')
+    level = [source]
+    for _ in range(TREE_DEPTH):
+        level = [join(folder, f"folder{i}") for folder in level for i in range(TREE_BRANCHES)]
+    for folder in level:
+        os.makedirs(folder)
+    folders = sum(TREE_BRANCHES ** depth for depth in range(TREE_DEPTH + 1))
+
+    def run():
+        with WorkerPool(newApi, JOBS) as pool:
+            for _ in createFolderTree(pool, source, 'root'):
+                pass
+        created = sum(1 for file in server.drive.files.values() if file['mimeType'] == 'application/vnd.google-apps.folder')
+        assert created == folders + 1, created
+    return run
+
+
+def largeDownload(server, directory, newApi):
+    file = server.drive.add('large.bin', content=os.urandom(DOWNLOAD_SIZE))
+    api = newApi()
+    path = join(directory, 'large.bin')
+
+    def run():
+        api.downloadFile(file['id'], path, progress=False)
+        assert os.path.getsize(path) == DOWNLOAD_SIZE
+        os.remove(path)
+    return run
+
+
+def batchMutations(server, directory, newApi):
+    file_ids = [server.drive.add(f"file{i}")['id'] for i in range(BATCH_FILES)]
+    api = newApi()
+
+    def run():
+        done = sum(1 for _, _, error in api.trashFiles(file_ids) if error is None)
+        assert done == BATCH_FILES, done
+    return run
+
+
+SCENARIOS = {
+    'list_pagination': listPagination,
+    'bulk_upload_small_files': bulkUpload,
+    'folder_tree_creation': folderTree,
+    'large_file_download': largeDownload,
+    'batch_mutations': batchMutations,
+}
+
+
+def measure(scenario, runs, latency, bandwidth) -> list:
+    """Time a scenario against a freshly seeded fake drive for each run."""
+    timings = []
+    for _ in range(runs):
+        with FakeDriveServer(latency=latency, bandwidth=bandwidth) as server, \
+                tempfile.TemporaryDirectory() as directory:
+            executor = RequestExecutor()
+            run = SCENARIOS[scenario](server, directory, lambda: API(fakeService(server.url), executor=executor))
+            with redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - start)
+    return timings
+
+
+def calibrate(runs) -> float:
+    """Time listing a folder with raw requests to the fake server, without the client library or any latency.
+
+    This measures how fast the machine runs the server, its HTTP stack and JSON, so the
+    timings of the scenarios can be stored as multiples of it.
+    """
+    timings = []
+    for _ in range(runs):
+        with FakeDriveServer() as server:
+            folder = server.drive.add('folder', mime_type='application/vnd.google-apps.folder')
+            for i in range(CALIBRATION_FILES):
+                server.drive.add(f"file{i}", parents=[folder['id']])
+            target = '/drive/v3/files?' + urlencode({'q': f"'{folder['id']}' in parents", 'pageSize': CALIBRATION_FILES,
+                                                     'fields': "nextPageToken, files(id, name)"})
+            connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1])
+            start = time.perf_counter()
+            for _ in range(CALIBRATION_REQUESTS):
+                connection.request('GET', target)
+                files = json.loads(connection.getresponse().read())['files']
+                assert len(files) == CALIBRATION_FILES, len(files)
+            timings.append(time.perf_counter() - start)
+            connection.close()
+    return statistics.median(timings)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", help="Number of runs of each scenario", type=int, default=3)
+    parser.add_argument("--latency", help="Milliseconds the fake server adds to every response", type=float, default=5)
+    parser.add_argument("--bandwidth", help="Megabytes per second the fake server transfers media at", type=float)
+    parser.add_argument("--threshold", help="Fail if a scenario is this fraction slower than its baseline", type=float, default=0.25)
+    parser.add_argument("--save", help="Store the ratios to the calibration as the new baselines", action="store_true")
+    parser.add_argument("scenario", help=f"Scenarios to run, default all of: {', '.join(SCENARIOS)}", nargs="*")
+    args = parser.parse_args()
+    for scenario in args.scenario:
+        if scenario not in SCENARIOS:
+            parser.error(f"unknown scenario {scenario}")
+
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as f:
+            baselines = json.load(f)
+    calibration = calibrate(args.runs)
+    print(f"{'calibration':<26} median {calibration:8.3f} s")
+    results = {}
+    regressions = []
+    for scenario in args.scenario or SCENARIOS:
+        timings = measure(scenario, args.runs, args.latency, args.bandwidth)
+        median = statistics.median(timings)
+        ratio = median / calibration
+        results[scenario] = round(ratio, 3)
+        line = f"{scenario:<26} median {median:8.3f} s  (min {min(timings):.3f}, max {max(timings):.3f})  {ratio:7.2f}x calibration"
+        baseline = baselines.get(scenario)
+        if baseline:
+            change = ratio / baseline - 1
+            line += f"  baseline {baseline:.2f}x, {change:+.0%}"
+            if change > args.threshold:
+                regressions.append(scenario)
+                line += "  REGRESSION"
+        print(line)
+
+    if args.save:
+        with open(BASELINES, 'w') as f:
+            json.dump({**baselines, **results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Saved baselines to {BASELINES}")
+    elif regressions:
+        print(f"Regression: {', '.join(regressions)} slower than baseline by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,106 @@
 from __future__ import print_function
 
-import io
-import shutil
-
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
-from errors import NotFolderError
+import os
+from itertools import islice
+
+from googleapiclient.errors import HttpError
+from errors import NotFolderError, isRetryable
+from executor import RecordingHttp, default_executor
+
+# The largest page size accepted by files().list
+PAGE_SIZE = 1000
+# The most calls Drive accepts in one batch request
+BATCH_SIZE = 100
+# The most IDs files().generateIds reserves at once
+GENERATE_IDS_SIZE = 1000
+# The largest page size accepted by permissions().list
+PERMISSIONS_PAGE_SIZE = 100
+# The metadata a download needs, the name and what identifies the version of the content
+DOWNLOAD_FIELDS = "id, name, mimeType, size, md5Checksum, modifiedTime"
+
+
+def escape(value) -> str:
+    """Escape a value to be quoted in a query."""
+    return value.replace('\\', '\\\\').replace("'", "\\'")
+
+
+def filesQuery(trash=False, excludeFolders=False, folder_id='root') -> str:
+    """Build the query listing the files in a folder, or in the entire drive if folder_id is None.
+
+    Files are listed whether or not they are in the trash if trash is None.
+    """
+    clauses = [] if trash is None else [f"trashed = {trash}"]
+    if(excludeFolders):
+        clauses.append("mimeType != 'application/vnd.google-apps.folder'")
+    if(folder_id != None):
+        clauses.append(f'"{folder_id}" in parents')
+    return " AND ".join(clauses)
+
+
+def searchQuery(name, trash=False, folder_id=None, match=False) -> str:
+    """Build the query finding files whose names contain or match a term."""
+    if(match):
+        query = f"name = '{escape(name)}'"
+    else:
+        query = f"name contains '{escape(name)}'"
+    if(folder_id):
+        query += f" AND '{folder_id}' in parents"
+    query += f" AND trashed = {trash}"
+    return query
+
+
+def namesQuery(names, folder_id) -> str:
+    """Build the query finding the files in a folder which have any of the names."""
+    matches = " or ".join(f"name = '{escape(name)}'" for name in names)
+    return f"'{folder_id}' in parents AND trashed = false AND ({matches})"
+
+
+def chunked(iterable, size):
+    """Split an iterable into lists of up to size items, consuming it lazily."""
+    iterator = iter(iterable)
+    while chunk := [*islice(iterator, size)]:
+        yield chunk
 
 class API:
 
-    def __init__(self, service):
-        self.service = service
+    def __init__(self, service, cache=None, executor=None):
+        """Wrap a Drive service.
 
-    def getFile(self, file_id):
+        Args:
+            service: The Drive service resource.
+            cache: An optional MetadataCache to answer metadata requests and listings from.
+            executor: The RequestExecutor every request is sent through. By default, one executor is shared by every API in the process.
+        """
+        self.service = service
+        self.files = service.files()  # Building the resource takes milliseconds, so it is only done once
+        self.cache = cache
+        self.executor = executor or default_executor
+        self.session = None  # For streaming responses, created when first needed
+
+    def execute(self, request):
+        """Send a request through the executor, retrying it if it fails."""
+        return self.executor.execute(request)
+
+    def invalidate(self, file_id, *folder_ids):
+        """Remove a changed file, and the listings of any folders it was or now is in, from the cache."""
+        if self.cache:
+            self.cache.invalidate(file_id, *(folder_id for folder_id in folder_ids if folder_id != None))
+
+    def invalidating(self, results, *folder_ids):
+        """Invalidate each file of batched results as they are yielded."""
+        for file_id, response, error in results:
+            if error == None:
+                self.invalidate(file_id, *folder_ids)
+            yield file_id, response, error
+
+    def getFile(self, file_id, fields="*"):
         """Get the metadata of a file.
 
+        Request only the fields which are needed, since the full resource is many times larger.
+
         Args:
             file_id: The ID of the file.
+            fields: The field mask of the metadata to get. (Default is all fields)
 
         Returns:
             The file metadata.
@@ -23,7 +108,13 @@ class API:
         Raises:
             HttpError: An error occured in the request.
         """
-        file = self.service.files().get(fileId=file_id, fields="*").execute()
+        if self.cache:
+            file = self.cache.getFile(file_id, fields)
+            if file != None:
+                return file
+        file = self.execute(self.files.get(fileId=file_id, fields=fields))
+        if self.cache:
+            self.cache.putFile(file_id, fields, file)
         return file
     
     def getFilePermissions(self, file_id):
@@ -38,8 +129,41 @@ class API:
         Raises:
             HttpError: An error occured in the request.
         """
-        permissions = self.service.permissions().list(fileId=file_id).execute()
+        permissions = self.execute(self.service.permissions().list(fileId=file_id))
         return permissions
+
+    def listPermissions(self, file_ids, fields="id, type, role, emailAddress, domain, allowFileDiscovery"):
+        """Get the permissions of many files using batched requests.
+
+        Files with more permissions than fit in one page have the rest fetched one request at a time.
+
+        Args:
+            file_ids: An iterable of the IDs of the files.
+            fields: The field mask applied to each permission.
+
+        Yields:
+            A tuple of (file ID, list of permissions, error) for each file. Error is None if the permissions were listed.
+
+        Raises:
+            HttpError: An error occured sending a batch.
+        """
+        def request(file_id, page_token=None):
+            return self.service.permissions().list(fileId=file_id, pageSize=PERMISSIONS_PAGE_SIZE, pageToken=page_token,
+                                                   fields=f"nextPageToken, permissions({fields})")
+
+        for file_id, response, error in self.executeBatch((file_id, request(file_id)) for file_id in file_ids):
+            if error:
+                yield file_id, None, error
+                continue
+            permissions = response.get('permissions', [])
+            try:
+                while response.get('nextPageToken'):
+                    response = self.execute(request(file_id, response['nextPageToken']))
+                    permissions.extend(response.get('permissions', []))
+            except HttpError as page_error:
+                yield file_id, None, page_error
+                continue
+            yield file_id, permissions, None
     
     def getParent(self, folder_id):
         """Get folder information.
@@ -56,49 +180,162 @@ class API:
             HttpError: An error occured in the request.
             NotFolderError: The found file is not a folder. 
         """
-        folder = self.service.files().get(fileId=folder_id).execute()
+        folder = self.getFile(folder_id, fields="id, name, mimeType")
         if folder['mimeType'] != 'application/vnd.google-apps.folder':
             raise NotFolderError
         else:
             return folder
 
-    def listFiles(self, trash=False, excludeFolders=False, folder_id='root') -> list:
+    def iterPages(self, query=None, fields="id, name, parents", folder_id=None):
+        """Iterate over the pages of a file listing, following nextPageToken.
+
+        Pages are only requested as they are consumed and use the largest page size Drive allows.
+        With a cache, complete listings are stored and served from it.
+
+        Args:
+            query: The query used to filter files. If no value given, every file in the drive is listed.
+            fields: The field mask applied to each file. (Default is "id, name, parents")
+            folder_id: The folder the query is restricted to, so the cached listing can be invalidated when the folder changes.
+
+        Yields:
+            A list of found files for each page of results.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        if self.cache:
+            files = self.cache.getListing(query, fields)
+            if files != None:
+                for start in range(0, len(files), PAGE_SIZE):
+                    yield files[start:start + PAGE_SIZE]
+                return
+        found = [] if self.cache else None
+        page_token = None
+        while True:
+            results = self.execute(self.files.list(
+                q=query, pageSize=PAGE_SIZE, pageToken=page_token,
+                fields=f"nextPageToken, files({fields})"))
+            files = results.get('files', [])
+            if found != None:
+                found.extend(files)
+                if len(found) > self.cache.max_entries:
+                    found = None  # Too large to cache, stop holding on to it
+            yield files
+            page_token = results.get('nextPageToken')
+            if page_token is None:
+                if found != None:
+                    self.cache.putListing(query, fields, folder_id, found)
+                return
+
+    def iterFiles(self, trash=False, excludeFolders=False, folder_id='root', fields="id, name, parents"):
+        """Iterate over all files in a folder.
+
+        Args:
+            trash: A flag to list items marked as trash. If None is given, items are listed whether or not they are in the trash.
+            excludeFolders: A flag to exclude folders from the list. 
+            folder_id: The ID of the root folder to list from. If None is given, all files in the entire drive, including nested files, are given. (Default is root)
+            fields: The field mask applied to each file. (Default is "id, name, parents")
+
+        Yields:
+            The metadata of each found file.
+
+        Raises:
+            HttpError: An error occured in the request. 
+        """
+        query = filesQuery(trash, excludeFolders, folder_id)
+        for page in self.iterPages(query, fields, folder_id):
+            yield from page
+
+    def listFiles(self, trash=False, excludeFolders=False, folder_id='root', compact=False):
         """List all files in a folder
 
         Args:
-            trash: A flag to list items marked as trash.
+            trash: A flag to list items marked as trash. If None is given, items are listed whether or not they are in the trash.
             excludeFolders: A flag to exclude folders from the list. 
             folder_id: The ID of the root folder to list from. If None is given, all files in the entire drive, including nested files, are given. (Default is root)
+            compact: A flag to return a FileTable instead, which holds millions of files in a fraction of the memory.
 
         Returns:
-            A list of found files with their ID, Name and a list of Parents.
+            A list of found files with their ID, Name and a list of Parents. With compact, a FileTable
+            of found files with their ID, Name, MIME type, first Parent and size.
 
         Raises:
             HttpError: An error occured in the request. 
         """
+        if compact:
+            return self.fileTable(filesQuery(trash, excludeFolders, folder_id), folder_id)
+        return list(self.iterFiles(trash, excludeFolders, folder_id))
+
+    def iterAllFiles(self, fields="id, name, parents"):
+        """Iterate over all files in the entire drive, including nested items, folders and items marked as trash. 
 
-        query = f"trashed = {trash}"
-        if(excludeFolders):
-            query += " AND mimeType != 'application/vnd.google-apps.folder'"
-        if(folder_id != None):
-            query += f' AND "{folder_id}" in parents'
+        Args:
+            fields: The field mask applied to each file. (Default is "id, name, parents")
 
-        results = self.service.files().list(
-            q=query, fields="files(id, name, parents)").execute()
-        return results.get('files', [])
+        Yields:
+            The metadata of each found file.
 
-    def listAllFiles(self) -> list:
+        Raises:
+            HttpError: An error occured in the request. 
+        """
+        for page in self.iterPages(fields=fields):
+            yield from page
+
+    def listAllFiles(self, compact=False):
         """List all files in the entire drive, including nested items, folders and items marked as trash. 
 
+        Args:
+            compact: A flag to return a FileTable instead, which holds millions of files in a fraction of the memory.
+
         Returns:
-            A list of found files with their ID, Name and a list of Parents.
+            A list of found files with their ID, Name and a list of Parents. With compact, a FileTable
+            of found files with their ID, Name, MIME type, first Parent and size.
 
         Raises:
             HttpError: An error occured in the request. 
         """
+        if compact:
+            return self.fileTable()
+        return list(self.iterAllFiles())
+
+    def fileTable(self, query=None, folder_id=None):
+        """List files into a FileTable, adding each page of results as it arrives.
 
-        results = self.service.files().list(fields="files(id, name, parents)").execute()
-        return results.get('files', [])
+        Args:
+            query: The query used to filter files. If no value given, every file in the drive is listed.
+            folder_id: The folder the query is restricted to, for the cache.
+
+        Returns:
+            The FileTable of found files.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        from records import TABLE_FIELDS, FileTable
+        table = FileTable()
+        for page in self.iterPages(query, TABLE_FIELDS, folder_id):
+            table.extend(page)
+        return table
+
+    def iterSearch(self, name, trash=False, folder_id=None, match=False, fields="id, name, parents"):
+        """Iterate over any files with names that contain the search term.
+
+        Args:
+            name: The term to search against. 
+            trash: A flag to search items marked as trash. 
+            folder_id: A folder ID to search within. If no value given, the entire drive is searched. 
+            match: A flag to only return files with names that match the search term exactly.
+            fields: The field mask applied to each file. (Default is "id, name, parents")
+
+        Yields:
+            The metadata of each file with a name that matches the search term.
+
+        Raises:
+            HttpError: An error occured in the request. 
+        """
+        query = searchQuery(name, trash, folder_id, match)
+        for page in self.iterPages(query, fields, folder_id):
+            yield from page
 
     def searchFile(self, name, trash=False, folder_id=None, match=False) -> list:
         """Searches the drive for any files with names that contain the search term.
@@ -114,25 +351,15 @@ class API:
         Raises:
             HttpError: An error occured in the request. 
         """
+        return list(self.iterSearch(name, trash, folder_id, match))
 
-        if(match):
-            query = f"name = '{name}'"
-        else:
-            query = f"name contains '{name}'"
-        if(folder_id):
-            query += f" AND '{folder_id}' in parents"
-        query += f" AND trashed = {trash}"
-        results = self.service.files().list(
-            q=query, fields="nextPageToken, files(id, name, parents)").execute()
-        items = results.get('files', [])
-        return items
-
-    def createFolder(self, name, folder_id='root') -> str:
+    def createFolder(self, name, folder_id='root', file_id=None) -> str:
         """Create a new folder. 
 
         Args:
             name: The name given to the folder.
             folder_id: The ID of the parent folder. By default, the new folder is created at the root. 
+            file_id: An ID reserved with generateIds to give the folder. By default, Drive assigns one.
 
         Returns:
             The ID of the new folder. 
@@ -142,112 +369,282 @@ class API:
         """
 
         if(folder_id == None):
-            folder_id = self.service.files().get(fileId='root').execute()
+            folder_id = 'root'
+        file = self.execute(self.createFolderRequest(name, folder_id, file_id))
+        self.invalidate(file.get('id'), folder_id)
+        return file.get('id')
+
+    def createFolderRequest(self, name, folder_id='root', file_id=None):
+        """Build the request to create a folder, optionally with a reserved ID, without executing it."""
         file_metadata = {
             'name': name,
             'mimeType': 'application/vnd.google-apps.folder',
             'parents': [folder_id]
         }
-        file = self.service.files().create(body=file_metadata, fields='id').execute()
-        return file.get('id')
+        if file_id != None:
+            file_metadata['id'] = file_id
+        return self.files.create(body=file_metadata, fields='id')
+
+    def generateIds(self, count) -> list:
+        """Reserve IDs for files which haven't been created yet.
+
+        A file created with a reserved ID can be referred to, eg. as the parent of other
+        files, before the response to its creation arrives, and creating it again after
+        a lost response fails with a 409 instead of making a duplicate.
+
+        Args:
+            count: The number of IDs to reserve. Up to GENERATE_IDS_SIZE are reserved per request.
+
+        Returns:
+            A list of the reserved IDs.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        ids = []
+        while len(ids) < count:
+            response = self.execute(self.files.generateIds(count=min(count - len(ids), GENERATE_IDS_SIZE), space='drive'))
+            ids.extend(response['ids'])
+        return ids
+
+    def findIdentical(self, name, file_path, folder_id='root'):
+        """Find a file in a folder with the same name and content as a local file.
+
+        The local file is only hashed if a file with the same name and size exists.
+
+        Args:
+            name: The name of the file in the drive.
+            file_path: The path of the local file.
+            folder_id: The folder to look in. Default is 'root'
+
+        Returns:
+            The ID of the identical file, or None if there isn't one.
 
-    def uploadFile(self, name, file_path, mime_type, folder_id='root') -> str:
+        Raises:
+            HttpError: An error occured in the request. 
+        """
+        from hashing import localMd5
+        size = os.path.getsize(file_path)
+        query = f"name = '{escape(name)}' AND '{folder_id}' in parents AND trashed = false"
+        for page in self.iterPages(query, "id, size, md5Checksum", folder_id):
+            for file in page:
+                if int(file.get('size', -1)) == size and file.get('md5Checksum') == localMd5(file_path):
+                    return file['id']
+        return None
+
+    def uploadFile(self, name, file_path, mime_type, folder_id='root', skip_unchanged=False, chunk_size=None, progress=True) -> str:
         """Upload a file to the drive. 
 
+        An interrupted upload is resumed from the last byte the drive received when the same file is uploaded to the same folder and name again.
+
         Args:
             name: The name of the new file. This does not have to match the name of the local file but should match the extension. 
             file_path: The path of the file to be uploaded. 
             mime_type: The Mime Type of the file, eg. image/jpeg
             folder_id: The parent folder of the new file. Default is 'root'
+            skip_unchanged: A flag to skip the upload if a file with the same name and content is already in the folder.
+            chunk_size: The number of bytes sent at a time, rounded up to a multiple of 256KB. (Default is 100MB)
+            progress: A flag to print the progress and throughput after each chunk.
 
         Returns:
-            The ID of the new file.
+            The ID of the new file, or of the existing file if the upload was skipped.
 
         Raises:
             HttpError: An error occured in the request. 
         """
+        if(skip_unchanged):
+            existing = self.findIdentical(name, file_path, folder_id)
+            if existing != None:
+                return existing
 
         file_metadata = {
             'name': name,
             'parents': [folder_id]
         }
 
+        from googleapiclient.http import MediaFileUpload
+        from transfer import chunkSize, printUploadProgress, uploadFromFile
         media = MediaFileUpload(
-            file_path, mimetype=mime_type, resumable=True)
-        file = self.service.files().create(body=file_metadata,
-                                           media_body=media,
-                                           fields='id').execute()
+            file_path, mimetype=mime_type, chunksize=chunkSize(chunk_size), resumable=True)
+        request = self.files.create(body=file_metadata,
+                                              media_body=media,
+                                              fields='id')
+        file = uploadFromFile(request, f"create {folder_id}/{name} {os.path.abspath(file_path)}", file_path,
+                              printUploadProgress if progress else None, self.executor.call)
+        self.invalidate(file.get('id'), folder_id)
         return file.get('id')
 
-    def updateFile(self, file_id, name, file_path, mime_type):
+    def updateFile(self, file_id, name, file_path, mime_type, skip_unchanged=False, chunk_size=None, progress=True):
         """Update an existing file in the drive with new content
 
+        An interrupted upload is resumed from the last byte the drive received when the same file is updated again.
+
         Args:
             file_id: The ID of file to update. 
             name: The new name of the file.
             file_path: Path to the file contents to upload.
-            mime_type: 
+            mime_type: The new Mime Type of the file.
+            skip_unchanged: A flag to only update the name and Mime Type if the file already has the same content.
+            chunk_size: The number of bytes sent at a time, rounded up to a multiple of 256KB. (Default is 100MB)
+            progress: A flag to print the progress and throughput after each chunk.
 
         Raises:
             HttpError: An error occured in the request.
         """
-        file = self.service.files().get(fileId=file_id).execute()
-
-        del file['id']
-        file['name'] = name
-        file['mimeType'] = mime_type
-
-        media = MediaFileUpload(file_path, mimetype=mime_type, resumable=True)
-
-        updated = self.service.files().update(
-            fileId=file_id, body=file, media_body=media).execute()
+        if(skip_unchanged):
+            from hashing import localMd5
+            remote = self.execute(self.files.get(fileId=file_id, fields='size, md5Checksum'))
+            if int(remote.get('size', -1)) == os.path.getsize(file_path) and remote.get('md5Checksum') == localMd5(file_path):
+                self.execute(self.files.update(fileId=file_id, body={'name': name, 'mimeType': mime_type},
+                                                         fields='id'))
+                self.invalidate(file_id)
+                return file_id
+
+        # Only the changed metadata is sent, everything else is left as it is
+        file = {'name': name, 'mimeType': mime_type}
+
+        from googleapiclient.http import MediaFileUpload
+        from transfer import chunkSize, printUploadProgress, uploadFromFile
+        media = MediaFileUpload(file_path, mimetype=mime_type, chunksize=chunkSize(chunk_size), resumable=True)
+
+        request = self.files.update(
+            fileId=file_id, body=file, media_body=media, fields='id')
+        updated = uploadFromFile(request, f"update {file_id} {os.path.abspath(file_path)}", file_path,
+                                 printUploadProgress if progress else None, self.executor.call)
+        self.invalidate(file_id)
 
         return updated.get('id')
 
-    def downloadFile(self, file_id) -> None:
-        """Download a file from the drive. 
+    def downloadFile(self, file_id, path=None, chunk_size=None, progress=True, file=None) -> str:
+        """Download a file from the drive straight to disk. 
+
+        An interrupted download is resumed from where it stopped when the same path is downloaded to
+        again, unless the file has changed in the drive since.
 
         Args:
             file_id: The ID of the file to download. 
+            path: The local path to save the file to. By default, the name of the file in the drive is used.
+            chunk_size: The number of bytes requested at a time. (Default is 100MB)
+            progress: A flag to print the progress of the download after each chunk.
+            file: The metadata of the file with its md5Checksum and modifiedTime, if already known. By default it is fetched.
+
+        Returns:
+            The path of the downloaded file.
 
         Raises:
             HttpError: An error occured in the request.
         """
-        file = self.service.files().get(fileId=file_id).execute()
-        request = self.service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
-            print("Download %d%%." % int(status.progress() * 100))
-
-        fh.seek(0)
-        with open(file.get('name'), 'wb') as f:
-            shutil.copyfileobj(fh, f, length=10000)
-
-    def exportFile(self, file_id):
-        """Export a Google Workspace document and download it.
+        from transfer import downloadToFile, printProgress, remoteVersion
+        if(file == None):
+            # Not from the cache, as a stale checksum could resume a partial file of another version
+            file = self.execute(self.files.get(fileId=file_id, fields=DOWNLOAD_FIELDS))
+        if(path == None):
+            path = file['name']
+        request = self.files.get_media(fileId=file_id)
+        downloadToFile(request, path, chunk_size, progress=printProgress if progress else None, call=self.executor.call,
+                       version=remoteVersion(file))
+        return path
+
+    def exportFile(self, file_id, path=None, chunk_size=None, mime_type='application/pdf') -> str:
+        """Export a Google Workspace document and stream it straight to disk.
 
         Args:
             file_id: The ID of the file to download.
+            path: The local path to save the file to. By default, the name of the file in the drive is used.
+            chunk_size: The number of bytes written to disk at a time. (Default is 1MB)
+            mime_type: The MIME type to export the document as. It must be one the type of document can be exported to. Default is PDF.
+
+        Returns:
+            The path of the exported file.
 
         Raises:
             HttpError: An error occured in the request.    
         """
-        file = self.service.files().get(fileId=file_id).execute()
-        request = self.service.files().export_media(
-            fileId=file_id, mimeType='application/pdf')
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
-            print("Download %d%%." % int(status.progress() * 100))
+        from transfer import mediaSession, streamToFile
+        if(path == None):
+            path = self.getFile(file_id, fields='name')['name']
+        if self.session is None:
+            self.session = mediaSession(self.service._http)
+        request = self.files.export_media(
+            fileId=file_id, mimeType=mime_type)
+        streamToFile(request, path, self.session, chunk_size, call=self.executor.call)
+        return path
+
+    def getFiles(self, file_ids, fields="id, name, mimeType"):
+        """Get the metadata of many files using batched requests. The metadata cache is not used.
+
+        Args:
+            file_ids: An iterable of the IDs of the files.
+            fields: The field mask applied to each file.
+
+        Yields:
+            A tuple of (file ID, file, error) for each file. Error is None if the file was found.
+
+        Raises:
+            HttpError: An error occured sending a batch.
+        """
+        return self.executeBatch((file_id, self.files.get(fileId=file_id, fields=fields)) for file_id in file_ids)
+
+    def findChildren(self, names, fields="id, name, mimeType"):
+        """Find the files with given names in many folders using batched requests, one query per folder.
+
+        Only the first page of each query is fetched, so a name shared by more files
+        than fit in a page may not find all of them. The metadata cache is not used.
+
+        Args:
+            names: A dict of each folder ID to the names to find in it.
+            fields: The field mask applied to each file.
+
+        Yields:
+            A tuple of (folder ID, found files, error) for each folder. Error is None if the query succeeded.
+
+        Raises:
+            HttpError: An error occured sending a batch.
+        """
+        requests = ((folder_id, self.files.list(q=namesQuery(folder_names, folder_id), pageSize=PAGE_SIZE,
+                                                 fields=f"files({fields})"))
+                    for folder_id, folder_names in names.items())
+        for folder_id, response, error in self.executeBatch(requests):
+            yield folder_id, response.get('files', []) if error == None else None, error
+
+    def executeBatch(self, requests):
+        """Send requests through the batch endpoint, up to BATCH_SIZE requests per HTTP call.
+
+        Requests which fail with a rate limit or server error are retried on their own.
+
+        Args:
+            requests: An iterable of (key, request) tuples. It is consumed lazily, one batch at a time.
+
+        Yields:
+            A tuple of (key, response, error) for each request in order. Error is None if the request succeeded.
 
-        fh.seek(0)
-        with open(file.get('name'), 'wb') as f:
-            shutil.copyfileobj(fh, f, length=10000)
+        Raises:
+            HttpError: An error occured sending a batch.
+        """
+        for chunk in chunked(requests, BATCH_SIZE):
+            results = {}
+
+            def callback(request_id, response, exception):
+                results[request_id] = (response, exception)
+
+            batch = self.service.new_batch_http_request(callback=callback)
+            for i, (key, request) in enumerate(chunk):
+                batch.add(request, request_id=str(i))
+            self.executor.call(batch.execute, http=RecordingHttp(self.service._http), method='batch')
+
+            for i, (key, request) in enumerate(chunk):
+                response, error = results[str(i)]
+                if isinstance(error, HttpError) and isRetryable(error):
+                    try:
+                        response, error = self.execute(request), None
+                    except HttpError as retry_error:
+                        error = retry_error
+                yield key, response, error
+
+    def moveRequest(self, file_id, folder_id, previous_parents):
+        """Build the request to move a file from its previous parents, without executing it."""
+        return self.files.update(fileId=file_id, addParents=folder_id,
+                                           removeParents=",".join(previous_parents), fields='id, parents')
 
     def moveFile(self, file_id, folder_id='root') -> None:
         """Move a file in the drive by changing the parent.  
@@ -260,16 +657,49 @@ class API:
             HttpError: An error occured in the request.
 
         """
-        file = self.service.files().get(fileId=file_id, fields='parents').execute()
-        previous_parents = ",".join(file.get('parents'))
+        # Drive can only move a file by naming the parents to remove, so they are fetched first
+        file = self.execute(self.files.get(fileId=file_id, fields='parents'))
+        self.execute(self.moveRequest(file_id, folder_id, file.get('parents')))
+        self.invalidate(file_id, folder_id)
+
+    def moveFiles(self, file_ids, folder_id='root'):
+        """Move many files into a folder using batched requests.
 
-        file = self.service.files().update(fileId=file_id, addParents=folder_id,
-                                           removeParents=previous_parents, fields='id, parents').execute()
+        The current parents of each batch of files are fetched in one batch, then the files are moved in another.
+
+        Args:
+            file_ids: An iterable of the IDs of the files to move.
+            folder_id: The ID of the new parent folder. Default is root.
+
+        Yields:
+            A tuple of (file ID, response, error) for each file. Error is None if the file was moved.
+
+        Raises:
+            HttpError: An error occured sending a batch.
+        """
+        for chunk in chunked(file_ids, BATCH_SIZE):
+            moves = []
+            for file_id, file, error in self.executeBatch(
+                    (file_id, self.files.get(fileId=file_id, fields='parents')) for file_id in chunk):
+                if error:
+                    yield file_id, None, error
+                else:
+                    moves.append((file_id, self.moveRequest(file_id, folder_id, file.get('parents'))))
+            yield from self.invalidating(self.executeBatch(moves), folder_id)
+
+    def copyRequest(self, file_id, folder_id=None, name=None):
+        """Build the request to copy a file, without executing it."""
+        metadata = {}
+        if name != None:
+            metadata['name'] = name
+        if folder_id != None:
+            metadata['parents'] = [folder_id]
+        return self.files.copy(fileId=file_id, body=metadata, fields='id, name')
 
     def copyFile(self, file_id, folder_id=None, name=None):
         """Copy a file.
         
-        Copy a file with optional parameters to change the name and parent folder. Folders cannot be copied.
+        Copy a file with optional parameters to change the name and parent folder. Folders cannot be copied, see copyFolderTree in bulk.py.
         
         Args:
             file_id: The ID of the file being copied.
@@ -282,15 +712,26 @@ class API:
         Raises:
             HttpError: An error occured in the request.
         """
-        metadata ={}
-        if name != None:
-            metadata['name'] = name
-        if folder_id != None:
-            metadata['parents'] = [folder_id]
-        print(metadata)
-        file = self.service.files().copy(fileId=file_id,body=metadata).execute()
-        return file
+        copy = self.execute(self.copyRequest(file_id, folder_id, name))
+        self.invalidate(file_id, folder_id)
+        return copy
+
+    def copyFiles(self, file_ids, folder_id=None, name=None):
+        """Copy many files using batched requests.
+
+        Args:
+            file_ids: An iterable of the IDs of the files to copy.
+            folder_id: The parent of the new copies. By default, each copy is stored in the same folder as the original.
+            name: The name of the new copies. By default, the name remains the same.
 
+        Yields:
+            A tuple of (file ID, copy, error) for each file. Error is None if the file was copied.
+
+        Raises:
+            HttpError: An error occured sending a batch.
+        """
+        return self.invalidating(
+            self.executeBatch((file_id, self.copyRequest(file_id, folder_id, name)) for file_id in file_ids), folder_id)
 
     def addShortcut(self, file_id, folder_id=None):
         """Create a shortcut to a file.
@@ -305,7 +746,7 @@ class API:
         Raises:
             HttpError: An error occured in the request.
         """
-        file = self.service.files().get(fileId=file_id, fields="name, id, parents").execute()
+        file = self.getFile(file_id, fields="name" if folder_id else "name, parents")
         if(folder_id == None):
             folder_id = file.get('parents')[0]
 
@@ -317,10 +758,45 @@ class API:
                 'targetId': file_id
             }
         }
-        shortcut = self.service.files().create(body=shortcut_metadata,
-                                               fields='id').execute()
+        shortcut = self.execute(self.files.create(body=shortcut_metadata,
+                                                            fields='id'))
+        self.invalidate(file_id, folder_id)
         return shortcut['id']
 
+    def getStartPageToken(self) -> str:
+        """Get a page token for the changes feed, marking the current state of the drive.
+
+        Returns:
+            The page token to list changes made after this call from.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        return self.execute(self.service.changes().getStartPageToken())['startPageToken']
+
+    def getChanges(self, page_token, fields="fileId, removed, file(id, name, mimeType, parents, trashed)"):
+        """Get every change made to the drive since a page token.
+
+        Args:
+            page_token: The page token from getStartPageToken or a previous call.
+            fields: The field mask applied to each change.
+
+        Returns:
+            A tuple of the list of changes and the page token to get later changes from.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        changes = []
+        while True:
+            results = self.execute(self.service.changes().list(
+                pageToken=page_token, pageSize=PAGE_SIZE,
+                fields=f"nextPageToken, newStartPageToken, changes({fields})"))
+            changes.extend(results.get('changes', []))
+            if 'newStartPageToken' in results:
+                return changes, results['newStartPageToken']
+            page_token = results['nextPageToken']
+
     def emptyTrash(self):
         """Permanently deletes all items marked as trash.
 
@@ -328,7 +804,14 @@ class API:
             HttpError: An error occured in the request.
 
         """
-        self.service.files().emptyTrash().execute()
+        self.execute(self.files.emptyTrash())
+        if self.cache:
+            self.cache.clear()
+
+    def lockRequest(self, file_id, reason="No reason given"):
+        """Build the request to lock a file, without executing it."""
+        return self.files.update(fileId=file_id, body={"contentRestrictions":
+                                                                 [{"readOnly": "true", "reason": reason}]}, fields='id')
 
     def lockFile(self, file_id, reason="No reason given"):
         """Lock a file and make it read-only.
@@ -340,8 +823,28 @@ class API:
         Raises:
             HttpError: An error occured in the request.
         """
-        self.service.files().update(fileId=file_id, body={"contentRestrictions":
-                                                          [{"readOnly": "true", "reason": reason}]}).execute()
+        self.execute(self.lockRequest(file_id, reason))
+        self.invalidate(file_id)
+
+    def lockFiles(self, file_ids, reason="No reason given"):
+        """Lock many files using batched requests.
+
+        Args:
+            file_ids: An iterable of the IDs of the files to lock.
+            reason: An optional reason as to why the files are being locked. 
+
+        Yields:
+            A tuple of (file ID, response, error) for each file. Error is None if the file was locked.
+
+        Raises:
+            HttpError: An error occured sending a batch.
+        """
+        return self.invalidating(self.executeBatch((file_id, self.lockRequest(file_id, reason)) for file_id in file_ids))
+
+    def unlockRequest(self, file_id):
+        """Build the request to unlock a file, without executing it."""
+        return self.files.update(fileId=file_id, body={"contentRestrictions":
+                                                                 [{"readOnly": "false"}]}, fields='id')
 
     def unlockFile(self, file_id):
         """Unlock a file.
@@ -352,8 +855,26 @@ class API:
         Raises:
             HttpError: An error occured in the request.
         """
-        self.service.files().update(fileId=file_id, body={"contentRestrictions":
-                                                          [{"readOnly": "false"}]}).execute()
+        self.execute(self.unlockRequest(file_id))
+        self.invalidate(file_id)
+
+    def unlockFiles(self, file_ids):
+        """Unlock many files using batched requests.
+
+        Args:
+            file_ids: An iterable of the IDs of the files to unlock.
+
+        Yields:
+            A tuple of (file ID, response, error) for each file. Error is None if the file was unlocked.
+
+        Raises:
+            HttpError: An error occured sending a batch.
+        """
+        return self.invalidating(self.executeBatch((file_id, self.unlockRequest(file_id)) for file_id in file_ids))
+
+    def trashRequest(self, file_id):
+        """Build the request to trash a file, without executing it."""
+        return self.files.update(fileId=file_id, body={"trashed": "true"}, fields='id')
 
     def trashFile(self, file_id):
         """Mark a file as trash.
@@ -364,8 +885,26 @@ class API:
         Raises:
             HttpError: An error occured in the request.
         """
-        self.service.files().update(fileId=file_id, body={
-            "trashed": "true"}).execute()
+        self.execute(self.trashRequest(file_id))
+        self.invalidate(file_id)
+
+    def trashFiles(self, file_ids):
+        """Mark many files as trash using batched requests.
+
+        Args:
+            file_ids: An iterable of the IDs of the files to trash.
+
+        Yields:
+            A tuple of (file ID, response, error) for each file. Error is None if the file was trashed.
+
+        Raises:
+            HttpError: An error occured sending a batch.
+        """
+        return self.invalidating(self.executeBatch((file_id, self.trashRequest(file_id)) for file_id in file_ids))
+
+    def restoreRequest(self, file_id):
+        """Build the request to restore a file, without executing it."""
+        return self.files.update(fileId=file_id, body={"trashed": "false"}, fields='id')
 
     def restoreFile(self, file_id):
         """Restore a file from the trash.
@@ -376,5 +915,19 @@ class API:
         Raises:
             HttpError: An error occured in the request.
         """
-        self.service.files().update(fileId=file_id, body={
-            "trashed": "false"}).execute()
+        self.execute(self.restoreRequest(file_id))
+        self.invalidate(file_id)
+
+    def restoreFiles(self, file_ids):
+        """Restore many files from the trash using batched requests.
+
+        Args:
+            file_ids: An iterable of the IDs of the files to restore.
+
+        Yields:
+            A tuple of (file ID, response, error) for each file. Error is None if the file was restored.
+
+        Raises:
+            HttpError: An error occured sending a batch.
+        """
+        return self.invalidating(self.executeBatch((file_id, self.restoreRequest(file_id)) for file_id in file_ids))
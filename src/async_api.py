@@ -0,0 +1,664 @@
+import asyncio
+import json
+import os
+import time
+
+from googleapiclient.errors import HttpError
+from api import DOWNLOAD_FIELDS, PAGE_SIZE, filesQuery, searchQuery
+from errors import NotFolderError, isRetryable
+from executor import default_executor, isRateLimited, retryDelay
+from transfer import partialVersion, remoteVersion, savePartialVersion
+
+ROOT_URL = 'https://www.googleapis.com/'
+DEFAULT_CONCURRENCY = 64  # Requests in flight at once
+DEFAULT_CONNECTIONS = 32  # Keep-alive connections in the pool
+READ_SIZE = 1024 * 1024  # Bytes written to disk at a time when downloading
+
+
+def queryParams(params) -> dict:
+    """Drop unset parameters and convert the rest to the strings aiohttp sends."""
+    return {key: str(value).lower() if isinstance(value, bool) else str(value)
+            for key, value in params.items() if value is not None}
+
+
+def httpError(response, content, uri) -> HttpError:
+    """Build the same HttpError the discovery client raises, so errors are handled the same way."""
+    import httplib2
+    resp = httplib2.Response({'status': str(response.status), **{key.lower(): value for key, value in response.headers.items()}})
+    resp.reason = response.reason
+    return HttpError(resp, content, uri=uri)
+
+
+def readChunk(path, offset, size) -> bytes:
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+class AsyncAPI:
+    """An asyncio counterpart of API, sending requests over a pool of keep-alive connections.
+
+    The methods mirror API, but are coroutines, and listings are async iterators.
+    Requests are retried with the same backoff as API and go through the rate
+    limit, counters and hooks of a RequestExecutor, so both can share one quota.
+    A semaphore bounds the number of requests in flight, so thousands of calls can
+    be started at once. The metadata cache is not used.
+
+    aiohttp is only needed when the API is opened:
+
+        async with AsyncAPI(credentials) as api:
+            files = await asyncio.gather(*(api.getFile(file_id, "id, name") for file_id in file_ids))
+    """
+
+    def __init__(self, credentials=None, concurrency=DEFAULT_CONCURRENCY, connections=DEFAULT_CONNECTIONS,
+                 executor=None, root_url=ROOT_URL):
+        """Create an API, which must be opened before use.
+
+        Args:
+            credentials: The credentials used to authorise requests, refreshed when they expire. None sends no authorisation, eg. for a fake server.
+            concurrency: The maximum number of requests in flight at once.
+            connections: The maximum number of pooled connections.
+            executor: The RequestExecutor whose rate limit, counters and hooks are used. By default, the one shared by every API.
+            root_url: The root URL of the Drive API.
+        """
+        self.credentials = credentials
+        self.concurrency = concurrency
+        self.connections = connections
+        self.executor = executor or default_executor
+        self.root_url = root_url
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.auth_lock = asyncio.Lock()
+        self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self):
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImportError("AsyncAPI needs aiohttp, install it with: pip install aiohttp") from None
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.connections),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60))
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    async def authorization(self) -> dict:
+        """Get the Authorization header, refreshing the credentials on another thread if they expired."""
+        if self.credentials is None:
+            return {}
+        if not self.credentials.valid:
+            async with self.auth_lock:
+                if not self.credentials.valid:
+                    from google.auth.transport.requests import Request
+                    await asyncio.to_thread(self.credentials.refresh, Request())
+        return {'Authorization': f"Bearer {self.credentials.token}"}
+
+    async def call(self, method, send):
+        """Await send() until it succeeds, retrying it like RequestExecutor.call.
+
+        Args:
+            method: The API method, eg. files.get, to count the request under.
+            send: A coroutine function which sends the request and returns a tuple of (status, response bytes, result).
+
+        Returns:
+            The result of send.
+
+        Raises:
+            HttpError: The request failed with an error which can't be retried, or failed too many times.
+        """
+        import aiohttp
+        executor = self.executor
+        stats = executor.stats
+        attempt = 0
+        while True:
+            if executor.bucket:
+                wait = executor.bucket.reserve()
+                if wait > 0:
+                    stats.count('throttled')
+                    stats.count('throttled_seconds', wait)
+                    await asyncio.sleep(wait)
+            stats.count('requests')
+            stats.countMethod(method)
+            start, started = time.time(), time.monotonic()
+            try:
+                async with self.semaphore:
+                    status, size, result = await send()
+                if executor.hooks:
+                    executor.record(method, start, time.monotonic() - started, status, size, attempt)
+                return result
+            except HttpError as error:
+                if executor.hooks:
+                    executor.record(method, start, time.monotonic() - started, error.resp.status,
+                                    len(error.content or b''), attempt, error._get_reason())
+                if isRateLimited(error):
+                    stats.count('rate_limited')
+                if attempt >= executor.max_retries or not isRetryable(error):
+                    stats.count('failed')
+                    raise
+                delay = retryDelay(attempt, error)
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as error:
+                # Dropped connections and timeouts
+                if executor.hooks:
+                    executor.record(method, start, time.monotonic() - started, attempt=attempt, error=repr(error))
+                if attempt >= executor.max_retries:
+                    stats.count('failed')
+                    raise
+                delay = retryDelay(attempt)
+            stats.count('retried')
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def request(self, method, http_method, path, params=None, body=None):
+        """Send a JSON request to the Drive API.
+
+        Args:
+            method: The API method, eg. files.get.
+            http_method: The HTTP method.
+            path: The path below drive/v3/.
+            params: The query parameters. Parameters which are None are left out.
+            body: The JSON body, if any.
+
+        Returns:
+            The parsed response, or an empty dict if there was no content.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        url = f"{self.root_url}drive/v3/{path}"
+
+        async def send():
+            async with self.session.request(http_method, url, params=queryParams(params or {}), json=body,
+                                            headers=await self.authorization()) as response:
+                content = await response.read()
+                if response.status >= 300:
+                    raise httpError(response, content, url)
+                return response.status, len(content), json.loads(content) if content else {}
+        return await self.call(method, send)
+
+    async def each(self, func, file_ids, *args):
+        """Call func(file_id, *args) for many files, with up to twice the concurrency started at once.
+
+        Yields:
+            A tuple of (file ID, response, error) for each file as it finishes. Error is None if the call succeeded.
+        """
+        pending = {}
+
+        async def run(file_id):
+            try:
+                return file_id, await func(file_id, *args), None
+            except HttpError as error:
+                return file_id, None, error
+
+        for file_id in file_ids:
+            pending[asyncio.ensure_future(run(file_id))] = file_id
+            if len(pending) >= self.concurrency * 2:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    del pending[task]
+                    yield task.result()
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                del pending[task]
+                yield task.result()
+
+    async def getFile(self, file_id, fields="*"):
+        """Get the metadata of a file.
+
+        Args:
+            file_id: The ID of the file.
+            fields: The field mask of the metadata to get. (Default is all fields)
+
+        Returns:
+            The file metadata.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        return await self.request('files.get', 'GET', f"files/{file_id}", {'fields': fields})
+
+    async def getFilePermissions(self, file_id):
+        """Get the permissions of a file.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        return await self.request('permissions.list', 'GET', f"files/{file_id}/permissions")
+
+    async def getParent(self, folder_id):
+        """Get folder information.
+
+        Raises:
+            HttpError: An error occured in the request.
+            NotFolderError: The found file is not a folder.
+        """
+        folder = await self.getFile(folder_id, fields="id, name, mimeType")
+        if folder['mimeType'] != 'application/vnd.google-apps.folder':
+            raise NotFolderError
+        return folder
+
+    async def iterPages(self, query=None, fields="id, name, parents"):
+        """Iterate over the pages of a file listing, following nextPageToken.
+
+        Yields:
+            A list of found files for each page of results.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        page_token = None
+        while True:
+            results = await self.request('files.list', 'GET', 'files', {
+                'q': query, 'pageSize': PAGE_SIZE, 'pageToken': page_token,
+                'fields': f"nextPageToken, files({fields})"})
+            yield results.get('files', [])
+            page_token = results.get('nextPageToken')
+            if page_token is None:
+                return
+
+    async def iterFiles(self, trash=False, excludeFolders=False, folder_id='root', fields="id, name, parents"):
+        """Iterate over all files in a folder, or the entire drive if folder_id is None.
+
+        Yields:
+            The metadata of each found file.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        async for page in self.iterPages(filesQuery(trash, excludeFolders, folder_id), fields):
+            for file in page:
+                yield file
+
+    async def listFiles(self, trash=False, excludeFolders=False, folder_id='root') -> list:
+        """List all files in a folder.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        return [file async for file in self.iterFiles(trash, excludeFolders, folder_id)]
+
+    async def iterAllFiles(self, fields="id, name, parents"):
+        """Iterate over all files in the entire drive, including nested items, folders and items marked as trash.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        async for page in self.iterPages(fields=fields):
+            for file in page:
+                yield file
+
+    async def listAllFiles(self) -> list:
+        """List all files in the entire drive, including nested items, folders and items marked as trash.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        return [file async for file in self.iterAllFiles()]
+
+    async def iterSearch(self, name, trash=False, folder_id=None, match=False, fields="id, name, parents"):
+        """Iterate over any files with names that contain the search term.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        async for page in self.iterPages(searchQuery(name, trash, folder_id, match), fields):
+            for file in page:
+                yield file
+
+    async def searchFile(self, name, trash=False, folder_id=None, match=False) -> list:
+        """Search the drive for any files with names that contain the search term.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        return [file async for file in self.iterSearch(name, trash, folder_id, match)]
+
+    async def createFolder(self, name, folder_id='root') -> str:
+        """Create a new folder.
+
+        Returns:
+            The ID of the new folder.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        file = await self.request('files.create', 'POST', 'files', {'fields': 'id'}, {
+            'name': name, 'mimeType': 'application/vnd.google-apps.folder', 'parents': [folder_id or 'root']})
+        return file['id']
+
+    async def uploadFile(self, name, file_path, mime_type, folder_id='root', chunk_size=None) -> str:
+        """Upload a file to the drive.
+
+        Files which fit in one chunk are sent in a single multipart request. Larger files
+        use a resumable session which is saved like API.uploadFile, so either can resume it.
+
+        Returns:
+            The ID of the new file.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        file = await self.upload('files.create', 'POST', 'files', {'name': name, 'parents': [folder_id]},
+                                 file_path, mime_type, chunk_size, f"create {folder_id}/{name} {os.path.abspath(file_path)}")
+        return file['id']
+
+    async def updateFile(self, file_id, name, file_path, mime_type, chunk_size=None) -> str:
+        """Replace the content of an existing file, along with its name and Mime Type.
+
+        Returns:
+            The ID of the file.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        file = await self.upload('files.update', 'PATCH', f"files/{file_id}", {'name': name, 'mimeType': mime_type},
+                                 file_path, mime_type, chunk_size, f"update {file_id} {os.path.abspath(file_path)}")
+        return file['id']
+
+    async def upload(self, method, http_method, path, metadata, file_path, mime_type, chunk_size, key):
+        import aiohttp
+        from transfer import chunkSize, uploadSessions
+        chunk_size = chunkSize(chunk_size)
+        url = f"{self.root_url}upload/drive/v3/{path}"
+        stat = os.stat(file_path)
+        size = stat.st_size
+
+        if size <= chunk_size:
+            data = await asyncio.to_thread(readChunk, file_path, 0, size)
+
+            async def sendMultipart():
+                with aiohttp.MultipartWriter('related') as writer:
+                    writer.append_json(metadata)
+                    writer.append(data, {'Content-Type': mime_type})
+                async with self.session.request(http_method, url, params={'uploadType': 'multipart', 'fields': 'id'},
+                                                data=writer, headers=await self.authorization()) as response:
+                    content = await response.read()
+                    if response.status >= 300:
+                        raise httpError(response, content, url)
+                    return response.status, len(content), json.loads(content)
+            return await self.call(method, sendMultipart)
+
+        sessions = uploadSessions()
+        saved = sessions.get(key, stat)
+        # The offset is None whenever the session has to be asked how much it has
+        state = {'uri': saved['uri'] if saved else None, 'offset': None}
+
+        async def startSession():
+            headers = {**await self.authorization(), 'X-Upload-Content-Type': mime_type,
+                       'X-Upload-Content-Length': str(size)}
+            async with self.session.request(http_method, url, params={'uploadType': 'resumable', 'fields': 'id'},
+                                            json=metadata, headers=headers) as response:
+                content = await response.read()
+                if response.status >= 300:
+                    raise httpError(response, content, url)
+                state['uri'], state['offset'] = response.headers['Location'], 0
+                return response.status, len(content), None
+
+        async def put(data, content_range):
+            headers = {**await self.authorization(), 'Content-Range': content_range}
+            async with self.session.put(state['uri'], data=data, headers=headers) as response:
+                content = await response.read()
+                if response.status in (200, 201):
+                    return response.status, len(content), json.loads(content)
+                if response.status != 308:
+                    raise httpError(response, content, state['uri'])
+                # Range is the bytes the session has, eg. bytes=0-1048575
+                received = response.headers.get('Range')
+                state['offset'] = int(received.rsplit('-', 1)[1]) + 1 if received else 0
+                return response.status, len(content), None
+
+        async def sendChunk():
+            try:
+                if state['offset'] is None:
+                    status, length, file = await put(b'', f"bytes */{size}")
+                    if file != None:
+                        return status, length, file
+                data = await asyncio.to_thread(readChunk, file_path, state['offset'], chunk_size)
+                end = state['offset'] + len(data) - 1
+                return await put(data, f"bytes {state['offset']}-{end}/{size}")
+            except BaseException:
+                state['offset'] = None
+                raise
+
+        while True:
+            if state['uri'] is None:
+                await self.call(method, startSession)
+            try:
+                file = await self.call(f"{method} (upload)", sendChunk)
+            except HttpError as error:
+                if error.resp.status not in (404, 410):
+                    raise
+                # The saved session has expired, start a new one
+                state['uri'] = None
+                continue
+            if file != None:
+                sessions.remove(key)
+                return file
+            sessions.put(key, stat, state['uri'], state['offset'])
+
+    async def downloadFile(self, file_id, path=None, chunk_size=None, file=None) -> str:
+        """Download a file from the drive straight to disk.
+
+        The content is written to `<path>.part` and moved to path once complete. An
+        interrupted download, including one retried after a dropped connection, carries
+        on from the end of the partial file, unless the file has changed in the drive since.
+
+        Args:
+            file_id: The ID of the file to download.
+            path: The local path to save the file to. By default, the name of the file in the drive is used.
+            chunk_size: The number of bytes written to disk at a time. (Default is 1MB)
+            file: The metadata of the file with its md5Checksum and modifiedTime, if already known. By default it is fetched.
+
+        Returns:
+            The path of the downloaded file.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        if(file == None):
+            file = await self.getFile(file_id, fields=DOWNLOAD_FIELDS)
+        if(path == None):
+            path = file['name']
+        await self.download('files.get (media)', f"files/{file_id}", {'alt': 'media'}, path, chunk_size, True, remoteVersion(file))
+        return path
+
+    async def exportFile(self, file_id, path=None, mime_type='application/pdf') -> str:
+        """Export a Google Workspace document and save it straight to disk.
+
+        Returns:
+            The path of the exported file.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        if(path == None):
+            path = (await self.getFile(file_id, fields='name'))['name']
+        await self.download('files.export', f"files/{file_id}/export", {'mimeType': mime_type}, path, None, False)
+        return path
+
+    async def download(self, method, path, params, local_path, chunk_size, resume, version=None):
+        url = f"{self.root_url}drive/v3/{path}"
+        part_path = local_path + '.part'
+        if resume:
+            # A partial file of another version of the remote file can't be carried on
+            if os.path.exists(part_path) and partialVersion(part_path) != version:
+                os.remove(part_path)
+            if not os.path.exists(part_path):
+                savePartialVersion(part_path, version)
+
+        async def send():
+            offset = os.path.getsize(part_path) if resume and os.path.exists(part_path) else 0
+            headers = await self.authorization()
+            if offset:
+                headers['Range'] = f"bytes={offset}-"
+            async with self.session.get(url, params=params, headers=headers) as response:
+                if response.status == 416 and offset:
+                    # The partial file doesn't fit the remote file any more, start over
+                    os.remove(part_path)
+                    return await send()
+                if response.status >= 300:
+                    raise httpError(response, await response.read(), url)
+                received = 0
+                with open(part_path, 'ab' if response.status == 206 else 'wb') as f:
+                    async for chunk in response.content.iter_chunked(chunk_size or READ_SIZE):
+                        f.write(chunk)
+                        received += len(chunk)
+                return response.status, received, None
+        await self.call(method, send)
+        os.replace(part_path, local_path)
+        if resume:
+            savePartialVersion(part_path, None)
+
+    async def moveFile(self, file_id, folder_id='root'):
+        """Move a file in the drive by changing the parent.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        file = await self.getFile(file_id, fields='parents')
+        return await self.request('files.update', 'PATCH', f"files/{file_id}", {
+            'addParents': folder_id, 'removeParents': ",".join(file.get('parents', [])), 'fields': 'id, parents'}, {})
+
+    def moveFiles(self, file_ids, folder_id='root'):
+        """Move many files into a folder concurrently.
+
+        Yields:
+            A tuple of (file ID, response, error) for each file as it finishes. Error is None if the file was moved.
+        """
+        return self.each(self.moveFile, file_ids, folder_id)
+
+    async def copyFile(self, file_id, folder_id=None, name=None):
+        """Copy a file, optionally changing the name and parent folder. Folders cannot be copied.
+
+        Returns:
+            The new copy.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        metadata = {}
+        if name != None:
+            metadata['name'] = name
+        if folder_id != None:
+            metadata['parents'] = [folder_id]
+        return await self.request('files.copy', 'POST', f"files/{file_id}/copy", {'fields': 'id, name'}, metadata)
+
+    def copyFiles(self, file_ids, folder_id=None, name=None):
+        """Copy many files concurrently.
+
+        Yields:
+            A tuple of (file ID, copy, error) for each file as it finishes. Error is None if the file was copied.
+        """
+        return self.each(self.copyFile, file_ids, folder_id, name)
+
+    async def addShortcut(self, file_id, folder_id=None):
+        """Create a shortcut to a file, in the same folder as the file unless folder_id is given.
+
+        Returns:
+            The ID of the shortcut.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        file = await self.getFile(file_id, fields="name" if folder_id else "name, parents")
+        if(folder_id == None):
+            folder_id = file.get('parents')[0]
+        shortcut = await self.request('files.create', 'POST', 'files', {'fields': 'id'}, {
+            'name': 'Shortcut to %s' % file.get('name'), 'mimeType': 'application/vnd.google-apps.shortcut',
+            'parents': [folder_id], 'shortcutDetails': {'targetId': file_id}})
+        return shortcut['id']
+
+    async def updateMetadata(self, file_id, metadata):
+        return await self.request('files.update', 'PATCH', f"files/{file_id}", {'fields': 'id'}, metadata)
+
+    async def lockFile(self, file_id, reason="No reason given"):
+        """Lock a file and make it read-only.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        return await self.updateMetadata(file_id, {"contentRestrictions": [{"readOnly": "true", "reason": reason}]})
+
+    def lockFiles(self, file_ids, reason="No reason given"):
+        """Lock many files concurrently, yielding (file ID, response, error) for each."""
+        return self.each(self.lockFile, file_ids, reason)
+
+    async def unlockFile(self, file_id):
+        """Unlock a file.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        return await self.updateMetadata(file_id, {"contentRestrictions": [{"readOnly": "false"}]})
+
+    def unlockFiles(self, file_ids):
+        """Unlock many files concurrently, yielding (file ID, response, error) for each."""
+        return self.each(self.unlockFile, file_ids)
+
+    async def trashFile(self, file_id):
+        """Mark a file as trash.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        return await self.updateMetadata(file_id, {"trashed": "true"})
+
+    def trashFiles(self, file_ids):
+        """Trash many files concurrently, yielding (file ID, response, error) for each."""
+        return self.each(self.trashFile, file_ids)
+
+    async def restoreFile(self, file_id):
+        """Restore a file from trash.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        return await self.updateMetadata(file_id, {"trashed": "false"})
+
+    def restoreFiles(self, file_ids):
+        """Restore many files concurrently, yielding (file ID, response, error) for each."""
+        return self.each(self.restoreFile, file_ids)
+
+    async def emptyTrash(self):
+        """Permanently deletes all items marked as trash.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        await self.request('files.emptyTrash', 'DELETE', 'files/trash')
+
+    async def getStartPageToken(self) -> str:
+        """Get a page token for the changes feed, marking the current state of the drive.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        return (await self.request('changes.getStartPageToken', 'GET', 'changes/startPageToken'))['startPageToken']
+
+    async def getChanges(self, page_token, fields="fileId, removed, file(id, name, mimeType, parents, trashed)"):
+        """Get every change made to the drive since a page token.
+
+        Returns:
+            A tuple of the list of changes and the page token to get later changes from.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        changes = []
+        while True:
+            results = await self.request('changes.list', 'GET', 'changes', {
+                'pageToken': page_token, 'pageSize': PAGE_SIZE,
+                'fields': f"nextPageToken, newStartPageToken, changes({fields})"})
+            changes.extend(results.get('changes', []))
+            if 'newStartPageToken' in results:
+                return changes, results['newStartPageToken']
+            page_token = results['nextPageToken']
@@ -0,0 +1,168 @@
+import sys
+import threading
+import time
+from collections import Counter
+
+from api import BATCH_SIZE
+from bulk import FOLDER_MIME_TYPE
+
+PERMISSION_FIELDS = "id, type, role, emailAddress, domain, allowFileDiscovery"
+# Permissions are asked for inline, but Drive only includes them for files the user can share outside shared drives
+AUDIT_FILE_FIELDS = f"id, name, mimeType, shared, owners(emailAddress), permissions({PERMISSION_FIELDS})"
+AUDIT_FIELDS = "path, id, owner, anyone, discoverable, external, domains, permissions"
+TOP_DOMAINS = 10  # External domains listed in the summary
+
+
+def emailDomain(email) -> str:
+    return email.rsplit('@', 1)[-1].lower() if email and '@' in email else ''
+
+
+class AuditStats:
+    """Thread-safe counters of the files audited and how they are shared."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = 0
+        self.shared = 0
+        self.anyone = 0  # Shared with anyone with the link
+        self.discoverable = 0  # Shared with anyone, and findable by searching
+        self.external = 0  # Shared with users, groups or domains outside the organisation
+        self.domains = Counter()  # Files shared with each external domain
+        self.inline = 0  # Files whose permissions came with the listing
+        self.fetched = 0  # Files whose permissions were listed with batched requests
+        self.failed = 0
+        self.start = time.monotonic()
+
+    def add(self, record, inline):
+        with self.lock:
+            self.files += 1
+            if inline:
+                self.inline += 1
+            else:
+                self.fetched += 1
+            if record['permissions'] > 1:
+                self.shared += 1
+            if record['anyone']:
+                self.anyone += 1
+            if record['discoverable']:
+                self.discoverable += 1
+            if record['external'] or record['domains']:
+                self.external += 1
+            self.domains.update(record['domains'])
+
+    def fail(self):
+        with self.lock:
+            self.failed += 1
+
+    def summary(self) -> str:
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        summary = (f"Audited {self.files} files in {elapsed:.1f}s, {self.files / elapsed:.0f} files/s. {self.shared} shared, "
+                   f"{self.anyone} with anyone with the link ({self.discoverable} discoverable), "
+                   f"{self.external} outside the domain. Permissions of {self.inline} files came with the listing, "
+                   f"{self.fetched} were listed in batches. {self.failed} failed.")
+        if self.domains:
+            top = ', '.join(f"{domain} ({files})" for domain, files in self.domains.most_common(TOP_DOMAINS))
+            summary += f"\nExternal domains: {top}"
+        return summary
+
+
+def auditRecord(file, path, permissions, domains=None) -> dict:
+    """Summarise who a file is shared with.
+
+    Args:
+        file: The file, with the AUDIT_FILE_FIELDS.
+        path: The path of the file in the audited folder.
+        permissions: The permissions of the file.
+        domains: The organisation's domains. Users, groups and domains outside them, other than the owner, are external. (Default is the domain of the file's owner)
+
+    Returns:
+        A dict of the path, id, owner, the role of anyone with the link, whether the file is discoverable, the
+        external email addresses and domains it is shared with, and the number of permissions.
+    """
+    owner = next((permission.get('emailAddress') for permission in permissions if permission.get('role') == 'owner'), None)
+    if owner is None:
+        owner = ((file.get('owners') or [{}])[0]).get('emailAddress')
+    internal = {domain.lower() for domain in domains} if domains else {emailDomain(owner)}
+    anyone = next((permission for permission in permissions if permission.get('type') == 'anyone'), None)
+    external = set()
+    external_domains = set()
+    for permission in permissions:
+        if permission.get('role') == 'owner':
+            continue
+        if permission.get('type') in ('user', 'group'):
+            domain = emailDomain(permission.get('emailAddress'))
+            if domain and domain not in internal:
+                external.add(permission['emailAddress'])
+                external_domains.add(domain)
+        elif permission.get('type') == 'domain' and permission.get('domain', '').lower() not in internal:
+            external_domains.add(permission['domain'].lower())
+    return {'path': path, 'id': file['id'], 'mimeType': file.get('mimeType'), 'owner': owner,
+            'anyone': anyone['role'] if anyone else None, 'discoverable': bool(anyone and anyone.get('allowFileDiscovery')),
+            'external': sorted(external), 'domains': sorted(external_domains), 'permissions': len(permissions)}
+
+
+def auditTree(pool, folder_id, name, stats, domains=None, maxdepth=None, walk_stats=None):
+    """Audit the sharing of every file and folder in a tree, streaming a record for each as it is found.
+
+    The tree is walked with the permissions of each file requested inline in the
+    listing. Drive leaves them out for files the user can't share and for files in
+    shared drives, so those are queued and their permissions listed with batched
+    permissions().list requests, several batches at once. Files which aren't shared
+    need no requests of their own.
+
+    Args:
+        pool: The WorkerPool to walk the tree and list permissions with.
+        folder_id: The ID of the folder to audit.
+        name: The name of the folder, which starts the path of every record.
+        stats: The AuditStats to count the files in.
+        domains: The organisation's domains, see auditRecord.
+        maxdepth: The maximum depth to audit. If None is given, the whole tree is audited.
+        walk_stats: The WalkStats to record the folders listed in.
+
+    Yields:
+        The record of each file, from auditRecord, roughly in the order they are found.
+    """
+    from walk import walkTree
+
+    def audit(api, chunk):
+        inline, files = chunk
+        if inline:
+            permissions = {file['id']: (file.get('permissions', []), None) for path, file in files}
+        else:
+            permissions = {file_id: (found, error) for file_id, found, error
+                           in api.listPermissions((file['id'] for path, file in files), PERMISSION_FIELDS)}
+        return [(path, file, *permissions[file['id']]) for path, file in files]
+
+    def chunks():
+        paths = {folder_id: name}  # The path of each folder found
+        inline, fetch = [], []
+        for parent, depth, file in walkTree(pool, folder_id, AUDIT_FILE_FIELDS, maxdepth, walk_stats):
+            path = f"{paths[parent]}/{file['name']}"
+            if file['mimeType'] == FOLDER_MIME_TYPE:
+                paths[file['id']] = path
+            if 'permissions' in file or file.get('shared') is False:
+                inline.append((path, file))
+                if len(inline) == BATCH_SIZE:
+                    yield True, inline
+                    inline = []
+            else:
+                fetch.append((path, file))
+                if len(fetch) == BATCH_SIZE:
+                    yield False, fetch
+                    fetch = []
+        if inline:
+            yield True, inline
+        if fetch:
+            yield False, fetch
+
+    for (inline, files), results, error in pool.run(audit, chunks()):
+        if error:
+            results = [(path, file, None, error) for path, file in files]
+        for path, file, permissions, error in results:
+            if error:
+                stats.fail()
+                print(f"Failed to list the permissions of {path} ({file['id']}): {error}", file=sys.stderr)
+                continue
+            record = auditRecord(file, path, permissions, domains)
+            stats.add(record, inline)
+            yield record
@@ -0,0 +1,550 @@
+import os
+from datetime import datetime
+from os.path import basename, getsize, isfile, join, normpath, splitext
+
+from googleapiclient.errors import HttpError
+
+from api import BATCH_SIZE, DOWNLOAD_FIELDS, chunked
+from errors import CopyIntoItselfError
+from hashing import localMd5
+from mime import detectMimeType
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+GOOGLE_APPS_PREFIX = 'application/vnd.google-apps.'
+EXPORT_FIELDS = "id, name, mimeType, modifiedTime"
+DEFAULT_EXPORT_FORMAT = 'pdf'
+
+# The formats each type of Google Workspace document can be exported to, by file extension
+EXPORT_FORMATS = {
+    'application/vnd.google-apps.document': {
+        'pdf': 'application/pdf',
+        'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        'odt': 'application/vnd.oasis.opendocument.text',
+        'rtf': 'application/rtf',
+        'txt': 'text/plain',
+        'epub': 'application/epub+zip',
+    },
+    'application/vnd.google-apps.spreadsheet': {
+        'pdf': 'application/pdf',
+        'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'ods': 'application/vnd.oasis.opendocument.spreadsheet',
+        'csv': 'text/csv',
+        'tsv': 'text/tab-separated-values',
+    },
+    'application/vnd.google-apps.presentation': {
+        'pdf': 'application/pdf',
+        'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+        'odp': 'application/vnd.oasis.opendocument.presentation',
+    },
+    'application/vnd.google-apps.drawing': {
+        'pdf': 'application/pdf',
+        'png': 'image/png',
+        'jpg': 'image/jpeg',
+        'svg': 'image/svg+xml',
+    },
+    'application/vnd.google-apps.script': {
+        'json': 'application/vnd.google-apps.script+json',
+    },
+}
+
+
+def localName(name) -> str:
+    """Make a Drive file name safe to use as a local file name."""
+    return name.replace('/', '_') or '_'
+
+
+def claimPath(claimed, path, file_id, extension=True) -> str:
+    """Claim a local path for a file, giving it a path of its own if another file already has it.
+
+    Drive allows several files with the same name in a folder. The first file to claim
+    a path gets it, and later ones have their ID added before the extension, eg.
+    "report (1AbC).pdf", so no two files are downloaded to the same path.
+
+    Args:
+        claimed: A dict of each claimed path to the ID of the file which claimed it. It is updated with the path returned.
+        path: The local path made from the file's name.
+        file_id: The ID of the file.
+        extension: Whether the name ends with an extension to keep after the ID. Folders and
+            Google Workspace documents, which are exported with an extension added later, have none.
+
+    Returns:
+        The local path of the file.
+    """
+    owner = claimed.setdefault(path, file_id)
+    if owner == file_id:
+        return path
+    root, ext = splitext(path) if extension else (path, '')
+    path = f"{root} ({file_id}){ext}"
+    claimed[path] = file_id
+    return path
+
+
+def remoteTime(modified_time) -> float:
+    """Convert a Drive modifiedTime to a timestamp comparable with local mtimes."""
+    return datetime.fromisoformat(modified_time.replace('Z', '+00:00')).timestamp()
+
+
+def isDownloadable(file) -> bool:
+    """Google Workspace documents, folders and shortcuts have no content to download."""
+    return not file['mimeType'].startswith(GOOGLE_APPS_PREFIX)
+
+
+def walkFolder(pool, folder_id, path, fields=DOWNLOAD_FIELDS):
+    """Walk a folder tree in the drive, recreating its folders locally.
+
+    The folders of each level are listed concurrently, and files are yielded as soon
+    as the folder they are in has been listed.
+
+    Args:
+        pool: The WorkerPool used to list the folders.
+        folder_id: The ID of the folder to walk.
+        path: The local directory matching the folder.
+        fields: The field mask applied to each file. It must include id, name and mimeType.
+
+    Yields:
+        A tuple of (file, local path) for every file in the tree which is not a folder. Files
+        and folders sharing a name with an earlier one in the same folder get a path of their own, see claimPath.
+    """
+    from walk import walkTree
+    os.makedirs(path, exist_ok=True)
+    paths = {folder_id: path}
+    claimed = {}
+    for parent_id, depth, file in walkTree(pool, folder_id, fields=fields):
+        target = claimPath(claimed, join(paths[parent_id], localName(file['name'])), file['id'], isDownloadable(file))
+        if file['mimeType'] == FOLDER_MIME_TYPE:
+            paths[file['id']] = target
+            os.makedirs(target, exist_ok=True)
+        else:
+            yield file, target
+
+
+def fetchFile(api, file, path):
+    """Download a single file unless it can't be or it already exists locally with the same content.
+
+    Returns:
+        The size of the downloaded file, or None if it was skipped.
+    """
+    if not isDownloadable(file):
+        return None
+    if isfile(path) and isUnchanged(file, path):
+        return None
+    api.downloadFile(file['id'], path, progress=False, file=file)
+    return getsize(path)
+
+
+def report(results, stats):
+    """Print the outcome of each (label, result, error) as it finishes and record it in stats.
+
+    Results are the size of a transferred file, or None if it was skipped.
+    """
+    for label, size, error in results:
+        if error:
+            stats.fail()
+            print(f"Failed {label}: {error}")
+        elif size is None:
+            stats.skip()
+        else:
+            stats.add(size)
+            print(f"{stats.progress()} {label}")
+
+
+def downloadAll(pool, files, stats):
+    """Download files concurrently, printing progress as each one finishes.
+
+    Files which already exist locally with the same size and md5Checksum are skipped, so
+    an interrupted run can be repeated to fetch only what is missing or changed.
+
+    Args:
+        pool: The WorkerPool to download with.
+        files: An iterable of (file, local path) tuples. Each file needs the DOWNLOAD_FIELDS.
+        stats: The TransferStats to record progress in.
+    """
+    def download(api, item):
+        file, path = item
+        return fetchFile(api, file, path)
+
+    results = pool.run(download, files)
+    report(((path, size, error) for (file, path), size, error in results), stats)
+
+
+def downloadFiles(pool, file_ids, directory, stats):
+    """Download files by ID into a local directory concurrently.
+
+    The metadata of the files is fetched with batched requests first, so files with
+    the same name can be given paths of their own before any is downloaded.
+
+    Args:
+        pool: The WorkerPool to download with.
+        file_ids: The IDs of the files to download.
+        directory: The local directory to save the files in.
+        stats: The TransferStats to record progress in.
+    """
+    os.makedirs(directory, exist_ok=True)
+    api = pool.api()
+    claimed = {}
+
+    def files():
+        for file_id, file, error in api.getFiles(file_ids, fields=DOWNLOAD_FIELDS):
+            if error:
+                stats.fail()
+                print(f"Failed {file_id}: {error}")
+            else:
+                yield file, claimPath(claimed, join(directory, localName(file['name'])), file['id'])
+
+    downloadAll(pool, files(), stats)
+
+
+def exportFormats(formats=()) -> dict:
+    """Choose the format each type of Google Workspace document is exported to.
+
+    Every type which can be exported to PDF is by default. Each given format is then
+    used for every type which supports it, so later formats override earlier ones,
+    eg. ['docx', 'csv'] exports documents to docx, spreadsheets to csv and
+    presentations and drawings to PDF.
+
+    Args:
+        formats: File extensions from EXPORT_FORMATS.
+
+    Returns:
+        A dict of Workspace MIME type to a tuple of (file extension, export MIME type).
+
+    Raises:
+        ValueError: A format isn't supported by any type of document.
+    """
+    chosen = {mime_type: (DEFAULT_EXPORT_FORMAT, supported[DEFAULT_EXPORT_FORMAT])
+              for mime_type, supported in EXPORT_FORMATS.items() if DEFAULT_EXPORT_FORMAT in supported}
+    for format in formats:
+        matches = [mime_type for mime_type, supported in EXPORT_FORMATS.items() if format in supported]
+        if not matches:
+            raise ValueError(f"Unsupported export format {format}.")
+        for mime_type in matches:
+            chosen[mime_type] = (format, EXPORT_FORMATS[mime_type][format])
+    return chosen
+
+
+def isExported(file, path) -> bool:
+    """Check whether a document was exported to path since it was last modified, by the mtime exportDocument sets."""
+    try:
+        return abs(os.path.getmtime(path) - remoteTime(file['modifiedTime'])) < 0.001
+    except OSError:
+        return False
+
+
+def exportDocument(api, file, path, formats, chunk_size=None):
+    """Export a single Google Workspace document unless it can't be or is unchanged since it was last exported.
+
+    The export is saved to path with the extension of its format, and given the
+    document's modifiedTime as its mtime.
+
+    Returns:
+        The size of the exported file, or None if it was skipped.
+    """
+    format = formats.get(file['mimeType'])
+    if format is None:
+        return None  # Folders, forms, shortcuts and files with content of their own
+    path = f"{path}.{format[0]}"
+    if isExported(file, path):
+        return None
+    api.exportFile(file['id'], path, chunk_size, format[1])
+    modified = remoteTime(file['modifiedTime'])
+    os.utime(path, (modified, modified))
+    return getsize(path)
+
+
+def exportAll(pool, files, formats, stats):
+    """Export documents concurrently, streaming each one to disk and printing progress as each one finishes.
+
+    Files which can't be exported to any of the formats are skipped without a request,
+    as are documents whose export already has the document's modifiedTime.
+
+    Args:
+        pool: The WorkerPool to export with.
+        files: An iterable of (file, local path without an extension) tuples. Each file needs the EXPORT_FIELDS.
+        formats: The formats to export to, from exportFormats().
+        stats: The TransferStats to record progress in.
+    """
+    def export(api, item):
+        file, path = item
+        return exportDocument(api, file, path, formats)
+
+    results = pool.run(export, files)
+    report(((path, size, error) for (file, path), size, error in results), stats)
+
+
+def exportFiles(pool, file_ids, directory, formats, stats):
+    """Export documents by ID into a local directory concurrently.
+
+    The metadata of the documents is fetched with batched requests first.
+
+    Args:
+        pool: The WorkerPool to export with.
+        file_ids: The IDs of the documents to export.
+        directory: The local directory to save the exports in.
+        formats: The formats to export to, from exportFormats().
+        stats: The TransferStats to record progress in.
+    """
+    os.makedirs(directory, exist_ok=True)
+    api = pool.api()
+    claimed = {}
+
+    def files():
+        for file_id, file, error in api.getFiles(file_ids, fields=EXPORT_FIELDS):
+            if error:
+                stats.fail()
+                print(f"Failed {file_id}: {error}")
+            else:
+                yield file, claimPath(claimed, join(directory, localName(file['name'])), file['id'], extension=False)
+
+    exportAll(pool, files(), formats, stats)
+
+
+def localLevels(path, maxdepth=None) -> list:
+    """List the folders of a local tree breadth-first.
+
+    Returns:
+        A list of the folders at each depth, each a tuple of (local path, local path of its parent), with None for the parent of path.
+    """
+    levels = []
+    level = [(path, None)]
+    depth = 0
+    while level:
+        levels.append(level)
+        if maxdepth != None and depth >= maxdepth:
+            break
+        level = [(entry.path, directory) for directory, parent in level for entry in os.scandir(directory) if entry.is_dir()]
+        depth += 1
+    return levels
+
+
+def createFolderTree(pool, path, folder_id, maxdepth=None, skip_unchanged=False):
+    """Recreate a local folder tree in the drive, one level at a time.
+
+    New trees are planned up front: an ID is reserved with generateIds for every
+    folder, so the folders at each depth are created with batched requests which
+    already name their parents, without waiting on the response for any one folder.
+    Drive needs a folder's parent to exist first, so each depth is sent once the
+    one above it has been created. A create retried after its response was lost
+    fails with a 409, as the folder already has its ID, and counts as created.
+
+    With skip_unchanged, the folders which already exist have to be looked up first,
+    so all of the folders at a depth are created or found concurrently, one request each.
+
+    Files are yielded as soon as the folder they belong in has been created, so they
+    can be uploaded while deeper folders are still being created.
+
+    Args:
+        pool: The WorkerPool to create folders with.
+        path: The local folder to recreate.
+        folder_id: The ID of the folder to create the tree in.
+        maxdepth: The maximum depth to traverse. Folders at this depth are created empty. If None is given, the whole tree is created.
+        skip_unchanged: A flag to reuse folders which already exist with the same name, and to look up the files already in them.
+
+    Yields:
+        A tuple of (local path, parent folder ID, existing file) for every file to upload. The existing file is None unless skip_unchanged is set and a file with the same name is already in the folder.
+    """
+    if not skip_unchanged:
+        yield from createNewFolderTree(pool, path, folder_id, maxdepth)
+        return
+
+    def create(api, item):
+        directory, parent_id, depth, existing = item
+        name = basename(normpath(directory))
+        if depth == 0:
+            existing = next((file for file in api.iterSearch(name, folder_id=parent_id, match=True, fields="id, mimeType")
+                             if file['mimeType'] == FOLDER_MIME_TYPE), None)
+        if existing is None:
+            return api.createFolder(name, parent_id), {}, "Created"
+        children = api.iterFiles(folder_id=existing['id'], fields="id, name, mimeType, size, md5Checksum")
+        return existing['id'], {file['name']: file for file in children}, "Found"
+
+    level = [(path, folder_id, 0, None)]
+    while level:
+        next_level = []
+        for (directory, parent_id, depth, existing), result, error in pool.run(create, level):
+            if error:
+                print(f"Failed to create {directory}, skipping its contents: {error}")
+                continue
+            id, children, outcome = result
+            print(f"{outcome} folder {directory}")
+            if maxdepth != None and depth >= maxdepth:
+                continue
+            for entry in os.scandir(directory):
+                remote = children.get(entry.name)
+                if entry.is_dir():
+                    is_folder = remote != None and remote['mimeType'] == FOLDER_MIME_TYPE
+                    next_level.append((entry.path, id, depth + 1, remote if is_folder else None))
+                elif entry.is_file():
+                    is_file = remote != None and remote['mimeType'] != FOLDER_MIME_TYPE
+                    yield entry.path, id, remote if is_file else None
+        level = next_level
+
+
+def alreadyCreated(error) -> bool:
+    """Check whether creating a file with a reserved ID failed because an earlier attempt succeeded."""
+    return isinstance(error, HttpError) and error.resp.status == 409
+
+
+def createNewFolderTree(pool, path, folder_id, maxdepth=None):
+    """Create every folder of a local tree in the drive with reserved IDs and batched requests. See createFolderTree."""
+    levels = localLevels(path, maxdepth)
+    ids = dict(zip((directory for level in levels for directory, parent in level),
+                   pool.api().generateIds(sum(len(level) for level in levels))))
+    ids[None] = folder_id
+
+    def createFolders(api, chunk):
+        responses = [*api.executeBatch((directory, api.createFolderRequest(basename(normpath(directory)), ids[parent], ids[directory]))
+                                       for directory, parent in chunk)]
+        for (directory, parent), (key, response, error) in zip(chunk, responses):
+            if error is None or alreadyCreated(error):
+                api.invalidate(ids[directory], ids[parent])
+        return responses
+
+    created = {None}
+    for depth, level in enumerate(levels):
+        # Folders whose parent couldn't be created are skipped with everything in them
+        level = [(directory, parent) for directory, parent in level if parent in created]
+        for chunk, responses, error in pool.run(createFolders, chunked(level, BATCH_SIZE)):
+            if error:
+                responses = [(directory, None, error) for directory, parent in chunk]
+            for directory, response, error in responses:
+                if error and not alreadyCreated(error):
+                    print(f"Failed to create {directory}, skipping its contents: {error}")
+                    continue
+                created.add(directory)
+                print(f"Created folder {directory}")
+                if maxdepth != None and depth >= maxdepth:
+                    continue
+                for entry in os.scandir(directory):
+                    if entry.is_file():
+                        yield entry.path, ids[directory], None
+
+
+def isUnchanged(file, path) -> bool:
+    """Check whether a file in the drive has the same content as a local file, only hashing it if the sizes match."""
+    return int(file.get('size', -1)) == getsize(path) and file.get('md5Checksum') == localMd5(path)
+
+
+def uploadAll(pool, files, stats):
+    """Upload files concurrently, printing progress as each one finishes.
+
+    Files which already exist in the drive are only updated if their content differs.
+
+    Args:
+        pool: The WorkerPool to upload with.
+        files: An iterable of (local path, parent folder ID, existing file) tuples. Existing file is None for new files.
+        stats: The TransferStats to record progress in.
+    """
+    def upload(api, item):
+        path, parent_id, existing = item
+        if existing is None:
+            api.uploadFile(basename(path), path, detectMimeType(path), parent_id, progress=False)
+        elif isUnchanged(existing, path):
+            return None
+        else:
+            api.updateFile(existing['id'], basename(path), path, detectMimeType(path), progress=False)
+        return getsize(path)
+
+    results = pool.run(upload, files)
+    report(((item[0], size, error) for item, size, error in results), stats)
+
+
+def isInside(api, file_id, folder_id) -> bool:
+    """Check whether a file is a folder or anywhere below it, by following the file's parents up to the root."""
+    seen = set()
+    while file_id not in seen:
+        if file_id == folder_id:
+            return True
+        seen.add(file_id)
+        parents = api.getFile(file_id, fields="id, parents").get('parents')
+        if not parents:
+            return False
+        file_id = parents[0]
+    return False
+
+
+def copyFolderTree(pool, folder_id, parent_id, name, stats, maxdepth=None) -> str:
+    """Copy a folder tree in the drive server-side, without downloading or uploading any content.
+
+    The source tree is walked one level at a time. Once a level has been listed, the
+    copies of its folders are created with batched requests, and its files are copied
+    into their new folders with batched files().copy requests, several batches at once.
+    Files in folders which couldn't be created are counted as failed.
+
+    Args:
+        pool: The WorkerPool to list, create and copy with. Its number of jobs is the number of batches sent at once.
+        folder_id: The ID of the folder to copy.
+        parent_id: The ID of the folder to create the copy in.
+        name: The name of the copy.
+        stats: The TransferStats to record the copied files in, with the sizes of the originals.
+        maxdepth: The maximum depth to copy. Folders at this depth are created empty. If None is given, the whole tree is copied.
+
+    Returns:
+        The ID of the copy.
+
+    Raises:
+        CopyIntoItselfError: The parent is the folder or one of its subfolders, so the copy would never end.
+    """
+    from walk import fileSize, walkTree
+    if isInside(pool.api(), parent_id, folder_id):
+        raise CopyIntoItselfError
+    copies = {folder_id: pool.api().createFolder(name, parent_id)}  # The ID of the copy of each folder
+
+    def created(api, chunk, responses):
+        """Drop the copies of a chunk, and the folders they were created in, from the cache."""
+        for (parent, file), (file_id, response, error) in zip(chunk, responses):
+            if error == None:
+                api.invalidate(response['id'], copies[parent])
+        return responses
+
+    def createFolders(api, chunk):
+        return created(api, chunk, [*api.executeBatch((file['id'], api.createFolderRequest(file['name'], copies[parent]))
+                                                      for parent, file in chunk)])
+
+    def copyFiles(api, chunk):
+        return created(api, chunk, [*api.executeBatch((file['id'], api.copyRequest(file['id'], copies[parent], file['name']))
+                                                      for parent, file in chunk)])
+
+    def results(chunk, responses, error):
+        """Pair each (parent, file) of a chunk with its response and error, failing them all if the batch failed."""
+        if error:
+            responses = [(file['id'], None, error) for parent, file in chunk]
+        for (parent, file), (file_id, response, error) in zip(chunk, responses):
+            yield file, response, error
+
+    def createLevel(folders):
+        for chunk, responses, error in pool.run(createFolders, chunked(folders, BATCH_SIZE)):
+            for file, folder, error in results(chunk, responses, error):
+                if error:
+                    print(f"Failed to create folder {file['name']}, skipping its contents: {error}")
+                else:
+                    copies[file['id']] = folder['id']
+
+    def batches():
+        folders, files, level = [], [], 1
+        for parent, depth, file in walkTree(pool, folder_id, "id, name, mimeType, size, quotaBytesUsed", maxdepth):
+            if depth != level:
+                createLevel(folders)  # The parents of this level
+                folders, level = [], depth
+            if parent not in copies:
+                if file['mimeType'] != FOLDER_MIME_TYPE:
+                    stats.fail()
+            elif file['mimeType'] == FOLDER_MIME_TYPE:
+                folders.append((parent, file))
+            else:
+                files.append((parent, file))
+                if len(files) == BATCH_SIZE:
+                    yield files
+                    files = []
+        createLevel(folders)
+        if files:
+            yield files
+
+    for chunk, responses, error in pool.run(copyFiles, batches()):
+        for file, copy, error in results(chunk, responses, error):
+            if error:
+                stats.fail()
+                print(f"Failed {file['name']} ({file['id']}): {error}")
+            else:
+                stats.add(fileSize(file))
+        print(f"{stats.progress()} copied {len(chunk)} files")
+    return copies[folder_id]
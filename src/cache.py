@@ -0,0 +1,169 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'google-drive-cli')
+DEFAULT_TTL = 10 * 60
+DEFAULT_MAX_ENTRIES = 200000
+EVICT_EVERY = 1000  # Number of writes between checks of the cache size
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (id TEXT, fields TEXT, data TEXT, fetched REAL, PRIMARY KEY (id, fields));
+CREATE TABLE IF NOT EXISTS children (parent TEXT, child TEXT, PRIMARY KEY (parent, child));
+CREATE INDEX IF NOT EXISTS children_child ON children (child);
+CREATE TABLE IF NOT EXISTS listings (query TEXT, fields TEXT, folder TEXT, data TEXT, size INTEGER, fetched REAL,
+                                     PRIMARY KEY (query, fields));
+CREATE INDEX IF NOT EXISTS listings_folder ON listings (folder);
+"""
+
+
+class MetadataCache:
+    """An on-disk cache of file metadata and folder listings, stored in SQLite.
+
+    Files are keyed by their ID and the field mask they were fetched with, and
+    listings by their query and field mask. Entries older than ttl seconds are
+    ignored, and the oldest entries are evicted once there are more than
+    max_entries files and listed items in total.
+
+    A parent to children index records which folders each file is in, so that
+    changing a file drops the cached listings of every folder it appears in.
+
+    Each thread uses its own connection, so one cache can be shared by a WorkerPool.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, refresh=False):
+        """Open a cache, evicting any stale entries left by earlier runs.
+
+        Args:
+            path: The path of the SQLite database. (Default is metadata.sqlite in the cache directory)
+            ttl: The number of seconds an entry is used for.
+            max_entries: The number of files and listed items to keep before evicting the oldest.
+            refresh: A flag to ignore cached entries but still store fresh results.
+        """
+        self.path = path or os.path.join(CACHE_DIR, 'metadata.sqlite')
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.refresh = refresh
+        self.local = threading.local()
+        self.writes = 0
+        self.evict()
+
+    def connection(self):
+        if not hasattr(self.local, 'connection'):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            self.local.connection = connection
+        return self.local.connection
+
+    def fresh(self) -> float:
+        """The oldest fetch time still considered fresh."""
+        return time.time() - self.ttl
+
+    def getFile(self, file_id, fields):
+        """Get cached metadata of a file, or None if it isn't cached."""
+        if self.refresh:
+            return None
+        row = self.connection().execute(
+            "SELECT data FROM files WHERE id = ? AND fields = ? AND fetched > ?",
+            (file_id, fields or '', self.fresh())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def putFile(self, file_id, fields, file):
+        with self.connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                               (file_id, fields or '', json.dumps(file), time.time()))
+            self.index(connection, file)
+        self.wrote()
+
+    def getListing(self, query, fields):
+        """Get the cached files found by a listing, or None if it isn't cached."""
+        if self.refresh:
+            return None
+        row = self.connection().execute(
+            "SELECT data FROM listings WHERE query IS ? AND fields = ? AND fetched > ?",
+            (query, fields, self.fresh())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def putListing(self, query, fields, folder_id, files):
+        """Store the complete results of a listing.
+
+        Args:
+            query: The query of the listing.
+            fields: The field mask of the listing.
+            folder_id: The folder the listing is within, or None for listings across the whole drive.
+            files: Every file found by the listing.
+        """
+        with self.connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?, ?)",
+                               (query, fields, folder_id, json.dumps(files), len(files), time.time()))
+            if folder_id != None:
+                connection.executemany("INSERT OR IGNORE INTO children VALUES (?, ?)",
+                                       ((folder_id, file['id']) for file in files if 'id' in file))
+            for file in files:
+                self.index(connection, file)
+        self.wrote(len(files))
+
+    @staticmethod
+    def index(connection, file):
+        if 'id' in file and file.get('parents'):
+            connection.executemany("INSERT OR IGNORE INTO children VALUES (?, ?)",
+                                   ((parent, file['id']) for parent in file['parents']))
+
+    def invalidate(self, file_id, *folder_ids):
+        """Forget a file which has been changed, and every listing it could have appeared in.
+
+        Args:
+            file_id: The ID of the changed file.
+            folder_ids: Any folders the file has been added to.
+        """
+        with self.connection() as connection:
+            parents = [row[0] for row in connection.execute("SELECT parent FROM children WHERE child = ?", (file_id,))]
+            folders = {file_id, *parents, *folder_ids}
+            connection.execute("DELETE FROM files WHERE id = ?", (file_id,))
+            connection.execute("DELETE FROM children WHERE child = ?", (file_id,))
+            connection.execute("DELETE FROM listings WHERE folder IS NULL")
+            connection.executemany("DELETE FROM listings WHERE folder = ?", ((folder,) for folder in folders))
+
+    def clear(self):
+        with self.connection() as connection:
+            connection.execute("DELETE FROM files")
+            connection.execute("DELETE FROM children")
+            connection.execute("DELETE FROM listings")
+
+    def wrote(self, entries=1):
+        self.writes += entries
+        if self.writes >= EVICT_EVERY:
+            self.writes = 0
+            self.evict()
+
+    def evict(self):
+        """Delete expired entries, then the oldest entries until the cache fits within max_entries."""
+        with self.connection() as connection:
+            expired = self.fresh()
+            connection.execute("DELETE FROM files WHERE fetched <= ?", (expired,))
+            connection.execute("DELETE FROM listings WHERE fetched <= ?", (expired,))
+            files, = connection.execute("SELECT count(*) FROM files").fetchone()
+            listed, = connection.execute("SELECT coalesce(sum(size), 0) FROM listings").fetchone()
+            excess = files + listed - self.max_entries
+            if excess > 0:
+                self.shrink(connection, excess)
+            # Only keep the parents of files which are still cached
+            connection.execute("""DELETE FROM children WHERE child NOT IN (SELECT id FROM files)
+                                  AND parent NOT IN (SELECT folder FROM listings WHERE folder IS NOT NULL)""")
+
+    @staticmethod
+    def shrink(connection, excess):
+        # Drop the oldest listings first since they hold the most entries each
+        for query, fields, size in connection.execute(
+                "SELECT query, fields, size FROM listings ORDER BY fetched").fetchall():
+            if excess <= 0:
+                break
+            connection.execute("DELETE FROM listings WHERE query IS ? AND fields = ?", (query, fields))
+            excess -= size
+        if excess > 0:
+            connection.execute("DELETE FROM files WHERE rowid IN (SELECT rowid FROM files ORDER BY fetched LIMIT ?)",
+                               (excess,))
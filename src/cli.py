@@ -1,39 +1,269 @@
 #!/usr/bin/env python3
 
-from argparse import ArgumentParser
-import mimetypes
-from errors import printHttpError, NotFolderError
-from re import sub
-import google_auth
-from api import API
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+from argparse import ArgumentParser, Namespace
 import os
-from os.path import isfile, join, basename, normpath
-import magic
+import sys
+import time
+from errors import describeHttpError, printHttpError, CopyIntoItselfError, NotFolderError, PathNotFoundError
+from api import API, BATCH_SIZE, PAGE_SIZE, chunked, filesQuery, searchQuery
+from mime import detectMimeType
+from workers import DEFAULT_JOBS, TransferStats, WorkerPool
+from executor import ExecutorStats, RequestExecutor
+from output import FORMATS, openWriter
+from googleapiclient.errors import HttpError
 
 SCOPES = ['https://www.googleapis.com/auth/drive']
 CLIENT_SECRET_FILE = "credentials.json"
 
-credentials = google_auth.Auth(CLIENT_SECRET_FILE, SCOPES).get_credentials()
+options = None  # The parsed command line, set before a subcommand runs
+credentials = None
+drive_service = None
+metadata_cache = None
+request_executor = None
+profiler = None
+warm_pools = None  # Worker pools kept between commands by a shell or daemon, by jobs and cache use
+path_resolver = None
+PATH_ARGUMENTS = ('fileId', 'folderId', 'parentId')  # Arguments taking IDs, which can be given as paths instead
+
+def getCredentials():
+    """Authenticate the first time credentials are needed."""
+    global credentials
+    if credentials is None:
+        start, started = time.time(), time.monotonic()
+        import google_auth
+        credentials = google_auth.Auth(CLIENT_SECRET_FILE, SCOPES).get_credentials()
+        getExecutor().record('auth', start, time.monotonic() - started)
+    return credentials
+
+def getService():
+    """Build the Drive service the first time it is needed."""
+    global drive_service
+    if drive_service is None:
+        drive_service = timedBuild()
+    return drive_service
+
+def timedBuild():
+    """Build a Drive service, recording the time taken by discovery."""
+    from discovery import buildService
+    credentials = getCredentials()
+    start, started = time.time(), time.monotonic()
+    service = buildService(credentials)
+    getExecutor().record('discovery', start, time.monotonic() - started)
+    return service
+
+def getCache():
+    """Open the metadata cache if it is enabled by --cache, --refresh or the GDRIVE_CLI_CACHE variable."""
+    global metadata_cache
+    if options is None or options.no_cache or not (
+            options.cache or options.refresh or os.environ.get('GDRIVE_CLI_CACHE')):
+        return None
+    from cache import DEFAULT_TTL, MetadataCache
+    if metadata_cache is None:
+        # Opening the cache evicts expired entries, so it needs the TTL of this command
+        metadata_cache = MetadataCache(ttl=options.ttl or DEFAULT_TTL, refresh=options.refresh)
+    # Applied on every use, since a shell or daemon keeps the cache open across commands with different options
+    metadata_cache.ttl = options.ttl or DEFAULT_TTL
+    metadata_cache.refresh = options.refresh
+    return metadata_cache
+
+def getExecutor():
+    """Create the executor shared by every API, limited to --rateLimit requests per second."""
+    global request_executor
+    if request_executor is None:
+        request_executor = RequestExecutor(options.rateLimit if options != None else None)
+    return request_executor
+
+def getApi():
+    return API(getService(), getCache(), getExecutor())
+
+def newApi():
+    """Create an API with its own service and HTTP connection, for use on another thread."""
+    return API(timedBuild(), getCache(), getExecutor())
+
+def getResolver():
+    """Create the path resolver the first time a path is given instead of an ID."""
+    global path_resolver
+    from paths import PathResolver
+    if path_resolver is None:
+        path_resolver = PathResolver(getApi())
+    path_resolver.api = getApi()
+    return path_resolver
+
+def resolvePaths(args):
+    """Replace any paths given in place of IDs, eg. /Projects/logo.png, with the IDs of their files.
+
+    Raises:
+        HttpError: An error occured in a request.
+        PathNotFoundError: There is no file at one of the paths.
+    """
+    from paths import isPath
+    values = {name: getattr(args, name) for name in PATH_ARGUMENTS if hasattr(args, name)}
+    paths = [item for value in values.values() for item in ([value] if isinstance(value, str) else value or [])
+             if isPath(item)]
+    if not paths:
+        return
+    ids = getResolver().resolveAll(paths)
+    for path in paths:
+        if path not in ids:
+            raise PathNotFoundError(path)
+    for name, value in values.items():
+        if isinstance(value, str):
+            setattr(args, name, ids.get(value, value))
+        elif value:
+            setattr(args, name, [ids.get(item, item) for item in value])
+
+def printStats():
+    """Print the request counters with --stats, or whenever requests were retried or throttled."""
+    if request_executor is None:
+        return
+    stats = request_executor.stats
+    if options.stats or stats.retried or stats.throttled:
+        print(stats.summary(), file=sys.stderr)
+    if options.stats:
+        print(stats.methodSummary(), file=sys.stderr)
+    if profiler != None:
+        print(profiler.summary(), file=sys.stderr)
+
+def getPool(args):
+    """Create a pool of --jobs workers, or reuse a warm one in a shell or daemon."""
+    if warm_pools is None:
+        return WorkerPool(newApi, args.jobs)
+    key = (args.jobs, getCache() != None)
+    if key not in warm_pools:
+        warm_pools[key] = WorkerPool(newApi, args.jobs, keep=True)
+    return warm_pools[key]
+
+def run(args) -> int:
+    """Run a parsed command line and return its exit status."""
+    global options, profiler
+    options = args
+    if args.subcommand is None:
+        cli.print_help()
+        return 0
+    executor = getExecutor()
+    executor.stats = ExecutorStats()  # Counted per command in a shell or daemon
+    tracer = profiler = None
+    hooks = []
+    if args.trace:
+        from profiling import Tracer
+        tracer = Tracer(args.trace)
+        hooks.append(tracer)
+    if args.profile:
+        from profiling import Profiler
+        profiler = Profiler()
+        hooks.append(profiler)
+    for hook in hooks:
+        executor.addHook(hook)
+    if path_resolver != None and getCache() is None:
+        path_resolver.clear()  # Only remembered between commands while metadata is cached, as the drive may have changed
+    try:
+        try:
+            resolvePaths(args)
+        except PathNotFoundError as error:
+            print(error, file=sys.stderr)
+            return 1
+        except HttpError as error:
+            printHttpError(error)
+            return 1
+        args.func(args)
+    finally:
+        printStats()
+        for hook in hooks:
+            executor.hooks.remove(hook)
+        if tracer != None:
+            tracer.close()
+    return 0
+
+def runLine(argv, defaults=None) -> int:
+    """Parse and run one command line in a shell or daemon, keeping the client warm between commands.
+
+    Args:
+        argv: The command line arguments, without the program name.
+        defaults: The parsed options the shell or daemon was started with, used for any not given in argv.
 
-drive_service = build('drive', 'v3', credentials=credentials)
+    Returns:
+        The exit status of the command.
+    """
+    try:
+        args = cli.parse_args(argv, Namespace(**vars(defaults)) if defaults else None)
+    except SystemExit as exit:
+        return exit.code or 0
+    if args.subcommand in ('shell', 'daemon'):
+        print(f"{args.subcommand} can't be run inside a shell or daemon.", file=sys.stderr)
+        return 1
+    return run(args)
+
+def forwardedStdin(args):
+    """Get the function reading the IDs a batch subcommand would read from stdin, to send them to the daemon with the command."""
+    ids = getattr(args, 'fileId', '')
+    if not isinstance(ids, str) and (not ids or ids == ['-']):
+        return sys.stdin.read
+    return None
 
 cli = ArgumentParser()
+cli.add_argument("--cache", help="Answer metadata requests from the local metadata cache", action="store_true")
+cli.add_argument("--no-cache", help="Never use the metadata cache, even if GDRIVE_CLI_CACHE is set", action="store_true")
+cli.add_argument("--refresh", help="Ignore cached metadata, but store the fresh results in the cache", action="store_true")
+cli.add_argument("--ttl", help="Seconds cached metadata is used for, default 600", action="store", type=int)
+cli.add_argument("--rateLimit", help="Maximum requests per second across all threads, eg. to match the project quota", action="store", type=float)
+cli.add_argument("--stats", help="Print the number of requests made by each API method, retries and throttled requests when done", action="store_true")
+cli.add_argument("--trace", help="Write a JSON line for every request to a file, or to stderr if the file is -", action="store", metavar="FILE")
+cli.add_argument("--profile", help="Print the latency percentiles of each endpoint and the slowest requests when done", action="store_true")
+cli.add_argument("--no-daemon", help="Run the command in this process even if a daemon is running", action="store_true")
 subparsers = cli.add_subparsers(dest="subcommand")
 
-def printResults(items):
-    if not items:
-        print('No files found.')
-        return
-    for item in items:
-        printItem(item)
-        print("-------------------------------")    
-        
-def printItem(item):
-    print(f"Name: {item['name']}")
-    print(f"ID: {item['id']}")
-    print(f"Parents: {item['parents']}")
+def writePages(pages, writer) -> int:
+    """Write each page of files as it arrives and return the number written."""
+    for page in pages:
+        writer.writePage(page)
+    writer.close()
+    return writer.count
+
+def isSingle(ids):
+    return len(ids) == 1 and ids[0] != '-'
+
+def readIds(ids):
+    """Use the IDs given as arguments, or read them one per line from stdin if none or '-' are given.
+
+    Paths read from stdin are resolved to IDs a page at a time. Any with no file are reported and skipped.
+    """
+    if ids and ids != ['-']:
+        return ids
+    return resolveLines(line.strip() for line in sys.stdin if line.strip())
+
+def resolveLines(lines):
+    from paths import isPath
+    for chunk in chunked(lines, PAGE_SIZE):
+        paths = [line for line in chunk if isPath(line)]
+        ids = getResolver().resolveAll(paths) if paths else {}
+        for line in chunk:
+            if not isPath(line):
+                yield line
+            elif line in ids:
+                yield ids[line]
+            else:
+                print(PathNotFoundError(line), file=sys.stderr)
+
+def printBatch(results, message):
+    """Print a line for each file of a batched operation as its result arrives."""
+    done = failed = 0
+    for file_id, response, error in results:
+        if error:
+            failed += 1
+            print(f"{file_id}: Failed. {describeHttpError(error)}")
+        else:
+            done += 1
+            print(f"{file_id}: {message.format_map(response)}")
+    print(f"{done} succeeded, {failed} failed.")
+
+def writeCount(format, counts):
+    """Write the totals of count as a single record in a machine readable format."""
+    writer = openWriter(format, ", ".join(counts))
+    writer.writePage([counts])
+    writer.close()
+
+def megabytes(size):
+    return size * 1024 * 1024 if size else None
 
 def subcommand(args=[], parent=subparsers):
     def decorator(func):
@@ -48,20 +278,26 @@ def argument(*name_or_flags, **kwargs):
     return ([*name_or_flags], kwargs)
 
 @subcommand([argument("fileId", help="The ID of the file", action="store"),
-             argument("--raw", help="Flag to print the raw data.", action="store_true")])
+             argument("--raw", help="Flag to print the raw data.", action="store_true"),
+             argument("--fields", help="Only get these fields, eg. 'id, name, size'. Printed raw", action="store"),
+             argument("--format", help="Output format, default text", action="store", choices=FORMATS, default="text")])
 def get(args):
     """Get a files metadata."""
     try:
-        api = API(drive_service)
-        file = api.getFile(args.fileId)
-        if args.raw:
-            print(file)
+        api = getApi()
+        if args.format != 'text':
+            writer = openWriter(args.format, args.fields or "id, name, mimeType, trashed, parents")
+            writer.writePage([api.getFile(args.fileId, writer.fields)])
+            writer.close()
+        elif args.fields or args.raw:
+            print(api.getFile(args.fileId, args.fields or "*"))
         else:
+            file = api.getFile(args.fileId, "id, name, mimeType, trashed, parents")
             print(f"Name: {file['name']}")
             print(f"ID: {file['id']}")
             print(f"Mime: {file['mimeType']}")
             print(f"Trashed: {file['trashed']}")
-            if file['parents'] != None:
+            if file.get('parents') != None:
                 parent = api.getParent(file['parents'][0]) 
                 print(f"Parent: '{parent['name']}' ({parent['id']})")
     except HttpError as error:
@@ -73,38 +309,106 @@ def get(args):
 @subcommand([argument("fileId", help="The ID of the file", action="store")])
 def permissions(args):
     try:
-        api = API(drive_service)
+        api = getApi()
         print(api.getFilePermissions(args.fileId))
     except HttpError as error:
         printHttpError(error)
 
+@subcommand([argument("folderId", help="The ID of the folder to audit, default root", action="store", nargs="?", default="root"),
+             argument("--domain", help="The organisation's domains. Sharing outside them is external, default the domain of each file's owner", action="store", nargs="+"),
+             argument("--external", help="Only report files shared with anyone with the link or outside the domain", action="store_true"),
+             argument("--all", help="Report every file, including those which aren't shared", action="store_true"),
+             argument("--depth", help="Maximum depth to audit", action="store", type=int),
+             argument("--fields", help="The fields to write, default 'path, id, owner, anyone, discoverable, external, domains, permissions'", action="store"),
+             argument("--format", help="Output format, default ndjson", action="store", choices=FORMATS, default="ndjson"),
+             argument("--output", help="File to write the report to, default stdout", action="store"),
+             argument("--jobs", help="Number of folders to list or batches to send at once", action="store", type=int, default=DEFAULT_JOBS)])
+def permissions_audit(args):
+    """Report who every file in a folder tree is shared with, eg. anyone with the link or other domains."""
+    try:
+        from audit import AUDIT_FIELDS, AuditStats, auditTree
+        from walk import WalkStats
+
+        def reported(record):
+            if args.external:
+                return record['anyone'] or record['external'] or record['domains']
+            return args.all or record['permissions'] > 1 or record['anyone']
+
+        name = getApi().getFile(args.folderId, fields="name")['name']
+        stats, walk_stats = AuditStats(), WalkStats()
+        stream = open(args.output, 'w', newline='') if args.output else None
+        try:
+            writer = openWriter(args.format, args.fields or AUDIT_FIELDS, stream)
+            with getPool(args) as pool:
+                records = auditTree(pool, args.folderId, name, stats, args.domain, args.depth, walk_stats)
+                writePages(chunked((record for record in records if reported(record)), BATCH_SIZE), writer)
+        finally:
+            if stream != None:
+                stream.close()
+        print(stats.summary(), file=sys.stderr)
+        print(walk_stats.summary(), file=sys.stderr)
+    except HttpError as error:
+        printHttpError(error)
+
 @subcommand([argument("--excludeFolders", help="Excludes folders from the list", action="store_true"),
              argument("--trash", help="List all files in the trash", action="store_true"),
-             argument("--folderId", help="Folder to search within", action="store")])
+             argument("--folderId", help="Folder to search within", action="store"),
+             argument("--fields", help="The fields to print, eg. 'id, name, size', default 'name, id, parents'", action="store"),
+             argument("--format", help="Output format, default text", action="store", choices=FORMATS, default="text")])
 def list(args):
     """List files found in drive."""
     try:
-        api = API(drive_service)
-        results = api.listFiles(args.trash, args.excludeFolders, args.folderId)
-        print(f"Number of files found: {len(results)}")
-        print("-------------------------------")
-        printResults(results)
+        api = getApi()
+        writer = openWriter(args.format, args.fields)
+        pages = api.iterPages(filesQuery(args.trash, args.excludeFolders, args.folderId), writer.fields, args.folderId)
+        found = writePages(pages, writer)
+        if args.format == 'text':
+            print(f"Number of files found: {found}")
     except HttpError as error:
         printHttpError(error)
 
 @subcommand([argument("--excludeFolders", help="Includes folders from the count", action="store_true"),
              argument("--trash", help="Count files in the trash", action="store_true"),
              argument("--folderId", help="Folder to search within", action="store"),
-             argument("--all", help="Override, count all files including trash and folders", action="store_true")])
+             argument("--all", help="Override, count all files including trash and folders", action="store_true"),
+             argument("--recursive", help="Count every file in nested folders too, with their total size", action="store_true"),
+             argument("--jobs", help="Number of folders to list at once with --recursive", action="store", type=int, default=DEFAULT_JOBS),
+             argument("--format", help="Output format, default text", action="store", choices=FORMATS, default="text")])
 def count(args):
     """Give a count of files in drive."""
     try:
-        api = API(drive_service)
+        api = getApi()
+        if(args.recursive):
+            from bulk import FOLDER_MIME_TYPE
+            from walk import WalkStats, fileSize, humanSize, walkTree
+            stats = WalkStats()
+            found = size = 0
+            # Trashed files can be in folders which aren't, so the whole tree is walked to find them
+            trash = None if args.trash or args.all else False
+            with getPool(args) as pool:
+                for _, _, file in walkTree(pool, args.folderId or 'root', "id, mimeType, size, quotaBytesUsed, trashed", stats=stats, trash=trash):
+                    if args.trash and not args.all and not file.get('trashed'):
+                        continue
+                    if file['mimeType'] != FOLDER_MIME_TYPE:
+                        found += 1
+                        size += fileSize(file)
+                    elif args.all or not args.excludeFolders:
+                        found += 1
+            if args.format != 'text':
+                writeCount(args.format, {'files': found, 'bytes': size, 'folders': stats.folders, 'failed': stats.failed})
+                return
+            print(f"Number of files found: {found} ({humanSize(size)})")
+            print(stats.summary())
+            return
         if(args.all):
-            results = api.listAllFiles()
+            results = api.iterAllFiles(fields="id")
         else:
-            results = api.listFiles(args.trash, args.excludeFolders, args.folderId)
-        print(f"Number of files found: {len(results)}")
+            results = api.iterFiles(args.trash, args.excludeFolders, args.folderId, fields="id")
+        found = sum(1 for _ in results)
+        if args.format != 'text':
+            writeCount(args.format, {'files': found})
+            return
+        print(f"Number of files found: {found}")
     except HttpError as error:
         printHttpError(error)
 
@@ -112,14 +416,47 @@ def count(args):
              argument(
                  "--trash", help="Search within the trash folder", action="store_true"),
              argument("--folderId", help="Specific folder id to search within", action="store"),
-             argument("--match", help="Match the term completely", action="store_true")])
+             argument("--match", help="Match the term completely", action="store_true"),
+             argument("--fields", help="The fields to print, eg. 'id, name, size', default 'name, id, parents'", action="store"),
+             argument("--format", help="Output format, default text", action="store", choices=FORMATS, default="text"),
+             argument("--local", help="Search the local index for any names containing the term, ignoring case, without contacting the drive", action="store_true"),
+             argument("--fuzzy", help="Search the local index for names similar to the term too, best matches first", action="store_true"),
+             argument("--path", help="Match the term against the whole path of each file in the local index", action="store_true"),
+             argument("--limit", help="Maximum number of files found in the local index", action="store", type=int)])
 def search(args):
     """Search for files with names that contain the search term."""
     try:
-        print(f"Attempting search for files named: {args.term}...")
-        api = API(drive_service)
-        results = api.searchFile(args.term, args.trash, args.folderId, args.match)
-        printResults(results)
+        if args.format == 'text':
+            print(f"Attempting search for files named: {args.term}...")
+        writer = openWriter(args.format, args.fields)
+        if args.local or args.fuzzy or args.path:
+            from index import SearchIndex
+            search_index = SearchIndex()
+            if not search_index.exists():
+                print("There is no local index yet, build it with ./cli.py index")
+                return
+            writePages([search_index.search(args.term, args.fuzzy, args.path, args.match, args.trash, args.folderId, args.limit)], writer)
+            return
+        api = getApi()
+        writePages(api.iterPages(searchQuery(args.term, args.trash, args.folderId, args.match), writer.fields, args.folderId), writer)
+    except HttpError as error:
+        printHttpError(error)
+
+
+@subcommand([argument("--refresh", help="Only apply the changes made to the drive since the index was built or last refreshed", action="store_true", dest="refresh_index")])
+def index(args):
+    """Build the local search index from a listing of the whole drive."""
+    try:
+        from index import SearchIndex
+        search_index = SearchIndex()
+        api = getApi()
+        start = time.monotonic()
+        if args.refresh_index and search_index.exists():
+            changes = search_index.refresh(api)
+            print(f"Applied {changes} changes in {time.monotonic() - start:.1f}s. {search_index.count()} files indexed.")
+        else:
+            indexed = search_index.build(api, progress=lambda listed: print(f"Listed {listed} files..."))
+            print(f"Indexed {indexed} files in {time.monotonic() - start:.1f}s.")
     except HttpError as error:
         printHttpError(error)
 
@@ -129,7 +466,7 @@ def search(args):
 def folder(args):
     """Create a new folder."""
     try:
-        api = API(drive_service)
+        api = getApi()
         id = api.createFolder(args.name, args.folderId)
         print(f"Folder ID: {id}")
     except HttpError as error:
@@ -141,18 +478,19 @@ def folder(args):
                       action="store"),
              argument(
                  "--mimetype", help="Force a file type such as 'image/jpeg'", action="store"),
-             argument("--folderId", help="Folder ID to upload to, default root", action="store", default='root')])
+             argument("--folderId", help="Folder ID to upload to, default root", action="store", default='root'),
+             argument("--skipUnchanged", help="Skip the upload if the folder already has a file with the same name and content", action="store_true"),
+             argument("--chunkSize", help="Size of each uploaded chunk in MB, default 100", action="store", type=int)])
 def upload(args):
     """Upload a new file."""
     try:
         if(args.mimetype == None):
-            mimemagic = magic.Magic(mime=True)
-            mime = mimemagic.from_file(args.filePath) #Get the files mimetype
+            mime = detectMimeType(args.filePath) #Get the files mimetype
         else:
             mime = args.mimetype
-        api = API(drive_service)
+        api = getApi()
         print("Attempting upload...")
-        id = api.uploadFile(args.name, args.filePath, mime, args.folderId)
+        id = api.uploadFile(args.name, args.filePath, mime, args.folderId, args.skipUnchanged, megabytes(args.chunkSize))
         print(f"ID: {id}")
     except HttpError as error:
         printHttpError(error)
@@ -162,74 +500,214 @@ def upload(args):
              argument("filePath", help="Path to the source file",
                       action="store"),
              argument(
-                 "--mimetype", help="Force a file type such as 'image/jpeg'", action="store")])
+                 "--mimetype", help="Force a file type such as 'image/jpeg'", action="store"),
+             argument("--skipUnchanged", help="Only update the name and mimetype if the file already has the same content", action="store_true"),
+             argument("--chunkSize", help="Size of each uploaded chunk in MB, default 100", action="store", type=int)])
 def update(args):
     """Update an existing file."""
     try:
         if(args.mimetype == None):
-            mimemagic = magic.Magic(mime=True)
-            mime = mimemagic.from_file(args.filePath) #Get the files mimetype
+            mime = detectMimeType(args.filePath) #Get the files mimetype
         else:
             mime = args.mimetype
-        api = API(drive_service)
-        id = api.updateFile(args.fileId, args.name, args.filePath, mime)
+        api = getApi()
+        id = api.updateFile(args.fileId, args.name, args.filePath, mime, args.skipUnchanged, megabytes(args.chunkSize))
         print(f"Updated file {id} Successfully.")
     except HttpError as error:
         printHttpError(error)
 
 
-@subcommand([argument("fileId", help="The id of the file to be downloaded.", action="store")])
+@subcommand([argument("fileId", help="The id of the file to be downloaded, several can be given.", action="store", nargs="+"),
+             argument("--output", help="Path to save the file to, default is the name of the file. With several files, the directory to save them in", action="store"),
+             argument("--chunkSize", help="Size of each downloaded chunk in MB, default 100", action="store", type=int),
+             argument("--jobs", help="Number of files to download at once", action="store", type=int, default=DEFAULT_JOBS)])
 def download(args):
     """Download a file."""
     try:
-        api = API(drive_service)
+        if len(args.fileId) > 1:
+            from bulk import downloadFiles
+            stats = TransferStats()
+            with getPool(args) as pool:
+                downloadFiles(pool, args.fileId, args.output or ".", stats)
+            print(f"Downloaded {stats.summary()}")
+            return
+        api = getApi()
         print("Attempting download...")
-        api.downloadFile(args.fileId)
-        print("File Downloaded Successfully.")
+        path = api.downloadFile(args.fileId[0], args.output, megabytes(args.chunkSize))
+        print(f"File Downloaded Successfully to {path}.")
+    except HttpError as error:
+        printHttpError(error)
+
+@subcommand([argument("folderId", help="The id of the folder to be downloaded.", action="store"),
+             argument("--output", help="Local directory to download into, default is the name of the folder", action="store"),
+             argument("--jobs", help="Number of files to download at once", action="store", type=int, default=DEFAULT_JOBS)])
+def download_folder(args):
+    """Download a folder and everything in it."""
+    try:
+        from bulk import downloadAll, walkFolder
+        api = getApi()
+        output = args.output
+        if(output == None):
+            output = api.getFile(args.folderId, fields="name")['name']
+        stats = TransferStats()
+        with getPool(args) as pool:
+            downloadAll(pool, walkFolder(pool, args.folderId, output), stats)
+        print(f"Downloaded {stats.summary()}")
     except HttpError as error:
         printHttpError(error)
         
-@subcommand([argument("fileId", help="The id of the file to be exported.", action="store")])
+@subcommand([argument("folderId", help="The ID of the folder, default root", action="store", nargs="?", default="root"),
+             argument("--depth", help="Only print folders down to this depth. Everything below is still counted", action="store", type=int),
+             argument("--jobs", help="Number of folders to list at once", action="store", type=int, default=DEFAULT_JOBS)])
+def du(args):
+    """Show the number of files and total size of a folder and each folder inside it."""
+    try:
+        from walk import WalkStats, buildTree, humanSize
+        api = getApi()
+        stats = WalkStats()
+        with getPool(args) as pool:
+            tree = buildTree(pool, args.folderId, api.getFile(args.folderId, fields="name")['name'], stats=stats)
+        for folder_id in sorted(tree.order, key=tree.path):
+            if args.depth is None or tree.depth(folder_id) <= args.depth:
+                print(f"{humanSize(tree.bytes[folder_id]):>10} {tree.files[folder_id]:>8} files  {tree.path(folder_id)}")
+        print(stats.summary())
+    except HttpError as error:
+        printHttpError(error)
+
+@subcommand([argument("folderId", help="The ID of the folder, default root", action="store", nargs="?", default="root"),
+             argument("--depth", help="Maximum depth to list", action="store", type=int),
+             argument("--jobs", help="Number of folders to list at once", action="store", type=int, default=DEFAULT_JOBS)])
+def tree(args):
+    """Show a folder and everything in it as a tree."""
+    try:
+        from walk import WalkStats, buildTree
+        api = getApi()
+        stats = WalkStats()
+        with getPool(args) as pool:
+            folder_tree = buildTree(pool, args.folderId, api.getFile(args.folderId, fields="name")['name'], args.depth, stats)
+        for line in folder_tree.lines():
+            print(line)
+        print(stats.summary())
+    except HttpError as error:
+        printHttpError(error)
+
+@subcommand([argument("fileId", help="The id of the file to be exported, several can be given.", action="store", nargs="+"),
+             argument("--exportFormat", help="Formats to export to, eg. docx xlsx pptx. Each is used for every type of document which supports it, and the rest are exported to PDF", action="store", nargs="+", default=[]),
+             argument("--output", help="Path to save the file to, default is the name of the file with the extension of its format. With several files, the directory to save them in", action="store"),
+             argument("--chunkSize", help="Size of each chunk written to disk in MB, default 1", action="store", type=int),
+             argument("--jobs", help="Number of files to export at once", action="store", type=int, default=DEFAULT_JOBS)])
 def export(args):
-    """Export a Google Workspaces file to PDF."""
+    """Export Google Workspaces files, to PDF by default."""
     try:
-        api = API(drive_service)
+        from bulk import EXPORT_FIELDS, exportDocument, exportFiles, exportFormats, localName
+        formats = exportFormats(args.exportFormat)
+        if len(args.fileId) > 1:
+            stats = TransferStats()
+            with getPool(args) as pool:
+                exportFiles(pool, args.fileId, args.output or ".", formats, stats)
+            print(f"Exported {stats.summary()}")
+            return
+        api = getApi()
+        file = api.getFile(args.fileId[0], fields=EXPORT_FIELDS)
+        if file['mimeType'] not in formats:
+            print(f"Files of type {file['mimeType']} can't be exported to the given formats.")
+            return
+        extension = formats[file['mimeType']][0]
+        path = args.output or localName(file['name'])
+        if path.endswith(f".{extension}"):
+            path = path[:-len(extension) - 1]  # exportDocument adds the extension
         print("Attempting export and download...")
-        api.exportFile(args.fileId)
-        print("File Exported Successfully.")
+        if exportDocument(api, file, path, formats, megabytes(args.chunkSize)) is None:
+            print(f"{path}.{extension} is already up to date.")
+            return
+        print(f"File Exported Successfully to {path}.{extension}.")
     except HttpError as error:
         printHttpError(error)
+    except ValueError as error:
+        print(error)
 
-@subcommand([argument("fileId",help="ID of the file to move.", action="store"),
+@subcommand([argument("folderId", help="The id of the folder to export the documents of.", action="store"),
+             argument("--exportFormat", help="Formats to export to, eg. docx xlsx pptx. Each is used for every type of document which supports it, and the rest are exported to PDF", action="store", nargs="+", default=[]),
+             argument("--output", help="Local directory to export into, default is the name of the folder", action="store"),
+             argument("--jobs", help="Number of files to export at once", action="store", type=int, default=DEFAULT_JOBS)])
+def export_folder(args):
+    """Export every Google Workspaces file in a folder and the folders inside it."""
+    try:
+        from bulk import EXPORT_FIELDS, exportAll, exportFormats, walkFolder
+        formats = exportFormats(args.exportFormat)
+        api = getApi()
+        output = args.output
+        if(output == None):
+            output = api.getFile(args.folderId, fields="name")['name']
+        stats = TransferStats()
+        with getPool(args) as pool:
+            exportAll(pool, walkFolder(pool, args.folderId, output, EXPORT_FIELDS), formats, stats)
+        print(f"Exported {stats.summary()}")
+    except HttpError as error:
+        printHttpError(error)
+    except ValueError as error:
+        print(error)
+
+@subcommand([argument("fileId",help="ID of the file to move. Several can be given, or read from stdin if none are given.", action="store", nargs="*"),
              argument("folderId",help="ID of the folder to move the file to.", action="store")])
 def move(args):
     """Move a file into another folder."""
     try:
-        api = API(drive_service)
-        api.moveFile(args.fileId, args.folderId)
-        print("File Moved Successfully.")
+        api = getApi()
+        if isSingle(args.fileId):
+            api.moveFile(args.fileId[0], args.folderId)
+            print("File Moved Successfully.")
+        else:
+            printBatch(api.moveFiles(readIds(args.fileId), args.folderId), "Moved")
     except HttpError as error:
         printHttpError(error)
     
-@subcommand([argument("fileId",help="ID of the file to copy.", action="store"),
+@subcommand([argument("fileId",help="ID of the file to copy. Several can be given, or read from stdin if none are given.", action="store", nargs="*"),
              argument("--folderId",help="ID of the folder to move the copy to.", action="store"),
              argument("--name", help="The name for the new copy", action="store")])
 def copy(args):
     """Copy a file."""
     try:
-        api = API(drive_service)
-        file = api.copyFile(args.fileId, args.folderId, args.name)
-        print(f"Copy ID: {file['id']}")
+        api = getApi()
+        if isSingle(args.fileId):
+            file = api.copyFile(args.fileId[0], args.folderId, args.name)
+            print(f"Copy ID: {file['id']}")
+        else:
+            printBatch(api.copyFiles(readIds(args.fileId), args.folderId, args.name), "Copied to {id}")
     except HttpError as error:
         printHttpError(error)
     
 
+@subcommand([argument("folderId", help="The ID of the folder to copy", action="store"),
+             argument("--parentId", help="The ID of the folder to create the copy in, default the same folder as the original", action="store"),
+             argument("--name", help="The name for the new copy, default the same name as the original", action="store"),
+             argument("--depth", help="Maximum depth to copy. Folders at this depth are copied empty", action="store", type=int),
+             argument("--jobs", help="Number of batches of requests to send at once", action="store", type=int, default=DEFAULT_JOBS)])
+def copy_folder(args):
+    """Copy a folder and everything in it, server-side."""
+    try:
+        from bulk import FOLDER_MIME_TYPE, copyFolderTree
+        folder = getApi().getFile(args.folderId, fields="name, mimeType, parents")
+        if folder['mimeType'] != FOLDER_MIME_TYPE:
+            print("The given file isn't a folder.")
+            return
+        parent_id = args.parentId or (folder.get('parents') or ['root'])[0]
+        stats = TransferStats()
+        with getPool(args) as pool:
+            id = copyFolderTree(pool, args.folderId, parent_id, args.name or folder['name'], stats, args.depth)
+        print(f"Copy ID: {id}")
+        print(f"Finished Copying Folder: {stats.summary()}")
+    except HttpError as error:
+        printHttpError(error)
+    except CopyIntoItselfError:
+        print("A folder can't be copied into itself or one of its subfolders.")
+
 @subcommand([argument("fileId",help="The ID of the file to create a shortcut to", action="store"),
              argument("--folderId",help="The ID of the shortcut's parent folder",action="store")])    
 def shortcut(args):
     """Create a shortcut for a file."""
     try:
-        api = API(drive_service)
+        api = getApi()
         id = api.addShortcut(args.fileId, args.folderId)
         print(f"Shortcut ID: {id}")
     except HttpError as error:
@@ -239,7 +717,7 @@ def shortcut(args):
 def empty_trash(args):
     """Permanently delete all files marked as trash."""
     try:
-        api = API(drive_service)
+        api = getApi()
         api.emptyTrash()
         print("Trash emptied.")
     except HttpError as error:
@@ -247,83 +725,157 @@ def empty_trash(args):
         
 @subcommand([argument("folderPath", help="The folder to upload", action="store"),
              argument("--folderId",help="The parent folder ID to store the uploaded files/folders", action="store", default="root"),
-             argument("--depth", help="Maximum depth to traverse", action="store", type=int)])
+             argument("--depth", help="Maximum depth to traverse", action="store", type=int),
+             argument("--jobs", help="Number of files to upload at once", action="store", type=int, default=DEFAULT_JOBS),
+             argument("--skipUnchanged", help="Reuse existing folders and only upload files which are new or have changed", action="store_true")])
 def upload_folder(args):
     """Upload a local folders contents."""
-    def traverse(api, path, root, depth, maxdepth):
-        print(f"Creating {path} folder...")
-        id = api.createFolder(basename(normpath(path)), root)
-        
-        if(maxdepth == None or depth < maxdepth): #If max depth is reached, do not upload anything or create new folders
-            print(depth)
-            print(maxdepth)
-            items = os.listdir(path)
-            
-            for item in items:
-                itempath = join(path, item)
-                if isfile(itempath):
-                    mimemagic = magic.Magic(mime=True)
-                    mime = mimemagic.from_file(itempath) #Get the files mimetype
-                    print(f"Attempting upload of {itempath}...")
-                    api.uploadFile(item, itempath, mime, id)
-                else:
-                    traverse(api, itempath, id, depth + 1, maxdepth)
-    
     try:
-        api = API(drive_service)
-        traverse(api, args.folderPath, args.folderId, 0, args.depth)
-        print("Finished Uploading Folder")
+        from bulk import createFolderTree, uploadAll
+        stats = TransferStats()
+        with getPool(args) as pool:
+            files = createFolderTree(pool, args.folderPath, args.folderId, args.depth, args.skipUnchanged)
+            uploadAll(pool, files, stats)
+        print(f"Finished Uploading Folder: {stats.summary()}")
     except HttpError as error:
         printHttpError(error)
     
-@subcommand([argument("fileId",help="File ID to lock",action="store")])
+@subcommand([argument("folderPath", help="The local folder to keep in sync", action="store"),
+             argument("folderId", help="The ID of the folder in the drive to sync with", action="store"),
+             argument("--jobs", help="Number of files to transfer at once", action="store", type=int, default=DEFAULT_JOBS)])
+def sync(args):
+    """Two-way sync a local folder with a folder in the drive."""
+    try:
+        from sync import Sync
+        stats = TransferStats()
+        with getPool(args) as pool:
+            Sync(getApi(), pool, args.folderPath, args.folderId, stats).run()
+        print(f"Finished Syncing: {stats.summary()}")
+    except HttpError as error:
+        printHttpError(error)
+    except ValueError as error:
+        print(error)
+
+@subcommand([argument("fileId",help="File ID to lock. Several can be given, or read from stdin if none are given.",action="store",nargs="*")])
 def lock(args):
     """Lock a file to read-only."""
     try:
-        api = API(drive_service)
-        print("Attempting to lock file...")
-        api.lockFile(args.fileId)
-        print("File Locked Successfully.")
+        api = getApi()
+        if isSingle(args.fileId):
+            print("Attempting to lock file...")
+            api.lockFile(args.fileId[0])
+            print("File Locked Successfully.")
+        else:
+            printBatch(api.lockFiles(readIds(args.fileId)), "Locked")
     except HttpError as error:
         printHttpError(error)
         
-@subcommand([argument("fileId",help="File ID to unlock",action="store")])
+@subcommand([argument("fileId",help="File ID to unlock. Several can be given, or read from stdin if none are given.",action="store",nargs="*")])
 def unlock(args):
     """Unlock a file."""
     try:
-        api = API(drive_service)
-        print("Attempting to unlock file...")
-        api.unlockFile(args.fileId)
-        print("File Unlocked Successfully.")
+        api = getApi()
+        if isSingle(args.fileId):
+            print("Attempting to unlock file...")
+            api.unlockFile(args.fileId[0])
+            print("File Unlocked Successfully.")
+        else:
+            printBatch(api.unlockFiles(readIds(args.fileId)), "Unlocked")
     except HttpError as error:
         printHttpError(error)
 
-@subcommand([argument("fileId", help="File ID to trash",action="store")])
+@subcommand([argument("fileId", help="File ID to trash. Several can be given, or read from stdin if none are given.",action="store",nargs="*")])
 def trash(args):
     """Mark a file as trash."""
     try: 
-        api = API(drive_service)
-        print("Attempting to mark file as trash...")
-        api.trashFile(args.fileId)
-        print("File Trashed Successfully.")
+        api = getApi()
+        if isSingle(args.fileId):
+            print("Attempting to mark file as trash...")
+            api.trashFile(args.fileId[0])
+            print("File Trashed Successfully.")
+        else:
+            printBatch(api.trashFiles(readIds(args.fileId)), "Trashed")
     except HttpError as error:
         printHttpError(error)
 
-@subcommand([argument("fileId", help="File ID to trash",action="store")])
+@subcommand([argument("fileId", help="File ID to restore. Several can be given, or read from stdin if none are given.",action="store",nargs="*")])
 def restore(args):
     """Restore a file from trash."""
     try:
-        api = API(drive_service)
-        print("Attempting to restore a file...")
-        api.untrashFile(args.fileId)
-        print("File Restored Successfully.")
+        api = getApi()
+        if isSingle(args.fileId):
+            print("Attempting to restore a file...")
+            api.restoreFile(args.fileId[0])
+            print("File Restored Successfully.")
+        else:
+            printBatch(api.restoreFiles(readIds(args.fileId)), "Restored")
     except HttpError as error:
         printHttpError(error)
 
+@subcommand()
+def shell(args):
+    """Run subcommands interactively, keeping the Drive client, connections and cache warm between them."""
+    global warm_pools
+    import shlex
+    try:
+        import readline  # Line editing and history where available
+    except ImportError:
+        pass
+    warm_pools = {}
+    defaults = Namespace(**{key: value for key, value in vars(args).items() if key not in ('subcommand', 'func')})
+    print("Enter subcommands as you would after ./cli.py, 'help' to list them or 'exit' to quit.")
+    while True:
+        try:
+            line = input("gdrive> ")
+        except EOFError:
+            print()
+            break
+        except KeyboardInterrupt:
+            print()
+            continue
+        try:
+            argv = shlex.split(line)
+        except ValueError as error:
+            print(error)
+            continue
+        if not argv:
+            continue
+        if argv[0] in ('exit', 'quit'):
+            break
+        if argv[0] == 'help':
+            argv = ['--help']
+        try:
+            runLine(argv, defaults)
+        except KeyboardInterrupt:
+            print("Interrupted.")
+
+@subcommand([argument("--socket", help="The Unix socket to listen on, default $GDRIVE_CLI_SOCKET or daemon.sock in the cache folder", action="store"),
+             argument("--stop", help="Stop the running daemon", action="store_true")])
+def daemon(args):
+    """Keep the Drive client warm in the background, running the subcommands forwarded by later invocations."""
+    global warm_pools
+    from daemon import Daemon, forward, socketPath
+    path = args.socket or socketPath()
+    if args.stop:
+        if forward(path, None, stop=True) is None:
+            print(f"No daemon is listening on {path}.")
+        else:
+            print("Daemon stopped.")
+        return
+    warm_pools = {}
+    defaults = Namespace(**{key: value for key, value in vars(args).items() if key not in ('subcommand', 'func', 'socket', 'stop')})
+    Daemon(lambda argv: runLine(argv, defaults), path).serve()
+
 if __name__ == "__main__":
     args = cli.parse_args()
-    if args.subcommand is None:
-        cli.print_help()
-    else:
-        args.func(args)
-
+    try:
+        if args.subcommand not in (None, 'shell', 'daemon') and not args.no_daemon:
+            from daemon import forward, socketPath
+            status = forward(socketPath(), sys.argv[1:], forwardedStdin(args))
+            if status != None:
+                sys.exit(status)
+        sys.exit(run(args))
+    except BrokenPipeError:
+        # The reader of the output exited early, eg. head, so quietly stop
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
@@ -0,0 +1,172 @@
+import io
+import json
+import os
+import socket
+import sys
+import threading
+import traceback
+
+from cache import CACHE_DIR
+
+
+def socketPath() -> str:
+    """The Unix socket the daemon listens on, which can be moved with the GDRIVE_CLI_SOCKET variable."""
+    return os.environ.get('GDRIVE_CLI_SOCKET') or os.path.join(CACHE_DIR, 'daemon.sock')
+
+
+def sendFrame(stream, frame):
+    stream.write(json.dumps(frame) + '\n')
+    stream.flush()
+
+
+def exitCode(exit) -> int:
+    """The exit status of a SystemExit, as the interpreter would report it."""
+    if exit.code is None or isinstance(exit.code, int):
+        return exit.code or 0
+    print(exit.code, file=sys.stderr)
+    return 1
+
+
+class FrameWriter(io.TextIOBase):
+    """A text stream which sends everything written to it to the client as frames of one output."""
+
+    def __init__(self, stream, name, lock):
+        self.stream = stream
+        self.name = name
+        self.lock = lock  # Shared with the other outputs of the same connection
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if text:
+            with self.lock:
+                sendFrame(self.stream, {self.name: text})
+        return len(text)
+
+
+class Daemon:
+    """Runs the command lines sent by thin clients over a Unix socket in one long-running process.
+
+    The process keeps its credentials, Drive service, worker threads and metadata
+    cache between commands, so each command costs only its own requests. Commands
+    run one at a time, since each one takes over the process's stdout, stdin and
+    working directory while it runs.
+    """
+
+    def __init__(self, run, path=None):
+        """Create the daemon.
+
+        Args:
+            run: The function to call with the argument list of each command. It returns the exit status.
+            path: The Unix socket to listen on. If None is given, socketPath() is used.
+        """
+        self.run = run
+        self.path = path or socketPath()
+        self.lock = threading.Lock()
+        self.server = None
+
+    def serve(self):
+        """Listen for commands until a client asks the daemon to stop."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        if forward(self.path, None) != None:
+            raise OSError(f"A daemon is already listening on {self.path}")
+        if os.path.exists(self.path):
+            os.remove(self.path)  # Left behind by a daemon which didn't exit cleanly
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o077)  # Only the user running the daemon may send it commands
+        try:
+            self.server.bind(self.path)
+        finally:
+            os.umask(umask)
+        self.server.listen()
+        print(f"Listening on {self.path}", file=sys.stderr)
+        try:
+            while True:
+                try:
+                    connection, _ = self.server.accept()
+                except OSError:
+                    break  # Closed by stop()
+                threading.Thread(target=self.handle, args=(connection,), daemon=True).start()
+        finally:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def stop(self):
+        self.server.shutdown(socket.SHUT_RDWR)  # Wakes the accept() in serve(), which closing alone doesn't
+        self.server.close()
+
+    def handle(self, connection):
+        with connection, connection.makefile('rw', encoding='utf-8') as stream:
+            try:
+                request = json.loads(stream.readline() or 'null')
+            except ValueError:
+                return
+            if not request:
+                return
+            if request.get('stop'):
+                sendFrame(stream, {'exit': 0})
+                self.stop()
+                return
+            if request.get('argv') is None:
+                sendFrame(stream, {'exit': 0})  # Only checking the daemon is alive
+                return
+            try:
+                sendFrame(stream, {'exit': self.execute(request, stream)})
+            except OSError:
+                pass  # The client went away
+
+    def execute(self, request, stream) -> int:
+        """Run one command with its output sent to the client, in the client's working directory."""
+        with self.lock:
+            write_lock = threading.Lock()
+            saved = sys.stdout, sys.stderr, sys.stdin, os.getcwd()
+            sys.stdout = FrameWriter(stream, 'stdout', write_lock)
+            sys.stderr = FrameWriter(stream, 'stderr', write_lock)
+            sys.stdin = io.StringIO(request.get('stdin') or '')
+            try:
+                os.chdir(request.get('cwd') or saved[3])
+                return self.run(request['argv'])
+            except SystemExit as exit:
+                return exitCode(exit)
+            except Exception:
+                traceback.print_exc()
+                return 1
+            finally:
+                sys.stdout, sys.stderr, sys.stdin = saved[:3]
+                os.chdir(saved[3])
+
+
+def forward(path, argv, stdin=None, stop=False):
+    """Send a command line to a running daemon and copy its output to this process's stdout and stderr.
+
+    Args:
+        path: The Unix socket the daemon listens on.
+        argv: The command line arguments, without the program name. If None is given, only check the daemon is running.
+        stdin: A function returning the text to give the command as its stdin. It is only called once the
+            daemon has been reached, so stdin is left unread for the command to run locally otherwise.
+        stop: A flag to ask the daemon to exit instead of running a command.
+
+    Returns:
+        The exit status of the command, or None if no daemon is listening on path.
+    """
+    if not os.path.exists(path):
+        return None
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except OSError:
+        connection.close()
+        return None
+    with connection, connection.makefile('rw', encoding='utf-8') as stream:
+        request = {'stop': True} if stop else {'argv': argv, 'cwd': os.getcwd(), 'stdin': stdin() if stdin else None}
+        sendFrame(stream, request)
+        for line in stream:
+            frame = json.loads(line)
+            if 'exit' in frame:
+                return frame['exit']
+            output = sys.stdout if 'stdout' in frame else sys.stderr
+            output.write(frame.get('stdout') or frame.get('stderr'))
+            output.flush()
+    print("The daemon closed the connection before the command finished.", file=sys.stderr)
+    return 1
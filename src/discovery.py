@@ -0,0 +1,16 @@
+def buildService(credentials, api='drive', version='v3'):
+    """Build a service from the discovery document bundled with googleapiclient.
+
+    The bundled document is read from disk, so building a service needs no network
+    access and takes a few milliseconds.
+
+    Args:
+        credentials: The credentials used to authorise requests.
+        api: The name of the API. (Default is drive)
+        version: The version of the API. (Default is v3)
+
+    Returns:
+        The service resource.
+    """
+    from googleapiclient.discovery import build
+    return build(api, version, credentials=credentials, static_discovery=True)
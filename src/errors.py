@@ -1,7 +1,41 @@
+import json
+
+# Statuses which are worth retrying, as well as 403 when caused by a rate limit
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
 class NotFolderError(Exception):
     """Raised when the fetched file is not a folder"""
     pass
 
+class CopyIntoItselfError(Exception):
+    """Raised when a folder would be copied into itself or one of its subfolders"""
+    pass
+
+class PathNotFoundError(Exception):
+    """Raised when no file is found at a path in the drive"""
+    def __init__(self, path):
+        super().__init__(f"No file found at {path}")
+        self.path = path
+
+def errorReasons(error):
+    """Get the machine readable reasons, such as 'userRateLimitExceeded', from an HttpError."""
+    try:
+        data = json.loads(error.content)
+        return {detail.get('reason') for detail in data['error'].get('errors', [])}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return set()
+
+def isRetryable(error):
+    """Check whether a failed request could succeed if it was sent again."""
+    status = error.resp.status
+    if status in RETRYABLE_STATUSES:
+        return True
+    return status == 403 and not RATE_LIMIT_REASONS.isdisjoint(errorReasons(error))
+
+def describeHttpError(error):
+    return f"Status: {error.status_code} Reason: {error._get_reason()}"
+
 def printHttpError(error):
     print(
-        f"Error Occured:\nStatus: {error.status_code}\nReason: {error._get_reason}")
\ No newline at end of file
+        f"Error Occured:\nStatus: {error.status_code}\nReason: {error._get_reason()}")
@@ -0,0 +1,237 @@
+import random
+import threading
+import time
+
+from googleapiclient.errors import HttpError
+from errors import RATE_LIMIT_REASONS, errorReasons, isRetryable
+
+MAX_RETRIES = 6
+BASE_DELAY = 1.0
+MAX_DELAY = 64.0
+
+responses = threading.local()  # The status and size of the last response received by each thread
+
+
+def observeResponse(status, size):
+    """Note the status and size of a response, for the record of the request being sent on this thread."""
+    responses.last = (status, size)
+
+
+class RecordingHttp:
+    """Wraps an httplib2 style http to note the status and size of every response it receives.
+
+    Chunks of media transfers and batches are sent by the client library rather than
+    through an HttpRequest's postproc, so their responses are noted here instead.
+    """
+
+    def __init__(self, http):
+        self.http = http
+
+    def request(self, *args, **kwargs):
+        resp, content = self.http.request(*args, **kwargs)
+        observeResponse(resp.status, len(content or b''))
+        return resp, content
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+
+def retryDelay(attempt, error=None) -> float:
+    """Get how long to wait before retrying a request.
+
+    The server's Retry-After header is used if it sent one, otherwise the delay is
+    exponential backoff with full jitter, so many threads hitting a limit at once
+    don't all retry at the same moment.
+
+    Args:
+        attempt: The number of retries already made.
+        error: The HttpError which caused the retry, if any.
+
+    Returns:
+        The number of seconds to wait.
+    """
+    if error != None:
+        try:
+            return float(error.resp.get('retry-after'))
+        except (TypeError, ValueError):
+            pass
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+
+
+def isRateLimited(error) -> bool:
+    return error.resp.status == 429 or not RATE_LIMIT_REASONS.isdisjoint(errorReasons(error))
+
+
+class TokenBucket:
+    """Limits the rate of requests across every thread sharing the bucket.
+
+    The bucket refills at rate tokens per second up to burst tokens, and each request takes one.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token, returning the number of seconds to wait before it may be used."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self) -> float:
+        """Wait until a token is available, returning the number of seconds waited."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class ExecutorStats:
+    """Thread-safe counters of the requests sent through a RequestExecutor."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.retried = 0
+        self.rate_limited = 0
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+        self.failed = 0
+        self.methods = {}  # HTTP calls made by each API method, including retries
+
+    def count(self, name, amount=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def countMethod(self, method):
+        with self.lock:
+            self.methods[method] = self.methods.get(method, 0) + 1
+
+    def summary(self) -> str:
+        return (f"{self.requests} requests, {self.retried} retried, {self.rate_limited} rate limited by Drive, "
+                f"{self.throttled} throttled locally for {self.throttled_seconds:.1f}s, {self.failed} failed")
+
+    def methodSummary(self) -> str:
+        """One line per API method with the number of HTTP calls it made, most first."""
+        with self.lock:
+            methods = sorted(self.methods.items(), key=lambda item: (-item[1], item[0]))
+        return "\n".join(f"  {method}: {calls}" for method, calls in methods)
+
+
+class RequestExecutor:
+    """Sends every API request, retrying failures and limiting the request rate.
+
+    Requests failing with 429, 5xx or a 403 rate limit error, or with a dropped
+    connection, are retried with backoff. One executor should be shared by every
+    thread so that the rate limit applies to the process as a whole.
+    """
+
+    def __init__(self, rate=None, max_retries=MAX_RETRIES):
+        """Create an executor.
+
+        Args:
+            rate: The maximum number of requests per second, eg. to match the project quota. If None is given, requests aren't limited.
+            max_retries: The number of times a request is retried before giving up.
+        """
+        self.bucket = TokenBucket(rate) if rate else None
+        self.max_retries = max_retries
+        self.stats = ExecutorStats()
+        self.hooks = []
+
+    def addHook(self, hook):
+        """Call hook with a record of every request attempt, eg. a Tracer or Profiler.
+
+        Records are dicts of the method, start time, seconds taken, HTTP status,
+        response bytes if known, the attempt number and the error if it failed.
+        Hooks are called from every thread sending requests.
+        """
+        self.hooks.append(hook)
+
+    def record(self, method, start, seconds, status=None, size=None, attempt=0, error=None):
+        """Pass a record to every hook, eg. for time spent outside requests such as authentication."""
+        record = {'method': method, 'start': start, 'seconds': seconds, 'status': status,
+                  'bytes': size, 'attempt': attempt, 'error': error}
+        for hook in self.hooks:
+            hook(record)
+
+    def call(self, func, *args, method=None, **kwargs):
+        """Call a function which sends a request, retrying it if it fails.
+
+        Args:
+            func: The function to call with the remaining arguments.
+            method: The API method the request is for, eg. files.get, to count its calls under.
+
+        Returns:
+            The result of the function.
+
+        Raises:
+            HttpError: The request failed with an error which can't be retried, or failed too many times.
+        """
+        attempt = 0
+        while True:
+            if self.bucket:
+                waited = self.bucket.acquire()
+                if waited > 0:
+                    self.stats.count('throttled')
+                    self.stats.count('throttled_seconds', waited)
+            self.stats.count('requests')
+            self.stats.countMethod(method or 'other')
+            start, started = time.time(), time.monotonic()
+            responses.last = (None, None)
+            try:
+                result = func(*args, **kwargs)
+                if self.hooks:
+                    status, size = responses.last
+                    self.record(method or 'other', start, time.monotonic() - started, status, size, attempt)
+                return result
+            except HttpError as error:
+                if self.hooks:
+                    self.record(method or 'other', start, time.monotonic() - started, error.resp.status,
+                                len(error.content or b''), attempt, error._get_reason())
+                if isRateLimited(error):
+                    self.stats.count('rate_limited')
+                if attempt >= self.max_retries or not isRetryable(error):
+                    self.stats.count('failed')
+                    raise
+                delay = retryDelay(attempt, error)
+            except OSError as error:
+                # Dropped connections and timeouts
+                if self.hooks:
+                    self.record(method or 'other', start, time.monotonic() - started, attempt=attempt, error=repr(error))
+                if attempt >= self.max_retries:
+                    self.stats.count('failed')
+                    raise
+                delay = retryDelay(attempt)
+            self.stats.count('retried')
+            attempt += 1
+            time.sleep(delay)
+
+    def execute(self, request):
+        """Execute an API request, retrying it if it fails."""
+        if self.hooks:
+            self.measure(request)
+        return self.call(request.execute, method=methodName(request))
+
+    def measure(self, request):
+        """Record the status and size of a request's response for the hooks."""
+        postproc = request.postproc
+
+        def measured(resp, content):
+            observeResponse(resp.status, len(content or b''))
+            return postproc(resp, content)
+        request.postproc = measured
+
+
+def methodName(request) -> str:
+    """Get the API method of a request, eg. files.get."""
+    method_id = getattr(request, 'methodId', None)
+    return method_id.split('.', 1)[-1] if method_id else None
+
+
+default_executor = RequestExecutor()
@@ -1,7 +1,4 @@
-import google_auth_oauthlib.flow
 import os.path
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
 from google.oauth2.credentials import Credentials
 
 
@@ -11,9 +8,6 @@ class Auth:
     def __init__(self, client_secret_filename, scopes):
         self.client_secret = client_secret_filename
         self.scopes = scopes
-        self.flow = google_auth_oauthlib.flow.Flow.from_client_secrets_file(
-            self.client_secret, self.scopes)
-        self.flow.redirect_uri = 'http://localhost:8080/'
         self.creds = None
 
     def get_credentials(self):
@@ -23,8 +17,10 @@ class Auth:
         # If there are no (valid) credentials available, let the user log in.
         if not self.creds or not self.creds.valid:
             if self.creds and self.creds.expired and self.creds.refresh_token:
+                from google.auth.transport.requests import Request
                 self.creds.refresh(Request())
             else:
+                from google_auth_oauthlib.flow import InstalledAppFlow
                 flow = InstalledAppFlow.from_client_secrets_file(
                     self.client_secret, self.scopes)
                 self.creds = flow.run_local_server(port=8080)
@@ -0,0 +1,74 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+
+from cache import CACHE_DIR
+
+CHUNK_SIZE = 1024 * 1024
+MAX_ENTRIES = 100000
+
+
+class HashCache:
+    """Remembers the MD5 of local files so unchanged files aren't read again.
+
+    Entries are keyed by the absolute path and only used while the file's size and
+    mtime are the same as when it was hashed. The cache is saved when the process exits.
+    """
+
+    def __init__(self, path=None, max_entries=MAX_ENTRIES):
+        self.path = path or os.path.join(CACHE_DIR, 'md5.json')
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.changed = False
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def md5(self, path) -> str:
+        """Get the MD5 of a local file, hashing it in fixed size chunks if it isn't cached."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.entries.get(path)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        digest = hashlib.md5()
+        with open(path, 'rb') as f:
+            while chunk := f.read(CHUNK_SIZE):
+                digest.update(chunk)
+        with self.lock:
+            self.entries.pop(path, None)
+            self.entries[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+            while len(self.entries) > self.max_entries:
+                del self.entries[next(iter(self.entries))]  # Oldest first, as dicts keep insertion order
+            if not self.changed:
+                self.changed = True
+                atexit.register(self.save)
+        return digest.hexdigest()
+
+    def save(self):
+        with self.lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path + '.tmp', 'w') as f:
+                    json.dump(self.entries, f)
+                os.replace(self.path + '.tmp', self.path)
+            except OSError:
+                pass  # The hashes are worked out again next time
+
+
+hash_cache = None
+hash_cache_lock = threading.Lock()
+
+
+def localMd5(path) -> str:
+    """Get the MD5 of a local file using the shared HashCache."""
+    global hash_cache
+    with hash_cache_lock:
+        if hash_cache is None:
+            hash_cache = HashCache()
+    return hash_cache.md5(path)
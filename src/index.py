@@ -0,0 +1,301 @@
+import heapq
+import os
+import sqlite3
+import time
+from difflib import SequenceMatcher
+
+from cache import CACHE_DIR
+
+INDEX_FIELDS = "id, name, mimeType, parents, size, modifiedTime, trashed"
+FUZZY_THRESHOLD = 0.75  # The lowest similarity of a fuzzy match
+FUZZY_CANDIDATES = 1000  # Names sharing the most trigrams with the term which are compared with it for a fuzzy match
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (key INTEGER PRIMARY KEY, id TEXT UNIQUE, name TEXT, path TEXT, mimeType TEXT,
+                                  parent TEXT, size INTEGER, modifiedTime TEXT, trashed INTEGER);
+CREATE INDEX IF NOT EXISTS files_parent ON files (parent);
+CREATE INDEX IF NOT EXISTS files_name ON files (name COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# A trigram index of names and paths, kept up to date with the files table by triggers
+TRIGRAM_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS names USING fts5(name, path, content='files', content_rowid='key', tokenize='trigram');
+CREATE TRIGGER IF NOT EXISTS files_insert AFTER INSERT ON files BEGIN
+    INSERT INTO names (rowid, name, path) VALUES (new.key, new.name, new.path);
+END;
+CREATE TRIGGER IF NOT EXISTS files_delete AFTER DELETE ON files BEGIN
+    INSERT INTO names (names, rowid, name, path) VALUES ('delete', old.key, old.name, old.path);
+END;
+CREATE TRIGGER IF NOT EXISTS files_update AFTER UPDATE OF name, path ON files BEGIN
+    INSERT INTO names (names, rowid, name, path) VALUES ('delete', old.key, old.name, old.path);
+    INSERT INTO names (rowid, name, path) VALUES (new.key, new.name, new.path);
+END;
+"""
+
+INSERT = "INSERT INTO files (id, name, mimeType, parent, size, modifiedTime, trashed, path) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+UPSERT = """
+INSERT INTO files (id, name, mimeType, parent, size, modifiedTime, trashed) VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET name = excluded.name, mimeType = excluded.mimeType, parent = excluded.parent,
+    size = excluded.size, modifiedTime = excluded.modifiedTime, trashed = excluded.trashed
+"""
+
+
+def row(file) -> tuple:
+    parents = file.get('parents') or [None]
+    size = file.get('size')
+    return (file['id'], file['name'], file.get('mimeType'), parents[0],
+            int(size) if size != None else None, file.get('modifiedTime'), int(bool(file.get('trashed'))))
+
+
+def findPaths(files, root_id) -> dict:
+    """Work out the path of every file from the names of the folders it is in.
+
+    Paths of files in My Drive start with '/'. Paths of files whose folders aren't
+    known, such as files shared with the user, start at the first folder that is.
+
+    Args:
+        files: A dict of each file ID to a tuple starting with its name and parent ID.
+        root_id: The ID of the My Drive folder.
+
+    Returns:
+        A dict of each file ID to its path.
+    """
+    paths = {}
+    for file_id in files:
+        # Iterative, since folders can be nested deeper than the recursion limit
+        chain = []
+        while file_id in files and file_id not in paths and len(chain) <= len(files):
+            chain.append(file_id)
+            file_id = files[file_id][1]
+        path = paths.get(file_id, '' if file_id == root_id else None)
+        for link in reversed(chain):
+            name = files[link][0]
+            path = name if path is None else f"{path}/{name}"
+            paths[link] = path
+    return paths
+
+
+def phrase(term) -> str:
+    """Quote a term to be matched as a substring by the trigram index."""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def trigrams(text) -> set:
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def similarity(term, name) -> float:
+    """How closely a term matches the most similar part of a name, from 0 to 1, ignoring case."""
+    term, name = term.lower(), name.lower()
+    if term in name:
+        return 1.0
+    if len(name) <= len(term):
+        return SequenceMatcher(None, term, name).ratio()
+    best = 0
+    for block in SequenceMatcher(None, term, name, autojunk=False).get_matching_blocks():
+        start = max(0, block.b - block.a)
+        best = max(best, SequenceMatcher(None, term, name[start:start + len(term)]).ratio())
+    return best
+
+
+class SearchIndex:
+    """An offline index of the name and path of every file in the drive, stored in SQLite.
+
+    The index is built from a full listing of the drive and refreshed from the
+    changes feed. Names and paths are indexed by their trigrams with SQLite's FTS5,
+    so any substring of three or more characters is found without scanning, in any
+    case. Shorter terms are matched by a scan. Fuzzy matches are scored among the
+    names sharing the most trigrams with the term.
+    """
+
+    def __init__(self, path=None):
+        """Open the index, creating it if it doesn't exist.
+
+        Args:
+            path: The path of the SQLite database. (Default is index.sqlite in the cache directory)
+        """
+        self.path = path or os.path.join(CACHE_DIR, 'index.sqlite')
+        self.db = None
+        self.trigram = True  # Whether SQLite has the trigram tokenizer, from 3.34
+
+    def connection(self):
+        if self.db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.db = self.open(self.path)
+        return self.db
+
+    def open(self, path, trigram=True):
+        connection = sqlite3.connect(path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        if trigram:
+            self.createTrigrams(connection)
+        return connection
+
+    def createTrigrams(self, connection):
+        try:
+            connection.executescript(TRIGRAM_SCHEMA)
+        except sqlite3.OperationalError:
+            self.trigram = False
+
+    def close(self):
+        if self.db != None:
+            self.db.close()
+            self.db = None
+
+    def getMeta(self, key):
+        value = self.connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return value[0] if value else None
+
+    @staticmethod
+    def setMeta(connection, key, value):
+        connection.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+    def exists(self) -> bool:
+        """Check whether the index has been built."""
+        return os.path.exists(self.path) and self.getMeta('built') != None
+
+    def count(self) -> int:
+        return self.connection().execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def build(self, api, progress=None) -> int:
+        """Build the index from a listing of every file in the drive, including the trash.
+
+        The new index is written beside the old one, which can be searched until
+        the new one replaces it.
+
+        Args:
+            api: The API to list the drive with.
+            progress: Called with the number of files listed after each page, or None for no output.
+
+        Returns:
+            The number of files indexed.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        # Taken first, so changes made while listing are picked up by the next refresh
+        page_token = api.getStartPageToken()
+        root_id = api.getFile('root', fields='id')['id']
+        new_path = self.path + '.new'
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(new_path + suffix):
+                os.remove(new_path + suffix)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Indexing the trigrams of every row at once is about four times faster than by the triggers
+        connection = self.open(new_path, trigram=False)
+        rows = {}
+        for page in api.iterPages(fields=INDEX_FIELDS):
+            for file in page:
+                rows[file['id']] = row(file)
+            if progress:
+                progress(len(rows))
+        paths = findPaths({file_id: (file[1], file[3]) for file_id, file in rows.items()}, root_id)
+        with connection:
+            connection.executemany(INSERT, ((*file, paths[file_id]) for file_id, file in rows.items()))
+            self.createTrigrams(connection)
+            if self.trigram:
+                connection.execute("INSERT INTO names (names) VALUES ('rebuild')")
+            self.setMeta(connection, 'root', root_id)
+            self.setMeta(connection, 'pageToken', page_token)
+            self.setMeta(connection, 'built', time.time())
+            self.setMeta(connection, 'refreshed', time.time())
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        connection.close()
+        self.close()
+        os.replace(new_path, self.path)
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+        return len(rows)
+
+    def refresh(self, api) -> int:
+        """Apply the changes made to the drive since the index was built or last refreshed.
+
+        Args:
+            api: The API to get the changes feed with.
+
+        Returns:
+            The number of changes applied.
+
+        Raises:
+            HttpError: An error occured in the request.
+        """
+        changes, page_token = api.getChanges(self.getMeta('pageToken'), fields=f"fileId, removed, file({INDEX_FIELDS})")
+        with self.connection() as connection:
+            for change in changes:
+                if change.get('removed') or change.get('file') is None:
+                    connection.execute("DELETE FROM files WHERE id = ?", (change['fileId'],))
+                else:
+                    connection.execute(UPSERT, row(change['file']))
+            if changes:
+                self.updatePaths(connection, self.getMeta('root'))
+            self.setMeta(connection, 'pageToken', page_token)
+            self.setMeta(connection, 'refreshed', time.time())
+        return len(changes)
+
+    @staticmethod
+    def updatePaths(connection, root_id):
+        """Work out the path of every file again, storing those which changed, eg. after a folder is renamed."""
+        files = {file_id: (name, parent, path) for file_id, name, parent, path
+                 in connection.execute("SELECT id, name, parent, path FROM files")}
+        paths = findPaths(files, root_id)
+        connection.executemany("UPDATE files SET path = ? WHERE id = ?",
+                               ((paths[file_id], file_id) for file_id, file in files.items() if paths[file_id] != file[2]))
+
+    def search(self, term, fuzzy=False, paths=False, match=False, trash=False, folder_id=None, limit=None) -> list:
+        """Search the names, or paths, of the indexed files.
+
+        Args:
+            term: The term to search for. Case is ignored.
+            fuzzy: A flag to also find names which are similar to the term, eg. with a typo. The best matches come first.
+            paths: A flag to match the term against the whole path of each file instead of its name.
+            match: A flag to only find names which are exactly the term.
+            trash: A flag to search items marked as trash instead.
+            folder_id: Only find files directly inside this folder.
+            limit: The maximum number of files to return.
+
+        Returns:
+            A list of the found files, each with its id, name, path, mimeType, parents, size, modifiedTime and trashed fields.
+        """
+        column = 'path' if paths else 'name'
+        filters = " AND files.trashed = ?"
+        values = [int(trash)]
+        if folder_id != None:
+            filters += " AND files.parent = ?"
+            values.append(folder_id)
+        connection = self.connection()
+        if match:
+            rows = connection.execute(f"SELECT * FROM files WHERE {column} = ? COLLATE NOCASE{filters}", [term, *values])
+        elif fuzzy:
+            grams = trigrams(term)
+            if self.trigram and grams:
+                candidates = connection.execute(
+                    f"SELECT files.* FROM names JOIN files ON files.key = names.rowid WHERE names MATCH ?{filters}",
+                    [f"{column} : ({' OR '.join(phrase(gram) for gram in grams)})", *values])
+            else:
+                candidates = connection.execute(f"SELECT * FROM files WHERE 1{filters}", values)
+            # Only the names sharing the most trigrams are worth the slower comparison
+            candidates = heapq.nlargest(FUZZY_CANDIDATES, candidates, key=lambda file: len(grams & trigrams(file[column])))
+            scored = [(similarity(term, file[column]), file) for file in candidates]
+            rows = [file for score, file in sorted(scored, key=lambda item: (-item[0], len(item[1][column])))
+                    if score >= FUZZY_THRESHOLD]
+        elif self.trigram and len(term) >= 3:
+            rows = connection.execute(
+                f"SELECT files.* FROM names JOIN files ON files.key = names.rowid "
+                f"WHERE names MATCH ?{filters} ORDER BY length(files.{column}), files.path", [f"{column} : {phrase(term)}", *values])
+        else:
+            escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            rows = connection.execute(f"SELECT * FROM files WHERE {column} LIKE ? ESCAPE '\\'{filters} "
+                                      f"ORDER BY length({column}), path", [f"%{escaped}%", *values])
+        found = []
+        for file in rows:
+            if limit != None and len(found) >= limit:
+                break
+            found.append({'id': file['id'], 'name': file['name'], 'path': file['path'], 'mimeType': file['mimeType'],
+                          'parents': [file['parent']] if file['parent'] else [], 'size': file['size'],
+                          'modifiedTime': file['modifiedTime'], 'trashed': bool(file['trashed'])})
+        return found
@@ -0,0 +1,31 @@
+import threading
+
+
+class MimeDetector:
+    """Detects the mimetype of local files with one shared libmagic handle.
+
+    Loading the magic database is slow, so a single detector should be shared.
+    libmagic handles aren't thread-safe, so lookups from several threads are serialised.
+    """
+
+    def __init__(self):
+        import magic
+        self.magic = magic.Magic(mime=True)
+        self.lock = threading.Lock()
+
+    def fromFile(self, path) -> str:
+        with self.lock:
+            return self.magic.from_file(path)
+
+
+detector = None
+detector_lock = threading.Lock()
+
+
+def detectMimeType(path) -> str:
+    """Get the mimetype of a local file using the shared detector."""
+    global detector
+    with detector_lock:
+        if detector is None:
+            detector = MimeDetector()
+    return detector.fromFile(path)
@@ -0,0 +1,129 @@
+import csv
+import io
+import json
+import sys
+
+FORMATS = ['text', 'ndjson', 'csv', 'tsv']
+DEFAULT_FIELDS = "name, id, parents"
+LABELS = {'id': 'ID'}  # Labels of the text format which aren't just the capitalised field name
+
+
+def fieldNames(fields) -> list:
+    """Split a field mask into its top level fields, eg. "id, owners(emailAddress)" into ['id', 'owners']."""
+    names = []
+    name = ''
+    depth = 0
+    for char in fields + ',':
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            if name.strip():
+                names.append(name.strip())
+            name = ''
+        elif depth == 0:
+            name += char
+    return names
+
+
+def cell(value) -> str:
+    """Flatten a value into one CSV cell. Lists of strings are joined with commas, and anything else nested is JSON."""
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, tuple)) and all(isinstance(item, str) for item in value):
+        return ','.join(value)
+    return json.dumps(value)
+
+
+class Writer:
+    """Writes files to a stream a page at a time.
+
+    Each page is formatted into one string and written with a single write followed
+    by a flush, so output is produced as pages arrive while costing one system call
+    per page instead of several per file.
+    """
+
+    def __init__(self, fields, stream=None):
+        """Create the writer.
+
+        Args:
+            fields: The field mask the files were requested with. Its top level fields are written in order.
+            stream: The text stream to write to. Default is stdout.
+        """
+        self.fields = fields
+        self.names = fieldNames(fields)
+        self.stream = stream or sys.stdout
+        self.count = 0
+
+    def writePage(self, files):
+        self.count += len(files)
+        self.stream.write(self.format(files))
+        self.stream.flush()
+
+    def format(self, files) -> str:
+        raise NotImplementedError
+
+    def close(self):
+        self.stream.flush()
+
+
+class TextWriter(Writer):
+    """Writes each file as a line per field, eg. "Name: report.pdf", followed by a separator."""
+
+    def format(self, files) -> str:
+        labels = [LABELS.get(name, name[:1].upper() + name[1:]) for name in self.names]
+        return ''.join(
+            ''.join(f"{label}: {file.get(name)}\n" for label, name in zip(labels, self.names)) + "-------------------------------\n"
+            for file in files)
+
+    def close(self):
+        if self.count == 0:
+            self.stream.write('No files found.\n')
+        super().close()
+
+
+class NdjsonWriter(Writer):
+    """Writes each file as a line of JSON with the requested fields it has, eg. for jq."""
+
+    def format(self, files) -> str:
+        return ''.join(json.dumps({name: file[name] for name in self.names if name in file}, separators=(',', ':')) + '\n'
+                       for file in files)
+
+
+class CsvWriter(Writer):
+    """Writes a header of the field names, then a row for each file."""
+
+    def __init__(self, fields, stream=None, delimiter=','):
+        super().__init__(fields, stream)
+        self.delimiter = delimiter
+        self.stream.write(self.rows([self.names]))
+
+    def rows(self, rows) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer, delimiter=self.delimiter, lineterminator='\n').writerows(rows)
+        return buffer.getvalue()
+
+    def format(self, files) -> str:
+        return self.rows([cell(file.get(name)) for name in self.names] for file in files)
+
+
+def openWriter(format='text', fields=None, stream=None) -> Writer:
+    """Create the writer for an output format.
+
+    Args:
+        format: One of FORMATS.
+        fields: The field mask to request and write. Default is DEFAULT_FIELDS.
+        stream: The text stream to write to. Default is stdout.
+
+    Returns:
+        The Writer.
+    """
+    fields = fields or DEFAULT_FIELDS
+    if format == 'ndjson':
+        return NdjsonWriter(fields, stream)
+    if format in ('csv', 'tsv'):
+        return CsvWriter(fields, stream, ',' if format == 'csv' else '\t')
+    return TextWriter(fields, stream)
@@ -0,0 +1,158 @@
+from collections import OrderedDict
+
+from api import filesQuery
+from bulk import FOLDER_MIME_TYPE
+from errors import PathNotFoundError
+
+NAMES_PER_QUERY = 50  # Names looked up in one query, since queries are limited in length
+MAX_PATHS = 10000  # Resolved paths remembered, the least recently used are forgotten first
+
+
+def isPath(value) -> bool:
+    """Check whether an argument is a path in the drive, eg. /Projects/logo.png, rather than an ID."""
+    return isinstance(value, str) and value.startswith('/')
+
+
+def splitPath(path) -> tuple:
+    """Split a path into the names of its parts, ignoring repeated and trailing slashes."""
+    return tuple(name for name in path.split('/') if name)
+
+
+class PathResolver:
+    """Resolves paths in My Drive to file IDs, remembering the most recently used.
+
+    Paths are resolved a level at a time. At each level, the names wanted in every
+    folder are found with one query per folder, restricted to those names, and the
+    queries of all folders are sent in batches. Folders with more names wanted than
+    fit in a query are listed instead, so resolving a thousand files in one folder
+    costs a page of listing per thousand files in it.
+
+    If a folder has several files with the same name, a folder is preferred where
+    the path continues, otherwise the first one Drive lists is used.
+    """
+
+    def __init__(self, api, max_entries=MAX_PATHS):
+        """Create the resolver.
+
+        Args:
+            api: The API to look up names with.
+            max_entries: The number of resolved paths and folders leading to them to remember.
+        """
+        self.api = api
+        self.max_entries = max_entries
+        self.ids = OrderedDict()  # The ID of each path, as the tuple of its names, in order of use
+
+    def remember(self, parts, file_id):
+        self.ids[parts] = file_id
+        self.ids.move_to_end(parts)
+        while len(self.ids) > self.max_entries:
+            self.ids.popitem(last=False)
+
+    def recall(self, parts):
+        file_id = self.ids.get(parts)
+        if file_id != None:
+            self.ids.move_to_end(parts)
+        return file_id
+
+    def clear(self):
+        self.ids.clear()
+
+    def resolve(self, path) -> str:
+        """Find the ID of the file at a path.
+
+        Args:
+            path: The path of the file, starting from My Drive, eg. /Projects/logo.png.
+
+        Returns:
+            The ID of the file.
+
+        Raises:
+            HttpError: An error occured in a request.
+            PathNotFoundError: There is no file at the path.
+        """
+        found = self.resolveAll([path])
+        if path not in found:
+            raise PathNotFoundError(path)
+        return found[path]
+
+    def resolveAll(self, paths) -> dict:
+        """Find the IDs of the files at many paths, looking up the names shared by them once.
+
+        Args:
+            paths: An iterable of paths starting from My Drive.
+
+        Returns:
+            A dict of each path to the ID of its file. Paths with no file are left out.
+
+        Raises:
+            HttpError: An error occured in a request.
+        """
+        targets = {path: splitPath(path) for path in paths}
+        found = {(): 'root'}  # Held for the whole call, in case remembered paths are forgotten before it ends
+        for depth in range(1, max((len(parts) for parts in targets.values()), default=0) + 1):
+            wanted = {}  # The names to look up in each folder at this depth
+            continues = set()  # The parts which must be folders, since the path continues after them
+            for parts in targets.values():
+                if len(parts) < depth or parts[:depth - 1] not in found:
+                    continue
+                if len(parts) > depth:
+                    continues.add(parts[:depth])
+                if parts[:depth] in found:
+                    continue
+                file_id = self.recall(parts[:depth])
+                if file_id != None:
+                    found[parts[:depth]] = file_id
+                else:
+                    wanted.setdefault(parts[:depth - 1], set()).add(parts[depth - 1])
+            folders = {}  # A folder can be reached by several paths, but is only looked up once
+            for parent, names in wanted.items():
+                folders.setdefault(found[parent], set()).update(names)
+            children = self.lookUp(folders)
+            for parent, names in wanted.items():
+                self.choose(parent, children[found[parent]], names, continues, found)
+        for parts, file_id in found.items():
+            if parts:
+                self.remember(parts, file_id)
+        return {path: found[parts] for path, parts in targets.items() if parts in found}
+
+    def lookUp(self, wanted) -> dict:
+        """Find the files with the wanted names in each folder, by batched queries or by listing the folder.
+
+        Args:
+            wanted: A dict of each folder ID to the set of names to find in it.
+
+        Returns:
+            A dict of each folder ID to a list of the files found in it.
+
+        Raises:
+            HttpError: An error occured in a request.
+        """
+        found = {}
+        queries = {}
+        for folder_id, names in wanted.items():
+            if len(names) > NAMES_PER_QUERY:
+                files = []
+                for page in self.api.iterPages(filesQuery(folder_id=folder_id), "id, name, mimeType", folder_id):
+                    files.extend(file for file in page if file['name'] in names)
+                found[folder_id] = files
+            else:
+                queries[folder_id] = sorted(names)
+        for folder_id, files, error in self.api.findChildren(queries):
+            if error != None:
+                raise error
+            found[folder_id] = files
+        return found
+
+    def choose(self, parent, files, names, continues, found):
+        """Record the file chosen for each wanted name in a folder, preferring folders where the path continues."""
+        by_name = {}
+        for file in files:
+            by_name.setdefault(file['name'], []).append(file)
+        for name in names:
+            matches = by_name.get(name)
+            if not matches:
+                continue
+            parts = (*parent, name)
+            if parts in continues:
+                matches = [file for file in matches if file.get('mimeType') == FOLDER_MIME_TYPE] or matches
+            found[parts] = matches[0]['id']
@@ -0,0 +1,70 @@
+import json
+import math
+import sys
+import threading
+
+SLOWEST = 10  # Number of slowest calls listed by a profile
+
+
+def percentile(values, fraction):
+    """Get a percentile of sorted values, using the nearest rank."""
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+class Tracer:
+    """Writes every request record from a RequestExecutor as a line of JSON."""
+
+    def __init__(self, path='-'):
+        """Open the trace.
+
+        Args:
+            path: The file to write the trace to, or '-' for stderr.
+        """
+        self.file = sys.stderr if path == '-' else open(path, 'w', buffering=1)
+        self.lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps({**record, 'thread': threading.current_thread().name})
+        with self.lock:
+            self.file.write(line + '\n')
+
+    def close(self):
+        if self.file is not sys.stderr:
+            self.file.close()
+
+
+class Profiler:
+    """Collects the request records from a RequestExecutor to summarise latency per endpoint."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = []
+
+    def __call__(self, record):
+        with self.lock:
+            self.records.append(record)
+
+    def summary(self) -> str:
+        """A table of the calls, errors, retries and p50/p95/p99 latency of each endpoint, then the slowest calls."""
+        with self.lock:
+            records = [*self.records]
+        if not records:
+            return "No requests were made."
+        methods = {}
+        for record in records:
+            methods.setdefault(record['method'], []).append(record)
+        lines = [f"{'Method':<32}{'Calls':>7}{'Errors':>8}{'Retries':>8}{'Total s':>9}"
+                 f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'Max ms':>9}{'KB':>10}"]
+        for method, calls in sorted(methods.items(), key=lambda item: -sum(r['seconds'] for r in item[1])):
+            latencies = sorted(record['seconds'] * 1000 for record in calls)
+            lines.append(
+                f"{method:<32}{len(calls):>7}{sum(1 for r in calls if r['error']):>8}"
+                f"{sum(1 for r in calls if r['attempt']):>8}{sum(latencies) / 1000:>9.2f}"
+                f"{percentile(latencies, 0.5):>9.0f}{percentile(latencies, 0.95):>9.0f}"
+                f"{percentile(latencies, 0.99):>9.0f}{latencies[-1]:>9.0f}"
+                f"{sum(r['bytes'] or 0 for r in calls) / 1024:>10.1f}")
+        lines.append(f"Slowest {min(SLOWEST, len(records))} calls:")
+        for record in sorted(records, key=lambda record: -record['seconds'])[:SLOWEST]:
+            outcome = record['error'] or record['status'] or ''
+            lines.append(f"  {record['seconds'] * 1000:>8.0f} ms  {record['method']}  {outcome}")
+        return "\n".join(lines)
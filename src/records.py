@@ -0,0 +1,126 @@
+from array import array
+from collections import Counter
+from itertools import accumulate
+
+from bulk import FOLDER_MIME_TYPE
+
+TABLE_FIELDS = "id, name, mimeType, parents, size"
+NO_PARENT = -1
+NO_SIZE = -1
+
+
+def intern(values, keys, value) -> int:
+    """The index of a value in a table of distinct values, adding it if it is new."""
+    key = keys.get(value)
+    if key is None:
+        key = keys[value] = len(values)
+        values.append(value)
+    return key
+
+
+class FileTable:
+    """A compact store of the files of a large listing, kept column by column.
+
+    A list of file dicts costs several hundred bytes per file, most of it in the
+    dict, the parents list and a separate copy of the parent ID for every child.
+    Here each file costs its ID and name strings and a few bytes in arrays: parent
+    IDs and MIME types are interned, so each row only holds their index, and sizes
+    are machine integers. Only the first parent of a file is kept, as files have had
+    a single parent since 2020.
+
+    Pages of results are added as they arrive with extend(). Files read back from
+    the table are dicts, like those of a listing. The files in each folder are found
+    with an index built the first time children() is called after files are added.
+    """
+
+    def __init__(self, files=None):
+        """Create the table.
+
+        Args:
+            files: An optional iterable of file dicts, as returned by the API, to add.
+        """
+        self.ids = []
+        self.names = []
+        self.parents = array('i')  # The index in parent_ids of each file's parent, or NO_PARENT
+        self.types = array('H')  # The index in mime_types of each file's MIME type
+        self.sizes = array('q')  # The size of each file's content, or the storage it uses if it has none, or NO_SIZE
+        self.parent_ids = []
+        self.parent_keys = {}
+        self.mime_types = []
+        self.mime_keys = {}
+        self.index = None  # (offsets, rows) of the children of each parent, built when first needed
+        if files != None:
+            self.extend(files)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, file, parent_id=None):
+        """Add a file.
+
+        Args:
+            file: The file dict, as returned by the API.
+            parent_id: The ID of the folder the file was listed in. (Default is the first of the file's parents)
+        """
+        if parent_id is None:
+            parents = file.get('parents')
+            parent_id = parents[0] if parents else None
+        size = file.get('size', file.get('quotaBytesUsed'))
+        self.ids.append(file['id'])
+        self.names.append(file.get('name'))
+        self.parents.append(NO_PARENT if parent_id is None else intern(self.parent_ids, self.parent_keys, parent_id))
+        self.types.append(intern(self.mime_types, self.mime_keys, file.get('mimeType')))
+        self.sizes.append(NO_SIZE if size is None else int(size))
+        self.index = None
+
+    def extend(self, files):
+        """Add every file of a page of results."""
+        for file in files:
+            self.append(file)
+
+    def __getitem__(self, row) -> dict:
+        """The file in a row, as a dict with the fields the table keeps which it has."""
+        file = {'id': self.ids[row]}
+        if self.names[row] != None:
+            file['name'] = self.names[row]
+        mime_type = self.mime_types[self.types[row]]
+        if mime_type != None:
+            file['mimeType'] = mime_type
+        if self.parents[row] != NO_PARENT:
+            file['parents'] = [self.parent_ids[self.parents[row]]]
+        if self.sizes[row] != NO_SIZE:
+            file['size'] = str(self.sizes[row])
+        return file
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def isFolder(self, row) -> bool:
+        return self.mime_types[self.types[row]] == FOLDER_MIME_TYPE
+
+    def size(self, row) -> int:
+        return max(self.sizes[row], 0)
+
+    def buildIndex(self):
+        """Sort the rows by parent into one array, with the offset of each parent's rows in another."""
+        counts = Counter(self.parents)
+        orphans = counts.pop(NO_PARENT, 0)
+        offsets = array('i', accumulate((counts[key] for key in range(len(self.parent_ids))), initial=orphans))
+        # A stable sort, so each parent's rows stay in the order they were added
+        rows = array('i', sorted(range(len(self)), key=self.parents.__getitem__))
+        self.index = offsets, rows
+
+    def childRows(self, parent_id):
+        """The rows of the files in a folder, in the order they were added."""
+        key = self.parent_keys.get(parent_id)
+        if key is None:
+            return array('i')
+        if self.index is None:
+            self.buildIndex()
+        offsets, rows = self.index
+        return rows[offsets[key]:offsets[key + 1]]
+
+    def children(self, parent_id) -> list:
+        """The files in a folder, as dicts."""
+        return [self[row] for row in self.childRows(parent_id)]
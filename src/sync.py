@@ -0,0 +1,279 @@
+import json
+import os
+import time
+from os.path import basename, dirname, exists, getmtime, getsize, join, relpath
+
+from bulk import FOLDER_MIME_TYPE, claimPath, isDownloadable, localName, remoteTime
+from mime import detectMimeType
+
+STATE_FILE = '.drive-sync.json'
+CLOCK_SKEW = 60  # Seconds the local clock may differ from Drive's
+DONE = {'download': 'Downloaded', 'upload': 'Uploaded', 'update': 'Updated'}
+FIELDS = "id, name, mimeType, size, modifiedTime, parents, trashed"
+
+
+class SyncState:
+    """The checkpoint of a synced folder, stored in its STATE_FILE.
+
+    Files map a path relative to the synced folder to the file's ID, the size and mtime
+    of the local copy after it was last synced, when it was synced and the remote
+    modifiedTime, if it is known. Folders map a
+    relative path to the folder's ID, with '' being the synced folder itself.
+    """
+
+    def __init__(self, path):
+        self.path = join(path, STATE_FILE)
+        state = {}
+        if exists(self.path):
+            with open(self.path) as f:
+                state = json.load(f)
+        self.folder_id = state.get('folderId')
+        self.page_token = state.get('pageToken')
+        self.files = state.get('files', {})
+        self.folders = state.get('folders', {})
+
+    def save(self):
+        state = {'folderId': self.folder_id, 'pageToken': self.page_token,
+                 'files': self.files, 'folders': self.folders}
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(self.path + '.tmp', self.path)
+
+    def record(self, rel, file_id, local_path, modified_time=None):
+        self.files[rel] = {'id': file_id, 'size': getsize(local_path), 'mtime': getmtime(local_path),
+                           'synced': time.time(), 'modifiedTime': modified_time}
+
+    def movePrefix(self, old, new):
+        """Move every file and folder below a renamed folder to its new path."""
+        for entries in (self.files, self.folders):
+            for rel in [rel for rel in entries if rel == old or rel.startswith(old + os.sep)]:
+                entries[new + rel[len(old):]] = entries.pop(rel)
+
+
+class Sync:
+    """Two-way sync of a local folder with a folder in the drive.
+
+    The first run transfers whatever is missing on either side and stores a checkpoint
+    from the changes feed. Later runs only look at the changes made in the drive since
+    the checkpoint, and at local files whose size or mtime differ from the last sync,
+    so unchanged files cost nothing. When a file changed on both sides, the newer copy wins.
+    """
+
+    def __init__(self, api, pool, path, folder_id, stats):
+        self.api = api
+        self.pool = pool
+        self.path = path
+        self.stats = stats
+        self.state = SyncState(path)
+        if self.state.folder_id not in (None, folder_id):
+            raise ValueError(f"{path} is already synced with folder {self.state.folder_id}")
+        self.state.folder_id = folder_id
+
+    def run(self):
+        """Sync both sides, saving the checkpoint once everything has been transferred.
+
+        If any transfer fails the checkpoint is left where it was, so the next run
+        fetches the same changes again and retries the files which failed.
+
+        Raises:
+            HttpError: An error occured in a request.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        if self.state.page_token is None:
+            # Take the checkpoint first, so changes made while listing are seen next run
+            page_token = self.api.getStartPageToken()
+            self.state.folders[''] = self.state.folder_id
+            remote, removed = self.listRemote(), set()
+        else:
+            changes, page_token = self.api.getChanges(
+                self.state.page_token, f"fileId, removed, file({FIELDS})")
+            remote, removed = self.applyChanges(changes)
+        if self.reconcile(remote, removed):
+            self.state.page_token = page_token
+        else:
+            print("Some files failed to transfer, they will be retried by the next sync.")
+        self.state.save()
+
+    def listRemote(self):
+        """List the whole remote tree, creating any missing local folders.
+
+        Returns:
+            A dict of relative path to file for every file in the tree.
+        """
+        remote = {}
+        claimed = {}
+        level = ['']
+        while level:
+            next_level = []
+            for rel_dir in level:
+                for file in self.api.iterFiles(folder_id=self.state.folders[rel_dir], fields=FIELDS):
+                    rel = claimPath(claimed, join(rel_dir, localName(file['name'])), file['id'], isDownloadable(file))
+                    if file['mimeType'] == FOLDER_MIME_TYPE:
+                        self.state.folders[rel] = file['id']
+                        os.makedirs(join(self.path, rel), exist_ok=True)
+                        next_level.append(rel)
+                    elif isDownloadable(file):
+                        remote[rel] = file
+            level = next_level
+        return remote
+
+    def applyChanges(self, changes):
+        """Work out which files in the tree changed remotely, applying folder changes locally.
+
+        Returns:
+            A tuple of a dict of relative path to file for every changed file, and a set of the relative paths of removed files.
+        """
+        folder_paths = {file_id: rel for rel, file_id in self.state.folders.items()}
+        file_paths = {entry['id']: rel for rel, entry in self.state.files.items()}
+        remote, removed = {}, set()
+        # Paths already in the tree stay with their files, unless the file is gone
+        gone = {change['fileId'] for change in changes if change.get('removed') or (change.get('file') or {}).get('trashed')}
+        claimed = {rel: entry['id'] for rel, entry in self.state.files.items() if entry['id'] not in gone}
+        claimed.update((rel, file_id) for rel, file_id in self.state.folders.items() if file_id not in gone)
+        pending = [change for change in changes if change.get('file') or change['fileId'] in folder_paths or change['fileId'] in file_paths]
+        # A new folder can appear in the feed after the files inside it, so repeat until nothing else resolves
+        resolved = True
+        while resolved:
+            resolved = False
+            for change in [*pending]:
+                file = change.get('file')
+                if change.get('removed') or file is None or file.get('trashed'):
+                    continue
+                parent = next((p for p in file.get('parents', []) if p in folder_paths), None)
+                if parent is None:
+                    continue
+                pending.remove(change)
+                resolved = True
+                rel = claimPath(claimed, join(folder_paths[parent], localName(file['name'])), file['id'], isDownloadable(file))
+                if file['mimeType'] == FOLDER_MIME_TYPE:
+                    old = folder_paths.get(file['id'])
+                    if old != None and old != rel and exists(join(self.path, old)):
+                        os.makedirs(dirname(join(self.path, rel)), exist_ok=True)
+                        os.replace(join(self.path, old), join(self.path, rel))
+                        self.state.movePrefix(old, rel)
+                        folder_paths = {file_id: path for path, file_id in self.state.folders.items()}
+                        file_paths = {entry['id']: path for path, entry in self.state.files.items()}
+                    os.makedirs(join(self.path, rel), exist_ok=True)
+                    self.state.folders[rel] = file['id']
+                    folder_paths[file['id']] = rel
+                elif isDownloadable(file):
+                    old = file_paths.get(file['id'])
+                    if old != None and old != rel:
+                        removed.add(old)
+                    remote[rel] = file
+        # Anything left was removed, trashed or moved out of the tree
+        for change in pending:
+            file_id = change['fileId']
+            if file_id in file_paths:
+                removed.add(file_paths[file_id])
+            elif file_id in folder_paths and folder_paths[file_id] != '':
+                old = folder_paths[file_id]
+                removed.update(rel for rel in self.state.files if rel.startswith(old + os.sep))
+                for rel in [rel for rel in self.state.folders if rel == old or rel.startswith(old + os.sep)]:
+                    del self.state.folders[rel]
+        return remote, removed
+
+    def scanLocal(self):
+        """Get the size and mtime of every local file, and create remote folders for new local folders."""
+        local = {}
+        for dirpath, dirnames, filenames in os.walk(self.path):
+            rel_dir = relpath(dirpath, self.path)
+            rel_dir = '' if rel_dir == '.' else rel_dir
+            for dirname_ in dirnames:
+                rel = join(rel_dir, dirname_)
+                if rel not in self.state.folders:
+                    self.state.folders[rel] = self.api.createFolder(dirname_, self.state.folders[rel_dir])
+                    print(f"Created folder {rel}")
+            for filename in filenames:
+                if filename in (STATE_FILE, STATE_FILE + '.tmp') or filename.endswith(('.part', '.part.json')):
+                    continue
+                stat = os.stat(join(dirpath, filename))
+                local[join(rel_dir, filename)] = (stat.st_size, stat.st_mtime)
+        return local
+
+    def reconcile(self, remote, removed):
+        """Decide what to do with every file which changed on either side, then do it.
+
+        Returns:
+            Whether every transfer succeeded.
+        """
+        # Folders deleted locally are trashed in the drive
+        for rel in [rel for rel in self.state.folders if rel != '' and not exists(join(self.path, rel))]:
+            if not any(rel == r or r.startswith(rel + os.sep) for r in remote):
+                self.api.trashFile(self.state.folders.pop(rel))
+                print(f"Trashed folder {rel}")
+        local = self.scanLocal()
+        actions = []
+        for rel in set(self.state.files) | set(local) | set(remote) | removed:
+            known = self.state.files.get(rel)
+            stat = local.get(rel)
+            file = remote.get(rel)
+            local_changed = stat != None and (known is None or stat != (known['size'], known['mtime']))
+            local_deleted = known != None and stat is None
+            remote_changed = file != None and self.remoteChanged(known, file)
+            remote_removed = rel in removed and file is None
+
+            if known is None and stat != None and file != None and int(file.get('size', -1)) == stat[0]:
+                # Already on both sides, as happens on the first run
+                self.state.record(rel, file['id'], join(self.path, rel), file['modifiedTime'])
+            elif remote_changed and (local_changed or local_deleted):
+                # Changed on both sides, the newer copy wins
+                if local_deleted or remoteTime(file['modifiedTime']) > stat[1]:
+                    actions.append(('download', rel, file['id']))
+                else:
+                    actions.append(('update', rel, file['id']))
+            elif remote_changed:
+                actions.append(('download', rel, file['id']))
+            elif remote_removed:
+                if local_changed:
+                    actions.append(('upload', rel, None))
+                else:
+                    if stat != None:
+                        os.remove(join(self.path, rel))
+                        print(f"Deleted {rel}")
+                    self.state.files.pop(rel, None)
+            elif local_deleted:
+                self.api.trashFile(known['id'])
+                del self.state.files[rel]
+                print(f"Trashed {rel}")
+            elif local_changed:
+                actions.append(('update', rel, known['id']) if known else ('upload', rel, None))
+
+        failed = False
+        for (action, rel, _), result, error in self.pool.run(self.transfer, actions):
+            if error:
+                failed = True
+                self.stats.fail()
+                print(f"Failed to {action} {rel}: {error}")
+            else:
+                file_id, size = result
+                self.stats.add(size)
+                print(f"{self.stats.progress()} {DONE[action]} {rel}")
+                modified_time = remote[rel]['modifiedTime'] if action == 'download' else None
+                self.state.record(rel, file_id, join(self.path, rel), modified_time)
+        if not actions:
+            print("Everything is up to date.")
+        return not failed
+
+    def remoteChanged(self, known, file) -> bool:
+        if known is None:
+            return True
+        if known['modifiedTime'] != None:
+            return file['modifiedTime'] != known['modifiedTime']
+        # The file was last sent by this tool, so the change is usually the upload itself
+        changed = int(file.get('size', -1)) != known['size'] or remoteTime(file['modifiedTime']) > known['synced'] + CLOCK_SKEW
+        if not changed:
+            known['modifiedTime'] = file['modifiedTime']
+        return changed
+
+    def transfer(self, api, item):
+        action, rel, file_id = item
+        path = join(self.path, rel)
+        if action == 'download':
+            os.makedirs(dirname(path), exist_ok=True)
+            api.downloadFile(file_id, path, progress=False)
+        elif action == 'update':
+            api.updateFile(file_id, basename(path), path, detectMimeType(path), progress=False)
+        else:
+            file_id = api.uploadFile(basename(path), path, detectMimeType(path), self.state.folders[dirname(rel)], progress=False)
+        return file_id, getsize(path)
@@ -0,0 +1,314 @@
+import json
+import os
+import threading
+import time
+
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseDownload
+from cache import CACHE_DIR
+from executor import RecordingHttp, default_executor, methodName, observeResponse
+
+DEFAULT_CHUNK_SIZE = 100 * 1024 * 1024
+UPLOAD_CHUNK_MULTIPLE = 256 * 1024  # Upload chunks must be a multiple of this
+SESSION_MAX_AGE = 6 * 24 * 60 * 60  # Drive forgets upload sessions after a week
+READ_SIZE = 1024 * 1024  # Bytes written to disk at a time when streaming a response
+
+
+class ResumableDownload(MediaIoBaseDownload):
+    """A MediaIoBaseDownload which starts part way through the file.
+
+    Each chunk is requested with a Range header starting at the current progress,
+    so starting at an offset continues a download that was interrupted.
+    """
+
+    def __init__(self, fd, request, chunksize=DEFAULT_CHUNK_SIZE, offset=0):
+        super().__init__(fd, request, chunksize=chunksize)
+        self._progress = offset
+
+
+def printProgress(status):
+    print("Download %d%%." % int(status.progress() * 100))
+
+
+def remoteVersion(file):
+    """Identify the content of a file in the drive, by its md5Checksum or else its modifiedTime."""
+    return file.get('md5Checksum') or file.get('modifiedTime')
+
+
+def partialVersion(part_path):
+    """Get the version of the remote file a partial download was started from, or None if it wasn't saved."""
+    try:
+        with open(part_path + '.json') as f:
+            return json.load(f).get('version')
+    except (OSError, ValueError):
+        return None
+
+
+def savePartialVersion(part_path, version):
+    """Save the version of the remote file beside a partial download, or remove it if version is None."""
+    if version is None:
+        if os.path.exists(part_path + '.json'):
+            os.remove(part_path + '.json')
+        return
+    with open(part_path + '.json', 'w') as f:
+        json.dump({'version': version}, f)
+
+
+def downloadToFile(request, path, chunk_size=None, resume=True, progress=printProgress, call=default_executor.call, version=None) -> int:
+    """Stream a media request straight into a file on disk.
+
+    The content is written to `<path>.part` and moved to path once complete. When
+    resume is set and a partial file remains from an interrupted download, the
+    transfer carries on from the end of it, as long as it was started from the same
+    version of the remote file. The version is saved in `<path>.part.json`, and a
+    partial file of another version is discarded, as the file has changed since.
+
+    Args:
+        request: The get_media or export_media request.
+        path: The local path to save the content to.
+        chunk_size: The number of bytes requested at a time. (Default is 100MB)
+        resume: A flag to continue from an existing partial file. Exports should not be resumed as they do not support ranges.
+        progress: Called with the download status after each chunk, or None for no output.
+        call: Used to send each chunk request, retrying chunks which fail. (Default is the shared RequestExecutor)
+        version: Identifies the content of the remote file, from remoteVersion(). If None is given, only a partial file saved without a version is resumed.
+
+    Returns:
+        The size of the downloaded file in bytes.
+
+    Raises:
+        HttpError: An error occured in the request.
+    """
+    part_path = path + '.part'
+    resumable = resume and os.path.exists(part_path) and partialVersion(part_path) == version
+    offset = os.path.getsize(part_path) if resumable else 0
+    if offset == 0:
+        savePartialVersion(part_path, version)
+    request.http = RecordingHttp(request.http)
+    try:
+        size = _download(request, part_path, chunk_size or DEFAULT_CHUNK_SIZE, offset, progress, call)
+    except HttpError as error:
+        if offset == 0 or error.resp.status != 416:
+            raise
+        # The partial file doesn't fit the remote file any more, start over
+        size = _download(request, part_path, chunk_size or DEFAULT_CHUNK_SIZE, 0, progress, call)
+    os.replace(part_path, path)
+    savePartialVersion(part_path, None)
+    return size
+
+
+def _download(request, part_path, chunk_size, offset, progress, call):
+    method = f"{methodName(request)} (media)"
+    with open(part_path, 'ab' if offset else 'wb') as f:
+        downloader = ResumableDownload(f, request, chunk_size, offset)
+        done = False
+        while not done:
+            status, done = call(downloader.next_chunk, method=method)
+            if progress:
+                progress(status)
+        return status.resumable_progress
+
+
+def mediaSession(http):
+    """Create a requests session authorised with the same credentials as the http of a Drive service."""
+    from google.auth.credentials import Credentials
+    credentials = getattr(http, 'credentials', None)
+    if not isinstance(credentials, Credentials):
+        import requests
+        return requests.Session()  # Not authorised by google-auth, eg. sending to a local fake drive
+    from google.auth.transport.requests import AuthorizedSession
+    return AuthorizedSession(credentials)
+
+
+def responseError(response, uri) -> HttpError:
+    """Build the same HttpError the discovery client raises from a failed requests response."""
+    import httplib2
+    resp = httplib2.Response({'status': str(response.status_code), **{key.lower(): value for key, value in response.headers.items()}})
+    resp.reason = response.reason
+    return HttpError(resp, response.content, uri=uri)
+
+
+def streamToFile(request, path, session, read_size=None, call=default_executor.call) -> int:
+    """Stream a media request straight into a file on disk as the response arrives.
+
+    httplib2 reads a whole response into memory before returning it, so the request
+    is sent through a requests session instead. The content is written to
+    `<path>.part` and moved to path once complete. Ranges aren't used, so this suits
+    exports, which don't support them, and an interrupted transfer starts over.
+
+    Args:
+        request: The export_media or get_media request, whose URI and headers are sent.
+        path: The local path to save the content to.
+        session: The requests session to send the request with, from mediaSession().
+        read_size: The number of bytes written to disk at a time. (Default is 1MB)
+        call: Used to send the request, retrying it if it fails. (Default is the shared RequestExecutor)
+
+    Returns:
+        The size of the saved file in bytes.
+
+    Raises:
+        HttpError: An error occured in the request.
+    """
+    part_path = path + '.part'
+
+    def send():
+        with session.get(request.uri, headers=request.headers, stream=True) as response:
+            if response.status_code >= 300:
+                raise responseError(response, request.uri)
+            size = 0
+            with open(part_path, 'wb') as f:
+                for chunk in response.iter_content(read_size or READ_SIZE):
+                    f.write(chunk)
+                    size += len(chunk)
+            observeResponse(response.status_code, size)
+            return size
+
+    size = call(send, method=f"{methodName(request)} (media)")
+    os.replace(part_path, path)
+    return size
+
+
+class UploadSessions:
+    """Remembers the session of each resumable upload until it completes.
+
+    Sessions are stored in uploads.json in the cache directory, keyed by what is
+    being uploaded and where to. A session is only reused while the local file has
+    the same size and mtime as when the upload started.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, 'uploads.json')
+        self.lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self.sessions = json.load(f)
+        except (OSError, ValueError):
+            self.sessions = {}
+
+    def get(self, key, stat):
+        """Get the saved session of an upload, or None if there isn't one which can still be used."""
+        with self.lock:
+            session = self.sessions.get(key)
+        if (session and session['size'] == stat.st_size and session['mtime'] == stat.st_mtime_ns
+                and time.time() - session['started'] < SESSION_MAX_AGE):
+            return session
+        return None
+
+    def put(self, key, stat, uri, offset):
+        with self.lock:
+            session = self.sessions.get(key)
+            started = session['started'] if session and session['uri'] == uri else time.time()
+            self.sessions[key] = {'uri': uri, 'offset': offset, 'size': stat.st_size,
+                                  'mtime': stat.st_mtime_ns, 'started': started}
+            self.save()
+
+    def remove(self, key):
+        with self.lock:
+            if self.sessions.pop(key, None) != None:
+                self.save()
+
+    def save(self):
+        now = time.time()
+        for key in [key for key, session in self.sessions.items() if now - session['started'] >= SESSION_MAX_AGE]:
+            del self.sessions[key]
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(self.sessions, f)
+            os.replace(self.path + '.tmp', self.path)
+        except OSError:
+            pass  # The upload just can't be resumed by a later run
+
+
+upload_sessions = None
+upload_sessions_lock = threading.Lock()
+
+
+def uploadSessions() -> UploadSessions:
+    """Get the shared UploadSessions."""
+    global upload_sessions
+    with upload_sessions_lock:
+        if upload_sessions is None:
+            upload_sessions = UploadSessions()
+    return upload_sessions
+
+
+def chunkSize(chunk_size) -> int:
+    """Round an upload chunk size up to a multiple of 256KB, which Drive requires."""
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    return -(-chunk_size // UPLOAD_CHUNK_MULTIPLE) * UPLOAD_CHUNK_MULTIPLE
+
+
+def printUploadProgress(status, rate):
+    print("Upload %d%%, %.1f of %.1f MB at %.1f MB/s." % (
+        int(status.progress() * 100), status.resumable_progress / 1024 ** 2,
+        status.total_size / 1024 ** 2, rate / 1024 ** 2))
+
+
+def uploadFromFile(request, key, file_path, progress=printUploadProgress, call=default_executor.call):
+    """Send a resumable upload chunk by chunk, saving the session so an interrupted upload can continue.
+
+    When a session was saved for the same key by an earlier run, the session is
+    asked how many bytes it already has and the upload carries on from there.
+    Sessions which have expired are started again from the beginning.
+
+    Args:
+        request: The create or update request with a resumable MediaFileUpload.
+        key: Identifies the upload, eg. the local path and the target folder and name.
+        file_path: The path of the file being uploaded.
+        progress: Called with the upload status and the throughput in bytes per second after each chunk, or None for no output.
+        call: Used to send each chunk, retrying chunks which fail. (Default is the shared RequestExecutor)
+
+    Returns:
+        The response of the request once the whole file is uploaded.
+
+    Raises:
+        HttpError: An error occured in the request.
+    """
+    sessions = uploadSessions()
+    stat = os.stat(file_path)
+    # Files sent in a single chunk have nothing to resume
+    persist = stat.st_size > request.resumable.chunksize()
+    saved = sessions.get(key, stat) if persist else None
+    if saved:
+        request.resumable_uri = saved['uri']
+        request._in_error_state = True  # Makes the first chunk ask the session how much it already has
+    request.http = RecordingHttp(request.http)
+    started = time.monotonic()
+    sent = 0
+    offset = None
+    response = None
+    while response is None:
+        try:
+            status, response = call(_nextChunk, request, method=f"{methodName(request)} (upload)")
+        except HttpError as error:
+            if not saved or error.resp.status not in (404, 410):
+                raise
+            # The saved session has expired, start a new one
+            saved = None
+            sessions.remove(key)
+            request.resumable_uri = None
+            request.resumable_progress = 0
+            request._in_error_state = False
+            continue
+        if status:
+            # Bytes sent by an earlier run don't count towards the throughput
+            sent += status.resumable_progress - offset if offset != None else min(request.resumable.chunksize(), status.resumable_progress)
+            offset = status.resumable_progress
+            if persist:
+                sessions.put(key, stat, request.resumable_uri, status.resumable_progress)
+            if progress:
+                elapsed = time.monotonic() - started
+                progress(status, sent / elapsed if elapsed > 0 else 0)
+    if persist:
+        sessions.remove(key)
+    return response
+
+
+def _nextChunk(request):
+    try:
+        return request.next_chunk()
+    except OSError:
+        # Part of the chunk may have arrived, so ask the session where to carry on from when retrying
+        if request.resumable_uri != None:
+            request._in_error_state = True
+        raise
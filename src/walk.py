@@ -0,0 +1,173 @@
+import sys
+import threading
+import time
+
+from bulk import FOLDER_MIME_TYPE
+from records import FileTable
+
+WALK_FIELDS = "id, name, mimeType, size, quotaBytesUsed"
+
+
+def fileSize(file) -> int:
+    """The size of a file's content, or the storage it uses if it has no content such as a Google Doc."""
+    return int(file.get('size') or file.get('quotaBytesUsed') or 0)
+
+
+def humanSize(size) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if size < 1024 or unit == 'TB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class WalkStats:
+    """Thread-safe counters of the folders and files found by a tree walk."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.folders = 0  # Folders listed
+        self.subfolders = 0  # Folders found inside them
+        self.files = 0
+        self.bytes = 0
+        self.failed = 0
+        self.start = time.monotonic()
+
+    def listed(self, files):
+        with self.lock:
+            self.folders += 1
+            for file in files:
+                if file['mimeType'] == FOLDER_MIME_TYPE:
+                    self.subfolders += 1
+                else:
+                    self.files += 1
+                    self.bytes += fileSize(file)
+
+    def fail(self):
+        with self.lock:
+            self.failed += 1
+
+    def elapsed(self) -> float:
+        return max(time.monotonic() - self.start, 1e-9)
+
+    def summary(self) -> str:
+        return (f"Listed {self.folders} folders in {self.elapsed():.1f}s, {self.folders / self.elapsed():.1f} folders/s. "
+                f"{self.failed} failed.")
+
+
+def walkTree(pool, folder_id, fields=WALK_FIELDS, maxdepth=None, stats=None, trash=False):
+    """Walk a folder tree in the drive breadth-first, listing every folder of a level concurrently.
+
+    Folders which fail to list are reported and skipped along with everything in them.
+    Shortcuts to folders are not followed.
+
+    Args:
+        pool: The WorkerPool to list folders with. Its number of jobs is the number of folders listed at once.
+        folder_id: The ID of the folder to walk.
+        fields: The field mask applied to each file. It must include id and mimeType.
+        maxdepth: The maximum depth to list, where the folder's children are at depth 1. If None is given, the whole tree is walked.
+        stats: The WalkStats to record the folders and files found in.
+        trash: False to leave out files in the trash, or None to walk everything, including folders in the trash.
+
+    Yields:
+        A tuple of (parent folder ID, depth, file) for every file and folder in the tree, one level at a time.
+    """
+    def listFolder(api, folder_id):
+        return [*api.iterFiles(trash, folder_id=folder_id, fields=fields)]
+
+    seen = {folder_id}
+    level = [folder_id]
+    depth = 1
+    while level and (maxdepth is None or depth <= maxdepth):
+        next_level = []
+        for parent_id, files, error in pool.run(listFolder, level):
+            if error:
+                if stats:
+                    stats.fail()
+                print(f"Failed to list folder {parent_id}, skipping its contents: {error}", file=sys.stderr)
+                continue
+            if stats:
+                stats.listed(files)
+            for file in files:
+                if file['mimeType'] == FOLDER_MIME_TYPE:
+                    if file['id'] in seen:
+                        continue  # Already found through another parent
+                    seen.add(file['id'])
+                    next_level.append(file['id'])
+                yield parent_id, depth, file
+        level = next_level
+        depth += 1
+
+
+class FolderTree:
+    """The folders found by a tree walk, with the totals of everything below each of them.
+
+    Every file and folder found is kept in a FileTable, so trees of millions of files fit in memory.
+    """
+
+    def __init__(self, folder_id, name):
+        self.root = folder_id
+        self.names = {folder_id: name}
+        self.parents = {}
+        self.table = FileTable()
+        self.order = [folder_id]  # Breadth-first, so every folder comes after its parent
+        self.files = {folder_id: 0}
+        self.bytes = {folder_id: 0}
+
+    def add(self, parent_id, file):
+        if file['mimeType'] == FOLDER_MIME_TYPE:
+            self.names[file['id']] = file['name']
+            self.parents[file['id']] = parent_id
+            self.order.append(file['id'])
+            self.files[file['id']] = 0
+            self.bytes[file['id']] = 0
+        else:
+            self.files[parent_id] += 1
+            self.bytes[parent_id] += fileSize(file)
+        self.table.append(file, parent_id)
+
+    def total(self):
+        """Add the totals of each folder to its parent, so every folder counts everything below it."""
+        for folder_id in reversed(self.order):
+            parent_id = self.parents.get(folder_id)
+            if parent_id != None:
+                self.files[parent_id] += self.files[folder_id]
+                self.bytes[parent_id] += self.bytes[folder_id]
+
+    def depth(self, folder_id) -> int:
+        depth = 0
+        while folder_id in self.parents:
+            folder_id = self.parents[folder_id]
+            depth += 1
+        return depth
+
+    def path(self, folder_id) -> str:
+        names = []
+        while folder_id != None:
+            names.append(self.names[folder_id])
+            folder_id = self.parents.get(folder_id)
+        return '/'.join(reversed(names))
+
+    def lines(self, folder_id=None, prefix=''):
+        """Draw the tree like the tree command, one line at a time."""
+        folder_id = folder_id or self.root
+        if not prefix:
+            yield self.names[folder_id]
+        table = self.table
+        children = sorted(table.childRows(folder_id), key=lambda row: (not table.isFolder(row), table.names[row]))
+        for i, row in enumerate(children):
+            last = i == len(children) - 1
+            if table.isFolder(row):
+                file_id = table.ids[row]
+                yield f"{prefix}{'└── ' if last else '├── '}{table.names[row]}/ ({self.files[file_id]} files, {humanSize(self.bytes[file_id])})"
+                yield from self.lines(file_id, prefix + ('    ' if last else '│   '))
+            else:
+                yield f"{prefix}{'└── ' if last else '├── '}{table.names[row]} ({humanSize(table.size(row))})"
+
+
+def buildTree(pool, folder_id, name, maxdepth=None, stats=None) -> FolderTree:
+    """Walk a folder tree and total the files and bytes below every folder."""
+    tree = FolderTree(folder_id, name)
+    for parent_id, depth, file in walkTree(pool, folder_id, maxdepth=maxdepth, stats=stats):
+        tree.add(parent_id, file)
+    tree.total()
+    return tree
@@ -0,0 +1,111 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+DEFAULT_JOBS = 8
+
+
+class WorkerPool:
+    """Runs API calls concurrently on a bounded number of threads.
+
+    httplib2 connections are not thread-safe, so each thread is given its own API,
+    and with it its own HTTP connection, from api_factory the first time it needs one.
+    The threads, and their connections, are kept until the pool is closed. A pool
+    created with keep set is not closed when used as a context manager, so that a
+    long-running process can reuse its warm connections for later commands.
+    """
+
+    def __init__(self, api_factory, jobs=DEFAULT_JOBS, keep=False):
+        self.api_factory = api_factory
+        self.jobs = jobs
+        self.keep = keep
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(max_workers=jobs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if not self.keep:
+            self.close()
+
+    def close(self):
+        self.executor.shutdown()
+
+    def api(self):
+        """Get the API belonging to the current thread."""
+        if not hasattr(self.local, 'api'):
+            self.local.api = self.api_factory()
+        return self.local.api
+
+    def run(self, func, items):
+        """Call func(api, item) for each item concurrently.
+
+        Items are consumed lazily and only a few are queued ahead of the workers, so
+        items can be a generator which is still fetching results, or which itself
+        runs work on the same pool.
+
+        Args:
+            func: The function to call with the thread's API and an item.
+            items: The items to process.
+
+        Yields:
+            A tuple of (item, result, error) for each item as it finishes. Error is None if func succeeded.
+        """
+        pending = {}
+        for item in items:
+            pending[self.executor.submit(self._call, func, item)] = item
+            if len(pending) >= self.jobs * 2:
+                yield from self._collect(pending)
+        while pending:
+            yield from self._collect(pending)
+
+    def _call(self, func, item):
+        return func(self.api(), item)
+
+    @staticmethod
+    def _collect(pending):
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            item = pending.pop(future)
+            error = future.exception()
+            yield item, None if error else future.result(), error
+
+
+class TransferStats:
+    """Thread-safe counters for reporting the progress and throughput of a bulk operation."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = 0
+        self.bytes = 0
+        self.skipped = 0
+        self.failed = 0
+        self.start = time.monotonic()
+
+    def add(self, size=0):
+        with self.lock:
+            self.files += 1
+            self.bytes += size
+
+    def skip(self):
+        with self.lock:
+            self.skipped += 1
+
+    def fail(self):
+        with self.lock:
+            self.failed += 1
+
+    def elapsed(self) -> float:
+        return max(time.monotonic() - self.start, 1e-9)
+
+    def rate(self) -> str:
+        elapsed = self.elapsed()
+        return f"{self.files / elapsed:.1f} files/s, {self.bytes / elapsed / 1e6:.2f} MB/s"
+
+    def progress(self) -> str:
+        return f"[{self.files} files, {self.bytes / 1e6:.1f} MB, {self.rate()}]"
+
+    def summary(self) -> str:
+        return (f"{self.files} files ({self.bytes / 1e6:.1f} MB) in {self.elapsed():.1f}s, {self.rate()}. "
+                f"{self.skipped} skipped, {self.failed} failed.")
@@ -0,0 +1,51 @@
+import os
+import sys
+import tempfile
+
+# The cache directory is read when the modules are imported, so point it somewhere disposable first
+os.environ['XDG_CACHE_HOME'] = tempfile.mkdtemp(prefix='google-drive-cli-tests-')
+os.environ.pop('GDRIVE_CLI_CACHE', None)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'src'), os.path.join(ROOT, 'benchmarks')]
+
+import pytest
+
+from fake_drive import FakeDriveServer, fakeService
+
+
+@pytest.fixture
+def server():
+    """A fake Drive with only My Drive in it."""
+    with FakeDriveServer() as server:
+        yield server
+
+
+@pytest.fixture
+def newApi(server):
+    """Create APIs sending requests to the fake Drive, sharing one executor."""
+    from api import API
+    from executor import RequestExecutor
+    executor = RequestExecutor()
+    return lambda cache=None: API(fakeService(server.url), cache, executor)
+
+
+@pytest.fixture
+def api(newApi):
+    return newApi()
+
+
+@pytest.fixture
+def pool(newApi):
+    from workers import WorkerPool
+    with WorkerPool(newApi, 4) as pool:
+        yield pool
+
+
+@pytest.fixture
+def runCli(server, monkeypatch):
+    """Run command lines against the fake Drive, with none of the state of earlier commands."""
+    import cli
+    monkeypatch.setattr(cli, 'timedBuild', lambda: fakeService(server.url))
+    for name in ('options', 'drive_service', 'metadata_cache', 'request_executor', 'profiler', 'path_resolver'):
+        monkeypatch.setattr(cli, name, None)
+    return lambda *argv: cli.run(cli.cli.parse_args([*argv]))
@@ -0,0 +1,98 @@
+import sqlite3
+
+import api as api_module
+from api import namesQuery, searchQuery
+from bulk import FOLDER_MIME_TYPE
+from cache import MetadataCache
+
+
+def test_search_query_escapes_term():
+    assert searchQuery("Bob's \\ notes") == "name contains 'Bob\\'s \\\\ notes' AND trashed = False"
+    assert searchQuery("Bob's", match=True, folder_id='abc') == "name = 'Bob\\'s' AND 'abc' in parents AND trashed = False"
+
+
+def test_names_query_escapes_names():
+    assert namesQuery(["it's", "a"], 'abc') == "'abc' in parents AND trashed = false AND (name = 'it\\'s' or name = 'a')"
+
+
+def test_search_finds_names_with_quotes(server, api):
+    file = server.drive.add("Bob's report.pdf")
+    server.drive.add("Alice's report.pdf")
+    assert [found['id'] for found in api.searchFile("Bob's report.pdf", match=True)] == [file['id']]
+    assert len(api.searchFile("'s report")) == 2
+
+
+def test_listing_follows_every_page(server, api, monkeypatch):
+    monkeypatch.setattr(api_module, 'PAGE_SIZE', 7)
+    folder = server.drive.add('folder', mime_type=FOLDER_MIME_TYPE)
+    ids = {server.drive.add(f"file{i}", parents=[folder['id']])['id'] for i in range(30)}
+    pages = list(api.iterPages(api_module.filesQuery(folder_id=folder['id']), "id"))
+    assert [len(page) for page in pages] == [7, 7, 7, 7, 2]
+    assert {file['id'] for page in pages for file in page} == ids
+
+
+def test_file_table_matches_listing(server, api, monkeypatch):
+    monkeypatch.setattr(api_module, 'PAGE_SIZE', 10)
+    folder = server.drive.add('folder', mime_type=FOLDER_MIME_TYPE)
+    for i in range(25):
+        server.drive.add(f"file{i}", parents=[folder['id']], content=b'x' * i)
+    table = api.fileTable(api_module.filesQuery(folder_id=folder['id']), folder['id'])
+    assert len(table) == 25
+    assert sorted(table.size(row) for row in table.childRows(folder['id'])) == list(range(25))
+
+
+def test_cache_answers_until_the_folder_changes(server, newApi, tmp_path):
+    api = newApi(MetadataCache(str(tmp_path / 'metadata.sqlite')))
+    folder = server.drive.add('folder', mime_type=FOLDER_MIME_TYPE)
+    first = server.drive.add('first', parents=[folder['id']])
+    assert [file['id'] for file in api.listFiles(folder_id=folder['id'])] == [first['id']]
+
+    # Changed behind the cache's back, so the cached listing is still used
+    second = server.drive.add('second', parents=[folder['id']])
+    requests = api.executor.stats.requests
+    assert [file['id'] for file in api.listFiles(folder_id=folder['id'])] == [first['id']]
+    assert api.executor.stats.requests == requests
+
+    # Changed through the API, so the listing is dropped
+    api.trashFile(first['id'])
+    assert [file['id'] for file in api.listFiles(folder_id=folder['id'])] == [second['id']]
+
+
+def test_cached_metadata_is_dropped_when_the_file_changes(server, newApi, tmp_path):
+    api = newApi(MetadataCache(str(tmp_path / 'metadata.sqlite')))
+    file = server.drive.add('file')
+    assert api.getFile(file['id'], fields="id, trashed")['trashed'] is False
+    api.trashFile(file['id'])
+    assert api.getFile(file['id'], fields="id, trashed")['trashed'] is True
+
+
+def test_cache_keeps_entries_for_a_longer_ttl(server, runCli, tmp_path):
+    import cli
+    path = str(tmp_path / 'metadata.sqlite')
+    MetadataCache(path).putFile('old', 'id', {'id': 'old'})
+    with sqlite3.connect(path) as connection:
+        connection.execute("UPDATE files SET fetched = fetched - 1200")
+    assert MetadataCache(path, ttl=3600).getFile('old', 'id') == {'id': 'old'}
+    assert MetadataCache(path).getFile('old', 'id') is None  # Evicted with the default TTL
+
+    MetadataCache().putFile('old', 'id', {'id': 'old'})
+    with sqlite3.connect(MetadataCache().path) as connection:
+        connection.execute("UPDATE files SET fetched = fetched - 1200")
+    cli.options = cli.cli.parse_args(['--cache', '--ttl', '3600', 'list'])
+    assert cli.getCache().getFile('old', 'id') == {'id': 'old'}
+
+
+def test_batches_pass_http_by_keyword(server, api, monkeypatch):
+    from googleapiclient import _helpers
+    monkeypatch.setattr(_helpers, 'positional_parameters_enforcement', _helpers.POSITIONAL_EXCEPTION)
+    file = server.drive.add('file')
+    assert [error for key, response, error in api.trashFiles([file['id']])] == [None]
+    assert server.drive.files[file['id']]['trashed'] is True
+
+
+def test_batches_keep_the_order_of_requests(server, api):
+    ids = [server.drive.add(f"file{i}")['id'] for i in range(150)]
+    results = list(api.getFiles([*ids, 'missing'], fields="id"))
+    assert [key for key, response, error in results] == [*ids, 'missing']
+    assert all(error is None and response['id'] == key for key, response, error in results[:-1])
+    assert results[-1][2].resp.status == 404
@@ -0,0 +1,83 @@
+import asyncio
+import os
+
+import pytest
+
+import async_api
+from async_api import AsyncAPI
+from bulk import FOLDER_MIME_TYPE
+from executor import RequestExecutor
+
+pytest.importorskip('aiohttp')
+
+
+@pytest.fixture
+def run(server):
+    """Run a coroutine function with an AsyncAPI opened on the fake Drive, returning its result."""
+    executor = RequestExecutor()
+
+    def run(func, **kwargs):
+        async def main():
+            async with AsyncAPI(executor=executor, root_url=server.url, **kwargs) as api:
+                return await func(api)
+        return asyncio.run(main())
+    run.executor = executor
+    return run
+
+
+def test_listing_follows_every_page(server, run, monkeypatch):
+    monkeypatch.setattr(async_api, 'PAGE_SIZE', 7)
+    folder = server.drive.add('folder', mime_type=FOLDER_MIME_TYPE)
+    ids = {server.drive.add(f"file{i}", parents=[folder['id']])['id'] for i in range(30)}
+
+    async def pages(api):
+        return [page async for page in api.iterPages(async_api.filesQuery(folder_id=folder['id']), "id")]
+    pages = run(pages)
+    assert [len(page) for page in pages] == [7, 7, 7, 7, 2]
+    assert {file['id'] for page in pages for file in page} == ids
+    assert {file['id'] for file in run(lambda api: api.listFiles(folder_id=folder['id']))} == ids
+
+
+def test_get_file(server, run):
+    file = server.drive.add("Bob's report.pdf", content=b'report')
+    found = run(lambda api: api.getFile(file['id'], fields="id, name, size"))
+    assert found == {'id': file['id'], 'name': "Bob's report.pdf", 'size': '6'}
+
+
+def test_errors_are_http_errors(server, run):
+    from googleapiclient.errors import HttpError
+    with pytest.raises(HttpError) as error:
+        run(lambda api: api.getFile('missing', fields="id"))
+    assert error.value.resp.status == 404
+    assert run.executor.stats.failed == 1
+
+
+def test_download_file(server, run, tmp_path):
+    content = os.urandom(3 * 1024 * 1024 + 10)
+    file = server.drive.add('big.bin', content=content)
+    path = str(tmp_path / 'big.bin')
+    assert run(lambda api: api.downloadFile(file['id'], path, chunk_size=1024 * 1024)) == path
+    with open(path, 'rb') as f:
+        assert f.read() == content
+    assert not os.path.exists(path + '.part')
+
+
+def test_many_files_are_changed_concurrently(server, run):
+    ids = [server.drive.add(f"file{i}")['id'] for i in range(50)]
+
+    async def trash(api):
+        return [result async for result in api.trashFiles([*ids, 'missing'])]
+    results = run(trash, concurrency=4)
+    assert sorted(key for key, response, error in results) == sorted([*ids, 'missing'])
+    assert [key for key, response, error in results if error] == ['missing']
+    assert all(server.drive.files[file_id]['trashed'] for file_id in ids)
+
+
+def test_requests_are_retried(server, run):
+    server.error_rate = 0.3
+    ids = [server.drive.add(f"file{i}")['id'] for i in range(20)]
+
+    async def get(api):
+        return await asyncio.gather(*(api.getFile(file_id, fields="id") for file_id in ids))
+    assert [file['id'] for file in run(get)] == ids
+    assert run.executor.stats.retried > 0
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from audit import AuditStats, auditRecord, auditTree
+from bulk import FOLDER_MIME_TYPE
+
+OWNER = {'type': 'user', 'role': 'owner', 'emailAddress': 'owner@example.com'}
+COLLEAGUE = {'type': 'user', 'role': 'writer', 'emailAddress': 'colleague@example.com'}
+PARTNER = {'type': 'user', 'role': 'reader', 'emailAddress': 'someone@partner.org'}
+ANYONE = {'type': 'anyone', 'role': 'reader', 'allowFileDiscovery': True}
+
+
+@pytest.fixture
+def tree(server):
+    drive = server.drive
+    top = drive.add('Projects', mime_type=FOLDER_MIME_TYPE)
+    sub = drive.add('sub', mime_type=FOLDER_MIME_TYPE, parents=[top['id']])
+    private = drive.add('private.txt', parents=[top['id']])
+    internal = drive.add('internal.txt', parents=[sub['id']])
+    public = drive.add('public.txt', parents=[sub['id']])
+    drive.permissions[internal['id']] = [OWNER, COLLEAGUE]
+    drive.permissions[public['id']] = [OWNER, ANYONE, PARTNER, {'type': 'domain', 'role': 'reader', 'domain': 'Other.com'}]
+    return {'top': top['id'], 'private': private['id'], 'internal': internal['id'], 'public': public['id']}
+
+
+def test_record_of_a_file_shared_outside_the_owners_domain():
+    record = auditRecord({'id': 'a'}, 'Projects/a', [OWNER, COLLEAGUE, PARTNER, ANYONE])
+    assert record['owner'] == 'owner@example.com'
+    assert (record['anyone'], record['discoverable']) == ('reader', True)
+    assert (record['external'], record['domains']) == (['someone@partner.org'], ['partner.org'])
+    assert record['permissions'] == 4
+
+
+def test_given_domains_are_internal():
+    record = auditRecord({'id': 'a', 'owners': [{'emailAddress': 'owner@example.com'}]}, 'a', [COLLEAGUE, PARTNER],
+                         domains=['example.com', 'partner.org'])
+    assert record['owner'] == 'owner@example.com'
+    assert record['external'] == [] and record['domains'] == []
+
+
+def test_audit_tree_lists_permissions_in_batches(tree, pool):
+    stats = AuditStats()
+    records = {record['path']: record for record in auditTree(pool, tree['top'], 'Projects', stats)}
+    assert sorted(records) == ['Projects/private.txt', 'Projects/sub', 'Projects/sub/internal.txt', 'Projects/sub/public.txt']
+    assert records['Projects/sub/internal.txt']['permissions'] == 2
+    assert records['Projects/sub/internal.txt']['external'] == []
+    assert records['Projects/sub/public.txt']['domains'] == ['other.com', 'partner.org']
+    assert (stats.files, stats.shared, stats.anyone, stats.external, stats.failed) == (4, 2, 1, 1, 0)
+    assert stats.domains == {'other.com': 1, 'partner.org': 1}
+
+
+def test_cli_reports_shared_files(tree, runCli, capsys):
+    def audit(*argv):
+        capsys.readouterr()
+        assert runCli('permissions_audit', tree['top'], *argv) == 0
+        return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+    assert sorted(record['id'] for record in audit()) == sorted([tree['internal'], tree['public']])
+    assert [record['id'] for record in audit('--external')] == [tree['public']]
+    assert len(audit('--all')) == 4
+    assert audit('--external', '--fields', 'path, anyone') == [{'path': 'Projects/sub/public.txt', 'anyone': 'reader'}]
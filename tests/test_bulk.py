@@ -0,0 +1,154 @@
+import os
+
+import pytest
+
+from api import DOWNLOAD_FIELDS
+from bulk import FOLDER_MIME_TYPE, claimPath, copyFolderTree, createFolderTree, downloadAll, downloadFiles, exportFiles, exportFormats, fetchFile, walkFolder
+from errors import CopyIntoItselfError
+from workers import TransferStats
+
+
+def localFiles(directory) -> dict:
+    """The content of every file below a directory, by relative path."""
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for filename in filenames:
+            with open(os.path.join(dirpath, filename), 'rb') as f:
+                files[os.path.relpath(os.path.join(dirpath, filename), directory)] = f.read()
+    return files
+
+
+def test_claim_path_adds_id_to_later_files():
+    claimed = {}
+    assert claimPath(claimed, 'dir/report.pdf', 'a') == 'dir/report.pdf'
+    assert claimPath(claimed, 'dir/report.pdf', 'b') == 'dir/report (b).pdf'
+    assert claimPath(claimed, 'dir/report.pdf', 'a') == 'dir/report.pdf'
+    assert claimPath(claimed, 'dir/v1.2', 'c', extension=False) == 'dir/v1.2'
+    assert claimPath(claimed, 'dir/v1.2', 'd', extension=False) == 'dir/v1.2 (d)'
+
+
+def test_download_folder_keeps_files_with_the_same_name(server, pool, tmp_path, capsys):
+    top = server.drive.add('top', mime_type=FOLDER_MIME_TYPE)
+    first = server.drive.add('a.bin', parents=[top['id']], content=b'1' * 100000)
+    second = server.drive.add('a.bin', parents=[top['id']], content=b'2' * 100000)
+    folders = [server.drive.add('sub', mime_type=FOLDER_MIME_TYPE, parents=[top['id']]) for _ in range(2)]
+    for i, folder in enumerate(folders):
+        server.drive.add('x.txt', parents=[folder['id']], content=str(i).encode())
+
+    stats = TransferStats()
+    downloadAll(pool, walkFolder(pool, top['id'], str(tmp_path)), stats)
+    assert localFiles(tmp_path) == {
+        'a.bin': b'1' * 100000,
+        f"a ({second['id']}).bin": b'2' * 100000,
+        os.path.join('sub', 'x.txt'): b'0',
+        os.path.join(f"sub ({folders[1]['id']})", 'x.txt'): b'1',
+    }
+    assert stats.failed == 0
+
+
+def test_download_by_id_keeps_files_with_the_same_name(server, pool, tmp_path, capsys):
+    ids = [server.drive.add('a.bin', content=str(i).encode())['id'] for i in range(3)]
+    downloadFiles(pool, ids, str(tmp_path), TransferStats())
+    assert localFiles(tmp_path) == {'a.bin': b'0', f"a ({ids[1]}).bin": b'1', f"a ({ids[2]}).bin": b'2'}
+
+
+def test_export_by_id_keeps_documents_with_the_same_name(server, pool, tmp_path, capsys):
+    ids = [server.drive.add('Notes', mime_type='application/vnd.google-apps.document', content=str(i).encode())['id']
+           for i in range(2)]
+    exportFiles(pool, ids, str(tmp_path), exportFormats(), TransferStats())
+    assert localFiles(tmp_path) == {'Notes.pdf': b'0', f"Notes ({ids[1]}).pdf": b'1'}
+
+
+def test_fetch_file_compares_checksums(server, api, tmp_path):
+    file = server.drive.add('a.bin', content=b'new content')
+    file = api.getFile(file['id'], DOWNLOAD_FIELDS)
+    path = str(tmp_path / 'a.bin')
+    with open(path, 'wb') as f:
+        f.write(b'new content')
+    assert fetchFile(api, file, path) is None
+
+    with open(path, 'wb') as f:
+        f.write(b'old content')  # The same size
+    assert fetchFile(api, file, path) == len(b'new content')
+    with open(path, 'rb') as f:
+        assert f.read() == b'new content'
+
+
+def test_folder_tree_with_quotes_is_found_again(server, pool, tmp_path, capsys):
+    os.makedirs(tmp_path / "Bob's" / "back\\slash")
+    (tmp_path / "Bob's" / 'file.txt').write_text('x')
+    for run in range(2):
+        uploads = list(createFolderTree(pool, str(tmp_path), 'root', skip_unchanged=True))
+        assert [os.path.basename(path) for path, parent_id, existing in uploads] == ['file.txt']
+    folders = [file for file in server.drive.files.values() if file['mimeType'] == FOLDER_MIME_TYPE and file['id'] != 'root']
+    assert sorted(folder['name'] for folder in folders) == sorted([tmp_path.name, "Bob's", "back\\slash"])
+
+
+def test_new_folder_tree_is_created_level_by_level(server, pool, tmp_path, capsys):
+    for i in range(3):
+        os.makedirs(tmp_path / f"a{i}" / 'b' / 'c')
+    uploads = list(createFolderTree(pool, str(tmp_path), 'root'))
+    assert uploads == []
+    folders = {file['id']: file for file in server.drive.files.values() if file['mimeType'] == FOLDER_MIME_TYPE}
+
+    def path(folder):
+        parent = folder['parents'][0]
+        return folder['name'] if parent == 'root' else f"{path(folders[parent])}/{folder['name']}"
+    assert sorted(path(folder) for folder in folders.values() if folder['id'] != 'root') == sorted(
+        [tmp_path.name] + [f"{tmp_path.name}/a{i}{suffix}" for i in range(3) for suffix in ('', '/b', '/b/c')])
+
+
+def test_new_folder_tree_is_dropped_from_the_cache(server, newApi, tmp_path, capsys):
+    from cache import MetadataCache
+    from workers import WorkerPool
+    cache = MetadataCache(str(tmp_path / 'metadata.sqlite'))
+    (tmp_path / 'tree' / 'sub').mkdir(parents=True)
+    api = newApi(cache)
+    assert api.listFiles(folder_id='root') == []
+    with WorkerPool(lambda: newApi(cache), 4) as pool:
+        list(createFolderTree(pool, str(tmp_path / 'tree'), 'root'))
+    top, = api.listFiles(folder_id='root')
+    assert top['name'] == 'tree'
+    assert [file['name'] for file in api.listFiles(folder_id=top['id'])] == ['sub']
+
+
+def test_copy_folder_tree(server, pool, capsys):
+    top = server.drive.add('template', mime_type=FOLDER_MIME_TYPE)
+    sub = server.drive.add('sub', mime_type=FOLDER_MIME_TYPE, parents=[top['id']])
+    server.drive.add('a.txt', parents=[top['id']], content=b'a')
+    server.drive.add('b.txt', parents=[sub['id']], content=b'b')
+    stats = TransferStats()
+    copy_id = copyFolderTree(pool, top['id'], 'root', 'copy', stats)
+
+    def tree(folder_id):
+        return {file['name']: tree(file['id']) if file['mimeType'] == FOLDER_MIME_TYPE else server.drive.contents.get(file['id'])
+                for file in server.drive.files.values() if folder_id in file.get('parents', [])}
+    assert tree(copy_id) == tree(top['id']) == {'a.txt': b'a', 'sub': {'b.txt': b'b'}}
+    assert stats.failed == 0
+
+
+def test_copy_folder_into_itself_is_refused(server, pool, runCli, capsys):
+    top = server.drive.add('top', mime_type=FOLDER_MIME_TYPE)
+    sub = server.drive.add('sub', mime_type=FOLDER_MIME_TYPE, parents=[top['id']])
+    count = len(server.drive.files)
+    for parent in (top, sub):
+        with pytest.raises(CopyIntoItselfError):
+            copyFolderTree(pool, top['id'], parent['id'], 'copy', TransferStats())
+    assert runCli('copy_folder', top['id'], '--parentId', sub['id']) == 0
+    assert "can't be copied into itself" in capsys.readouterr().out
+    assert len(server.drive.files) == count
+
+
+def test_copy_folder_is_dropped_from_the_cache(server, newApi, tmp_path, capsys):
+    from cache import MetadataCache
+    from workers import WorkerPool
+    cache = MetadataCache(str(tmp_path / 'metadata.sqlite'))
+    top = server.drive.add('top', mime_type=FOLDER_MIME_TYPE)
+    server.drive.add('a.txt', parents=[top['id']])
+    destination = server.drive.add('destination', mime_type=FOLDER_MIME_TYPE)
+    api = newApi(cache)
+    assert api.listFiles(folder_id=destination['id']) == []
+    with WorkerPool(lambda: newApi(cache), 4) as pool:
+        copy_id = copyFolderTree(pool, top['id'], destination['id'], 'copy', TransferStats())
+    assert [file['id'] for file in api.listFiles(folder_id=destination['id'])] == [copy_id]
+    assert [file['name'] for file in api.listFiles(folder_id=copy_id)] == ['a.txt']
@@ -0,0 +1,82 @@
+import json
+import os
+
+import cli
+from bulk import FOLDER_MIME_TYPE
+
+
+def traced(runCli, path, *argv) -> list:
+    """Run a command line with --trace and return the records written."""
+    assert runCli('--trace', str(path), *argv) == 0
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_trace_takes_a_file_before_the_subcommand():
+    args = cli.cli.parse_args(['--trace', '-', 'list'])
+    assert args.trace == '-' and args.subcommand == 'list'
+    args = cli.cli.parse_args(['--trace', 'trace.jsonl', 'list', '--format', 'ndjson'])
+    assert args.trace == 'trace.jsonl' and args.subcommand == 'list'
+
+
+def test_trace_records_media_chunks(server, runCli, tmp_path, capsys):
+    file = server.drive.add('big.bin', content=os.urandom(2 * 1024 * 1024 + 10))
+    records = traced(runCli, tmp_path / 'trace.jsonl', 'download', file['id'], '--output', str(tmp_path / 'big.bin'), '--chunkSize', '1')
+    chunks = [record for record in records if record['method'] == 'files.get (media)']
+    assert [(record['status'], record['bytes']) for record in chunks] == [(206, 1024 * 1024), (206, 1024 * 1024), (206, 10)]
+    assert all(record['status'] == 200 and record['bytes'] for record in records if record['method'] == 'files.get')
+
+
+def test_trace_records_streamed_exports(server, runCli, tmp_path, capsys):
+    document = server.drive.add('notes', mime_type='application/vnd.google-apps.document', content=b'exported')
+    records = traced(runCli, tmp_path / 'trace.jsonl', 'export', document['id'], '--output', str(tmp_path / 'notes.pdf'))
+    assert [(record['status'], record['bytes']) for record in records if record['method'] == 'files.export (media)'] == [(200, 8)]
+
+
+def test_trace_records_upload_chunks(server, runCli, tmp_path, capsys):
+    path = tmp_path / 'upload.bin'
+    path.write_bytes(os.urandom(2 * 1024 * 1024 + 10))
+    records = traced(runCli, tmp_path / 'trace.jsonl', 'upload', 'upload.bin', str(path), '--chunkSize', '1')
+    assert [record['status'] for record in records if record['method'] == 'files.create (upload)'] == [308, 308, 200]
+
+
+def test_trace_records_batches(server, runCli, tmp_path, capsys):
+    ids = [server.drive.add(f"file{i}")['id'] for i in range(3)]
+    records = traced(runCli, tmp_path / 'trace.jsonl', 'trash', *ids)
+    batches = [record for record in records if record['method'] == 'batch']
+    assert len(batches) == 1
+    assert batches[0]['status'] == 200 and batches[0]['bytes'] > 0
+
+
+def test_index_refresh_is_kept_apart_from_global_refresh():
+    args = cli.cli.parse_args(['index', '--refresh'])
+    assert args.refresh_index and not args.refresh
+    args = cli.cli.parse_args(['--refresh', 'index'])
+    assert args.refresh and not args.refresh_index
+
+
+def test_index_refresh_applies_changes(server, runCli, capsys):
+    folder = server.drive.add('Reports', mime_type=FOLDER_MIME_TYPE)
+    server.drive.add('Q3_finalreport.pdf', parents=[folder['id']])
+    assert runCli('index') == 0
+    server.drive.add('Q4_finalreport.pdf', parents=[folder['id']])
+    capsys.readouterr()
+    assert runCli('index', '--refresh') == 0
+    assert 'Applied' in capsys.readouterr().out
+    assert runCli('search', '--local', '--format', 'ndjson', '--fields', 'name', 'finalreport') == 0
+    names = sorted(json.loads(line)['name'] for line in capsys.readouterr().out.splitlines() if line.startswith('{'))
+    assert names == ['Q3_finalreport.pdf', 'Q4_finalreport.pdf']
+
+
+def test_single_export_is_skipped_when_unchanged(server, runCli, tmp_path, capsys):
+    document = server.drive.add('notes', mime_type='application/vnd.google-apps.document', content=b'exported')
+    path = tmp_path / 'notes.docx'
+    assert runCli('export', document['id'], '--exportFormat', 'docx', '--output', str(path)) == 0
+    assert path.read_bytes() == b'exported'
+    requests = server.requests
+    assert runCli('export', document['id'], '--exportFormat', 'docx', '--output', str(path)) == 0
+    assert 'already up to date' in capsys.readouterr().out
+    assert server.requests == requests + 1  # Only the metadata
+    # Without an extension, the format's is added
+    assert runCli('export', document['id'], '--output', str(tmp_path / 'notes')) == 0
+    assert (tmp_path / 'notes.pdf').read_bytes() == b'exported'
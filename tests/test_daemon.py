@@ -0,0 +1,103 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from daemon import Daemon, forward
+
+# Clients run in their own process, as the daemon takes over this process's stdout and stderr while a command runs
+CLIENT = "import json, sys; from daemon import forward; sys.exit(forward(sys.argv[1], json.loads(sys.argv[2]), sys.stdin.read))"
+
+
+def unread():
+    raise AssertionError("stdin was read without a daemon to send it to")
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    return str(tmp_path / 'daemon.sock')
+
+
+@pytest.fixture
+def serve(socket_path):
+    """Start a daemon running commands with a function, stopping it after the test."""
+    daemons = []
+
+    def start(run):
+        daemon = Daemon(run, socket_path)
+        thread = threading.Thread(target=daemon.serve, daemon=True)
+        thread.start()
+        for _ in range(100):
+            if forward(socket_path, None) != None:
+                break
+            time.sleep(0.01)
+        daemons.append(thread)
+        return daemon
+    yield start
+    for thread in daemons:
+        forward(socket_path, None, stop=True)
+        thread.join(5)
+
+
+def client(socket_path, argv, stdin=''):
+    """Forward a command line to the daemon from another process, like the cli does."""
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(sys.path)}
+    return subprocess.run([sys.executable, '-c', CLIENT, socket_path, json.dumps(argv)], input=stdin,
+                          capture_output=True, text=True, env=env, timeout=30)
+
+
+def test_stdin_is_left_unread_without_a_daemon(socket_path):
+    assert forward(socket_path, ['trash'], unread) is None
+
+
+def test_stdin_is_left_unread_when_the_socket_is_stale(socket_path):
+    open(socket_path, 'w').close()  # Left behind by a daemon which didn't exit cleanly
+    assert forward(socket_path, ['trash'], unread) is None
+
+
+def test_command_gets_output_exit_status_and_stdin(serve, socket_path):
+    def run(argv):
+        print(' '.join(argv))
+        print(sys.stdin.read().upper(), file=sys.stderr)
+        return 3
+    serve(run)
+    result = client(socket_path, ['trash', '-'], 'id1\nid2\n')
+    assert result.returncode == 3
+    assert result.stdout == 'trash -\n'
+    assert result.stderr == 'ID1\nID2\n\n'
+
+
+def test_exceptions_in_commands_are_reported(serve, socket_path):
+    def run(argv):
+        raise ValueError('broken')
+    serve(run)
+    result = client(socket_path, ['list'])
+    assert result.returncode == 1
+    assert 'ValueError: broken' in result.stderr
+    assert forward(socket_path, None) == 0  # Still serving
+
+
+def test_stop(serve, socket_path):
+    serve(lambda argv: 0)
+    assert forward(socket_path, None, stop=True) == 0
+    for _ in range(100):
+        if forward(socket_path, None) is None:
+            break
+        time.sleep(0.01)
+    assert forward(socket_path, None) is None
+
+
+def test_daemon_runs_cli_commands(server, runCli, serve, socket_path):
+    import cli
+    files = [server.drive.add(f"file{i}") for i in range(3)]
+    defaults = cli.cli.parse_args(['daemon'])
+    serve(lambda argv: cli.runLine(argv, defaults))
+    result = client(socket_path, ['trash'], '\n'.join(file['id'] for file in files[:2]))
+    assert result.returncode == 0
+    assert '2 succeeded, 0 failed.' in result.stdout
+    assert [file['trashed'] for file in files] == [True, True, False]
+    assert client(socket_path, ['daemon']).returncode == 1
@@ -0,0 +1,9 @@
+from google.auth.credentials import AnonymousCredentials
+
+from discovery import buildService
+
+
+def test_service_is_built_from_the_bundled_document():
+    service = buildService(AnonymousCredentials())
+    request = service.files().list(pageSize=10)
+    assert request.uri.startswith('https://www.googleapis.com/drive/v3/files?')
@@ -0,0 +1,50 @@
+import time
+
+import executor
+from api import API
+from executor import RequestExecutor, TokenBucket
+from fake_drive import FakeDriveServer, fakeService
+
+
+def test_failed_requests_are_retried(monkeypatch):
+    monkeypatch.setattr(executor, 'retryDelay', lambda attempt, error=None: 0)
+    with FakeDriveServer(error_rate=0.3) as server:
+        ids = [server.drive.add(f"file{i}")['id'] for i in range(50)]
+        api = API(fakeService(server.url), executor=RequestExecutor(max_retries=20))
+        assert [api.getFile(file_id, fields="id")['id'] for file_id in ids] == ids
+        assert [error for file_id, response, error in api.getFiles(ids, fields="id")] == [None] * 50
+    assert api.executor.stats.retried > 0
+    assert api.executor.stats.failed == 0
+
+
+def test_trace_records_are_reset_between_requests(server, api):
+    records = []
+    api.executor.addHook(records.append)
+    file = server.drive.add('file', content=b'content')
+    api.getFile(file['id'], fields="id")
+    api.executor.call(lambda: None, method='other')
+    assert records[0]['status'] == 200 and records[0]['bytes'] > 0
+    assert (records[1]['status'], records[1]['bytes']) == (None, None)
+
+
+def test_token_bucket_allows_a_burst_then_spaces_requests(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(executor.time, 'monotonic', lambda: now[0])
+    bucket = TokenBucket(rate=10, burst=3)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    # Each request past the burst waits for the tokens reserved before it
+    assert [round(bucket.reserve(), 3) for _ in range(2)] == [0.1, 0.2]
+    now[0] += 1.0  # Refilled, but no more than the burst
+    assert round(bucket.reserve(), 3) == 0.0
+    assert bucket.tokens <= 2
+
+
+def test_rate_limit_is_shared_by_threads(server, pool):
+    ids = [server.drive.add(f"file{i}")['id'] for i in range(30)]
+    stats = pool.api().executor.stats
+    pool.api().executor.bucket = TokenBucket(rate=50, burst=1)
+    start = time.monotonic()
+    assert sorted(file['id'] for file_id, file, error in pool.run(lambda api, file_id: api.getFile(file_id, fields="id"), ids)) == sorted(ids)
+    # 4 threads, but one token every 20ms between them
+    assert time.monotonic() - start >= 29 / 50 * 0.9
+    assert stats.throttled > 0
@@ -0,0 +1,23 @@
+from bulk import FOLDER_MIME_TYPE
+from fake_drive import parseFields, selectFields
+
+
+def test_parse_fields():
+    assert parseFields("nextPageToken, files(id, owners(emailAddress)), kind") == {
+        'nextPageToken': None, 'files': {'id': None, 'owners': {'emailAddress': None}}, 'kind': None}
+
+
+def test_select_fields_of_nested_lists():
+    data = {'files': [{'id': 'a', 'name': 'x', 'owners': [{'emailAddress': 'bob@example.com', 'me': True}]}], 'kind': 'drive#fileList'}
+    assert selectFields(data, parseFields("files(id, owners(emailAddress))")) == {
+        'files': [{'id': 'a', 'owners': [{'emailAddress': 'bob@example.com'}]}]}
+    assert selectFields(data, parseFields("*")) == data
+
+
+def test_responses_only_have_the_fields_asked_for(server, api):
+    folder = server.drive.add('folder', mime_type=FOLDER_MIME_TYPE)
+    file = server.drive.add('file', parents=[folder['id']], content=b'content')
+    assert api.getFile(file['id'], fields="id, size") == {'id': file['id'], 'size': '7'}
+    pages = [*api.iterPages(f"'{folder['id']}' in parents", "id")]
+    assert pages == [[{'id': file['id']}]]
+    assert api.execute(api.files.list(q=f"'{folder['id']}' in parents", fields="files(name)")) == {'files': [{'name': 'file'}]}
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from bulk import FOLDER_MIME_TYPE
+from index import SearchIndex, findPaths
+
+
+@pytest.fixture
+def tree(server):
+    drive = server.drive
+    reports = drive.add('Reports', mime_type=FOLDER_MIME_TYPE)
+    year = drive.add('2026', mime_type=FOLDER_MIME_TYPE, parents=[reports['id']])
+    final = drive.add('Q3_finalreport.pdf', parents=[year['id']])
+    draft = drive.add('Q3_draft_report.docx', parents=[reports['id']])
+    old = drive.add('old_finalreport.pdf', parents=[reports['id']])
+    drive.files[old['id']]['trashed'] = True
+    drive.add('a.txt')
+    return {'reports': reports['id'], 'year': year['id'], 'final': final['id'], 'draft': draft['id'], 'old': old['id']}
+
+
+@pytest.fixture
+def index(tree, api, tmp_path):
+    index = SearchIndex(str(tmp_path / 'index.sqlite'))
+    index.build(api)
+    yield index
+    index.close()
+
+
+def names(files) -> list:
+    return [file['name'] for file in files]
+
+
+def test_find_paths():
+    files = {'a': ('Reports', 'root'), 'b': ('2026', 'a'), 'c': ('x.pdf', 'b'), 'd': ('shared.pdf', 'unknown')}
+    assert findPaths(files, 'root') == {'a': '/Reports', 'b': '/Reports/2026', 'c': '/Reports/2026/x.pdf', 'd': 'shared.pdf'}
+
+
+def test_substrings_are_found_in_any_case(index):
+    assert names(index.search('FINALREPORT')) == ['Q3_finalreport.pdf']
+    assert names(index.search('finalreport', trash=True)) == ['old_finalreport.pdf']
+    assert sorted(names(index.search('Q3'))) == ['Q3_draft_report.docx', 'Q3_finalreport.pdf']  # Shorter than a trigram
+
+
+def test_search_in_folder_and_limit(tree, index):
+    assert names(index.search('report', folder_id=tree['reports'])) == ['Q3_draft_report.docx']
+    assert len(index.search('report', limit=1)) == 1
+
+
+def test_fuzzy_search_finds_typos(index):
+    assert names(index.search('Q3_finalrepotr.pdf', fuzzy=True))[0] == 'Q3_finalreport.pdf'
+
+
+def test_path_search(tree, index):
+    found = index.search('Reports/2026', paths=True)
+    assert [(file['id'], file['path']) for file in found] == [
+        (tree['year'], '/Reports/2026'), (tree['final'], '/Reports/2026/Q3_finalreport.pdf')]
+
+
+def test_cli_search_local_fuzzy_and_path(server, tree, runCli, capsys):
+    def search(*argv):
+        capsys.readouterr()
+        assert runCli('search', '--format', 'ndjson', '--fields', 'id, path', *argv) == 0
+        return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+    assert runCli('index') == 0
+    assert search('--local', 'finalreport') == [{'id': tree['final'], 'path': '/Reports/2026/Q3_finalreport.pdf'}]
+    assert search('--fuzzy', 'Q3_finalrepotr.pdf')[0]['id'] == tree['final']
+    assert [file['id'] for file in search('--path', '2026/Q3')] == [tree['final']]
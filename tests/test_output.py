@@ -0,0 +1,63 @@
+import csv
+import io
+import json
+
+from bulk import FOLDER_MIME_TYPE
+from output import CsvWriter, NdjsonWriter, TextWriter, fieldNames, openWriter
+
+FILES = [{'id': 'a', 'name': 'report, final.pdf', 'parents': ['p1', 'p2'], 'owners': [{'emailAddress': 'bob@example.com'}]},
+         {'id': 'b', 'name': 'notes\ttabbed.txt'}]
+
+
+def written(format, fields, pages) -> str:
+    stream = io.StringIO()
+    writer = openWriter(format, fields, stream)
+    for page in pages:
+        writer.writePage(page)
+    writer.close()
+    return stream.getvalue()
+
+
+def test_field_names_are_the_top_level_fields():
+    assert fieldNames("id, owners(emailAddress, displayName), size") == ['id', 'owners', 'size']
+    assert fieldNames("id,") == ['id']
+
+
+def test_open_writer_picks_the_format():
+    assert isinstance(openWriter('text', stream=io.StringIO()), TextWriter)
+    assert isinstance(openWriter('ndjson', stream=io.StringIO()), NdjsonWriter)
+    assert isinstance(openWriter('tsv', stream=io.StringIO()), CsvWriter)
+
+
+def test_ndjson_writes_the_requested_fields_each_file_has():
+    lines = written('ndjson', "id, name, size", [FILES[:1], FILES[1:]]).splitlines()
+    assert [json.loads(line) for line in lines] == [{'id': 'a', 'name': 'report, final.pdf'}, {'id': 'b', 'name': 'notes\ttabbed.txt'}]
+
+
+def test_csv_has_a_header_and_flattens_nested_values():
+    rows = [*csv.reader(io.StringIO(written('csv', "id, name, parents, owners(emailAddress)", [FILES])))]
+    assert rows == [['id', 'name', 'parents', 'owners'],
+                    ['a', 'report, final.pdf', 'p1,p2', '[{"emailAddress": "bob@example.com"}]'],
+                    ['b', 'notes\ttabbed.txt', '', '']]
+
+
+def test_tsv_quotes_tabs():
+    rows = [*csv.reader(io.StringIO(written('tsv', "id, name", [FILES])), delimiter='\t')]
+    assert rows == [['id', 'name'], ['a', 'report, final.pdf'], ['b', 'notes\ttabbed.txt']]
+
+
+def test_text_says_when_nothing_was_found():
+    assert written('text', None, []) == 'No files found.\n'
+    assert written('text', "id, name", [FILES[1:]]) == "ID: b\nName: notes\ttabbed.txt\n-------------------------------\n"
+
+
+def test_list_and_count_write_machine_readable_formats(server, runCli, capsys):
+    folder = server.drive.add('folder', mime_type=FOLDER_MIME_TYPE)
+    files = [server.drive.add(f"file{i}.txt", parents=[folder['id']]) for i in range(3)]
+    assert runCli('list', '--folderId', folder['id'], '--fields', 'id, name', '--format', 'csv') == 0
+    rows = [*csv.reader(io.StringIO(capsys.readouterr().out))]
+    assert rows[0] == ['id', 'name']
+    assert sorted(rows[1:]) == sorted([file['id'], file['name']] for file in files)
+
+    assert runCli('count', '--folderId', folder['id'], '--format', 'ndjson') == 0
+    assert json.loads(capsys.readouterr().out) == {'files': 3}
@@ -0,0 +1,65 @@
+import pytest
+
+from bulk import FOLDER_MIME_TYPE
+from errors import PathNotFoundError
+from paths import PathResolver, isPath, splitPath
+
+
+@pytest.fixture
+def tree(server):
+    drive = server.drive
+    projects = drive.add('Projects', mime_type=FOLDER_MIME_TYPE)
+    year = drive.add('2026', mime_type=FOLDER_MIME_TYPE, parents=[projects['id']])
+    drive.add('2026', parents=[projects['id']])  # A file with the same name as the folder
+    assets = drive.add('assets', mime_type=FOLDER_MIME_TYPE, parents=[year['id']])
+    logo = drive.add("logo's.png", parents=[assets['id']])
+    return {'projects': projects['id'], 'year': year['id'], 'assets': assets['id'], 'logo': logo['id']}
+
+
+def test_is_path():
+    assert isPath('/Projects') and isPath('/')
+    assert not isPath('1AbCdEf') and not isPath('-')
+
+
+def test_split_path_ignores_empty_parts():
+    assert splitPath('/Projects//2026/') == splitPath('/Projects/2026')
+
+
+def test_resolve_path(tree, api):
+    resolver = PathResolver(api)
+    assert resolver.resolve("/Projects/2026/assets/logo's.png") == tree['logo']
+    assert resolver.resolve('/') == 'root'
+
+
+def test_folder_is_preferred_for_parts_with_children(tree, api):
+    assert PathResolver(api).resolve('/Projects/2026/assets') == tree['assets']
+    assert PathResolver(api).resolve('/Projects/2026') == tree['year']
+
+
+def test_missing_path_raises(tree, api):
+    with pytest.raises(PathNotFoundError):
+        PathResolver(api).resolve('/Projects/2026/nope.png')
+
+
+def test_resolve_all_looks_up_shared_folders_once(server, tree, api):
+    names = [f"img{i}.png" for i in range(200)]
+    ids = {f"/Projects/2026/assets/{name}": server.drive.add(name, parents=[tree['assets']])['id'] for name in names}
+    requests = api.executor.stats.requests
+    found = PathResolver(api).resolveAll([*ids, '/Projects/missing/x'])
+    assert found == ids
+    # One level of the path at a time, with the names in each folder batched into few queries
+    assert api.executor.stats.requests - requests < 15
+
+
+def test_resolved_paths_are_remembered(tree, api):
+    resolver = PathResolver(api)
+    resolver.resolve("/Projects/2026/assets/logo's.png")
+    requests = api.executor.stats.requests
+    assert resolver.resolve("/Projects/2026/assets/logo's.png") == tree['logo']
+    assert api.executor.stats.requests == requests
+
+
+def test_cli_accepts_paths_for_ids(tree, server, runCli):
+    assert runCli('trash', "/Projects/2026/assets/logo's.png") == 0
+    assert server.drive.files[tree['logo']]['trashed'] is True
+    assert runCli('trash', '/Projects/nope') == 1
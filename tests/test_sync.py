@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from bulk import FOLDER_MIME_TYPE
+from sync import Sync
+from workers import TransferStats
+
+
+@pytest.fixture
+def folder(server):
+    return server.drive.add('synced', mime_type=FOLDER_MIME_TYPE)['id']
+
+
+@pytest.fixture
+def sync(newApi, pool, folder, tmp_path, capsys):
+    """Run a sync of tmp_path with the folder."""
+    return lambda: Sync(newApi(), pool, str(tmp_path), folder, TransferStats()).run()
+
+
+def children(server, folder) -> dict:
+    return {file['name']: server.drive.contents.get(file['id']) for file in server.drive.files.values()
+            if folder in file.get('parents', []) and not file.get('trashed')}
+
+
+def test_first_sync_transfers_both_ways(server, folder, sync, tmp_path):
+    server.drive.add('remote.txt', parents=[folder], content=b'remote')
+    (tmp_path / 'local.txt').write_bytes(b'local')
+    sync()
+    assert (tmp_path / 'remote.txt').read_bytes() == b'remote'
+    assert children(server, folder) == {'remote.txt': b'remote', 'local.txt': b'local'}
+
+
+def test_later_syncs_apply_changes(server, folder, sync, tmp_path):
+    remote = server.drive.add('remote.txt', parents=[folder], content=b'remote')
+    sync()
+    server.drive.setContent(server.drive.files[remote['id']], b'changed remotely')
+    server.drive.changed(remote['id'])
+    server.drive.files[remote['id']]['modifiedTime'] = '2100-01-01T00:00:00.000Z'  # The fake only keeps whole seconds
+    (tmp_path / 'local.txt').write_bytes(b'local')
+    sync()
+    assert (tmp_path / 'remote.txt').read_bytes() == b'changed remotely'
+    assert children(server, folder)['local.txt'] == b'local'
+
+    os.remove(tmp_path / 'local.txt')
+    sync()
+    assert 'local.txt' not in children(server, folder)
+
+
+def test_files_with_the_same_name_are_kept_apart(server, folder, sync, tmp_path):
+    server.drive.add('a.txt', parents=[folder], content=b'1')
+    second = server.drive.add('a.txt', parents=[folder], content=b'2')
+    sync()
+    assert (tmp_path / 'a.txt').read_bytes() == b'1'
+    assert (tmp_path / f"a ({second['id']}).txt").read_bytes() == b'2'
+
+    third = server.drive.add('a.txt', parents=[folder], content=b'3')
+    sync()
+    assert (tmp_path / 'a.txt').read_bytes() == b'1'
+    assert (tmp_path / f"a ({third['id']}).txt").read_bytes() == b'3'
+    # Nothing downloaded was mistaken for a new local file
+    assert len([file for file in server.drive.files.values() if file['name'] == 'a.txt']) == 3
+
+
+def test_failed_downloads_are_retried_next_sync(server, folder, sync, tmp_path, monkeypatch):
+    sync()
+    server.drive.add('new.txt', parents=[folder], content=b'new')
+    from api import API
+    download = API.downloadFile
+
+    def fail(*args, **kwargs):
+        raise OSError("Connection reset")
+    monkeypatch.setattr(API, 'downloadFile', fail)
+    sync()
+    assert not (tmp_path / 'new.txt').exists()
+
+    monkeypatch.setattr(API, 'downloadFile', download)
+    sync()
+    assert (tmp_path / 'new.txt').read_bytes() == b'new'
@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+from transfer import UPLOAD_CHUNK_MULTIPLE, partialVersion, savePartialVersion, uploadSessions
+
+SIZE = 3 * 1024 * 1024
+
+
+class Interrupted(Exception):
+    pass
+
+
+def records(executor, method):
+    """Collect the records of the requests an executor sends for one API method."""
+    found = []
+    executor.addHook(lambda record: found.append(record) if record['method'] == method else None)
+    return found
+
+
+def test_download_resumes_partial_file_of_same_version(server, api, tmp_path):
+    content = os.urandom(SIZE)
+    file = server.drive.add('file.bin', content=content)
+    path = str(tmp_path / 'file.bin')
+    with open(path + '.part', 'wb') as f:
+        f.write(b'x' * 1000)  # Differs from the content, to tell it was kept
+    savePartialVersion(path + '.part', file['md5Checksum'])
+    api.downloadFile(file['id'], path, progress=False)
+    with open(path, 'rb') as f:
+        assert f.read() == b'x' * 1000 + content[1000:]
+    assert not os.path.exists(path + '.part.json')
+
+
+def test_download_discards_partial_file_of_another_version(server, api, tmp_path):
+    old, new = os.urandom(SIZE), os.urandom(SIZE)
+    file = server.drive.add('file.bin', content=old)
+    path = str(tmp_path / 'file.bin')
+    with open(path + '.part', 'wb') as f:
+        f.write(old[:SIZE // 2])
+    savePartialVersion(path + '.part', file['md5Checksum'])
+    server.drive.setContent(file, new)
+    api.downloadFile(file['id'], path, progress=False)
+    with open(path, 'rb') as f:
+        assert f.read() == new
+
+
+def test_download_discards_partial_file_without_version(server, api, tmp_path):
+    content = os.urandom(SIZE)
+    file = server.drive.add('file.bin', content=content)
+    path = str(tmp_path / 'file.bin')
+    with open(path + '.part', 'wb') as f:
+        f.write(b'x' * 1000)
+    api.downloadFile(file['id'], path, progress=False)
+    with open(path, 'rb') as f:
+        assert f.read() == content
+
+
+def test_interrupted_download_saves_version(server, api, tmp_path, monkeypatch):
+    file = server.drive.add('file.bin', content=os.urandom(SIZE))
+    path = str(tmp_path / 'file.bin')
+
+    def interrupt(status):
+        raise Interrupted
+    import transfer
+    monkeypatch.setattr(transfer, 'printProgress', interrupt)
+    with pytest.raises(Interrupted):
+        api.downloadFile(file['id'], path, chunk_size=1024 * 1024, progress=True)
+    assert os.path.getsize(path + '.part') == 1024 * 1024
+    assert partialVersion(path + '.part') == file['md5Checksum']
+
+
+def test_interrupted_upload_resumes_session(server, api, tmp_path, monkeypatch):
+    content = os.urandom(2 * UPLOAD_CHUNK_MULTIPLE + 1)
+    path = tmp_path / 'upload.bin'
+    path.write_bytes(content)
+
+    def interrupt(status, rate):
+        raise Interrupted
+    import transfer
+    monkeypatch.setattr(transfer, 'printUploadProgress', interrupt)
+    with pytest.raises(Interrupted):
+        api.uploadFile('upload.bin', str(path), 'application/octet-stream', chunk_size=UPLOAD_CHUNK_MULTIPLE)
+    assert len(uploadSessions().sessions) == 1
+
+    sent = records(api.executor, 'files.create (upload)')
+    file_id = api.uploadFile('upload.bin', str(path), 'application/octet-stream', chunk_size=UPLOAD_CHUNK_MULTIPLE, progress=False)
+    # The first call asks the session how much it has before sending the second chunk, so the first isn't sent again
+    assert len(sent) == 2
+    assert server.drive.contents[file_id] == content
+    assert len([file for file in server.drive.files.values() if file['name'] == 'upload.bin']) == 1
+    assert uploadSessions().sessions == {}
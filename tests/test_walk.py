@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from bulk import FOLDER_MIME_TYPE
+from walk import WalkStats, buildTree, humanSize, walkTree
+
+
+@pytest.fixture
+def tree(server):
+    drive = server.drive
+    top = drive.add('top', mime_type=FOLDER_MIME_TYPE)
+    a = drive.add('a', mime_type=FOLDER_MIME_TYPE, parents=[top['id']])
+    b = drive.add('b', mime_type=FOLDER_MIME_TYPE, parents=[a['id']])
+    drive.add('one.bin', parents=[top['id']], content=b'1' * 1000)
+    drive.add('two.bin', parents=[a['id']], content=b'2' * 2000)
+    drive.add('three.bin', parents=[b['id']], content=b'3' * 3000)
+    return {'top': top['id'], 'a': a['id'], 'b': b['id']}
+
+
+def test_human_size():
+    assert [humanSize(size) for size in (0, 1023, 1536, 5 * 1024 ** 3)] == ['0 B', '1023 B', '1.5 KB', '5.0 GB']
+
+
+def test_walk_yields_one_level_at_a_time(tree, pool):
+    stats = WalkStats()
+    found = [(parent, depth, file['name']) for parent, depth, file in walkTree(pool, tree['top'], stats=stats)]
+    assert sorted(found) == sorted([(tree['top'], 1, 'a'), (tree['top'], 1, 'one.bin'), (tree['a'], 2, 'b'),
+                                    (tree['a'], 2, 'two.bin'), (tree['b'], 3, 'three.bin')])
+    assert [depth for parent, depth, name in found] == sorted(depth for parent, depth, name in found)
+    assert (stats.folders, stats.subfolders, stats.files, stats.bytes, stats.failed) == (3, 2, 3, 6000, 0)
+
+
+def test_walk_stops_at_maxdepth(tree, pool):
+    assert sorted(file['name'] for parent, depth, file in walkTree(pool, tree['top'], maxdepth=1)) == ['a', 'one.bin']
+
+
+def test_folders_in_several_parents_are_walked_once(server, tree, pool):
+    server.drive.files[tree['b']]['parents'].append(tree['top'])
+    names = [file['name'] for parent, depth, file in walkTree(pool, tree['top'])]
+    assert names.count('three.bin') == 1
+
+
+def test_tree_totals_everything_below_each_folder(tree, pool):
+    folder_tree = buildTree(pool, tree['top'], 'top')
+    assert [folder_tree.files[tree[name]] for name in ('top', 'a', 'b')] == [3, 2, 1]
+    assert [folder_tree.bytes[tree[name]] for name in ('top', 'a', 'b')] == [6000, 5000, 3000]
+    assert folder_tree.path(tree['b']) == 'top/a/b'
+    assert [*folder_tree.lines()] == [
+        'top',
+        '├── a/ (2 files, 4.9 KB)',
+        '│   ├── b/ (1 files, 2.9 KB)',
+        '│   │   └── three.bin (2.9 KB)',
+        '│   └── two.bin (2.0 KB)',
+        '└── one.bin (1000 B)',
+    ]
+
+
+def test_du_and_tree_commands(tree, runCli, capsys):
+    assert runCli('du', tree['top'], '--depth', '1') == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split()[-1] for line in lines[:-1]] == ['top', 'top/a']
+    assert lines[0].split()[:3] == ['5.9', 'KB', '3']
+
+    assert runCli('tree', tree['top'], '--depth', '1') == 0
+    assert capsys.readouterr().out.splitlines()[:3] == ['top', '├── a/ (0 files, 0 B)', '└── one.bin (1000 B)']
+
+
+def test_count_recursive(tree, runCli, capsys):
+    assert runCli('count', '--folderId', tree['top'], '--recursive') == 0
+    assert capsys.readouterr().out.splitlines()[0] == 'Number of files found: 5 (5.9 KB)'
+    assert runCli('count', '--folderId', tree['top'], '--recursive', '--excludeFolders') == 0
+    assert capsys.readouterr().out.splitlines()[0] == 'Number of files found: 3 (5.9 KB)'
+
+
+def test_count_recursive_honours_trash_and_all(server, tree, runCli, capsys):
+    trashed = server.drive.add('trashed', mime_type=FOLDER_MIME_TYPE, parents=[tree['a']])
+    inside = server.drive.add('four.bin', parents=[trashed['id']], content=b'4' * 4000)
+    loose = server.drive.add('five.bin', parents=[tree['b']], content=b'5' * 5000)
+    for file in (trashed, inside, loose):
+        file['trashed'] = True  # Drive marks everything in a trashed folder as trashed too
+
+    def count(*argv):
+        capsys.readouterr()
+        assert runCli('count', '--folderId', tree['top'], '--recursive', '--format', 'ndjson', *argv) == 0
+        record = json.loads(capsys.readouterr().out)
+        return record['files'], record['bytes']
+    assert count() == (5, 6000)
+    assert count('--trash') == (3, 9000)
+    assert count('--trash', '--excludeFolders') == (2, 9000)
+    assert count('--all') == (8, 15000)